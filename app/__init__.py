@@ -8,9 +8,16 @@ from werkzeug.exceptions import RequestEntityTooLarge
 from pathlib import Path
 import os
 
+from app.utils.uploads import UploadRequest
+
+# Raiz do projeto (fonts/, logo e capa)
+APP_ROOT = Path(__file__).resolve().parent.parent
+
 def create_app():
     """Factory function para criar a aplicação Flask"""
     app = Flask(__name__)
+    # Uploads gravados em uma passada, com hash e limite por tipo (ver app/utils/uploads.py)
+    app.request_class = UploadRequest
 
     # Configurações (agora via variáveis de ambiente com defaults)
     app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))
@@ -31,10 +38,14 @@ def create_app():
     from app.routes.main import main_bp
     from app.routes.conversion import conversion_bp
     from app.routes.progress import progress_bp
+    from app.routes.metrics import metrics_bp
+    from app.routes.jobs import jobs_bp
 
     app.register_blueprint(main_bp, url_prefix='/relatorio')
     app.register_blueprint(conversion_bp, url_prefix='/relatorio')
     app.register_blueprint(progress_bp, url_prefix='/relatorio')
+    app.register_blueprint(metrics_bp, url_prefix='/relatorio')
+    app.register_blueprint(jobs_bp, url_prefix='/relatorio')
 
     # Importar módulo de reunião condicionalmente
     try:
@@ -45,6 +56,12 @@ def create_app():
         print(f"⚠️  Módulo de reunião não carregado: {e}")
         print("   A aplicação continuará funcionando sem recursos de IA")
 
+    # Componentes pesados (WeasyPrint, modelo Whisper) carregados em segundo plano
+    from app.utils import warmup
+    from app.utils.md_to_pdf import get_renderer
+    warmup.register('renderer', lambda: get_renderer(APP_ROOT).stylesheets(), required=True)
+    warmup.start()
+
     # Error handlers
     @app.errorhandler(413)
     def handle_file_too_large(e):
@@ -72,7 +89,9 @@ def create_app():
 
     @app.errorhandler(RequestEntityTooLarge)
     def handle_request_too_large(e):
-        max_mb = int(app.config.get('MAX_CONTENT_LENGTH', 0) / (1024 * 1024))
+        # UploadTooLarge traz o limite do tipo de arquivo; senão vale o da requisição
+        limit = getattr(e, 'limit', None) or app.config.get('MAX_CONTENT_LENGTH', 0)
+        max_mb = int(limit / (1024 * 1024))
         return {
             "error": f"Arquivo muito grande. Tamanho máximo permitido: {max_mb}MB",
             "max_size_mb": max_mb
@@ -83,4 +102,10 @@ def create_app():
     def healthz():
         return jsonify({"status": "ok"}), 200
 
+    # Prontidão: componentes pesados carregados (o healthz indica só que o processo está vivo)
+    @app.get('/relatorio/readyz')
+    def readyz():
+        ready, components = warmup.readiness()
+        return jsonify({"status": "ready" if ready else "starting", "components": components}), 200 if ready else 503
+
     return app
@@ -2,15 +2,23 @@
 Rotas para conversão de Markdown para PDF
 """
 
-from flask import Blueprint, request, send_file, abort, jsonify, current_app
-from pathlib import Path
-import tempfile
+from flask import Blueprint, Response, request, abort, jsonify
+from pathlib import Path, PurePosixPath
+import json
+import os
 import traceback
 import logging
-import uuid
+import zipfile
+from functools import partial
 
-from app.utils.md_to_pdf import md_to_pdf
+from app.utils.md_to_pdf import cached_render_pdf, convert_markdown_batch
+from app.utils.assets import get_asset_index
+from app.utils.metrics import RenderStats
+from app.utils.jobs import JobResult, QueueFullError, get_job_queue
+from app.utils.uploads import UploadTooLarge, spool_of, upload_limit
 from app.routes.progress import update_progress
+from app.routes.metrics import CONVERSIONS_IN_FLIGHT
+from app.routes.jobs import request_job_id, result_response, submit_job
 
 conversion_bp = Blueprint('conversion', __name__)
 logger = logging.getLogger(__name__)
@@ -18,114 +26,207 @@ logger = logging.getLogger(__name__)
 # Get application root
 APP_ROOT = Path(__file__).resolve().parent.parent.parent
 
+# Máximo de documentos por requisição em /convert-zip
+ZIP_MAX_FILES = int(os.environ.get('ZIP_MAX_FILES', 200))
 
-@conversion_bp.route("/convert-md", methods=["POST"])
-def convert_md():
-    session_id = request.form.get('session_id', str(uuid.uuid4()))
+
+def _read_conversion_form(session_id):
+    """
+    Lê o arquivo e as opções enviados para /convert-md.
+
+    Returns:
+        dict: Argumentos de `run_conversion` (filename, md_text, css_text, logo_bytes, cover_data)
+    """
+    uploaded = request.files.get("file")
+    if not uploaded:
+        logger.error("Nenhum arquivo enviado")
+        abort(400, "Nenhum arquivo enviado")
+
+    filename = Path(uploaded.filename or "document.md").name
+    logger.info(f"Arquivo recebido: {filename}")
+    logger.info(f"Tipo de conteúdo: {uploaded.content_type}")
+    update_progress(session_id, 15, "Processando arquivo...")
+
+    if not filename.lower().endswith(".md"):
+        # Permitimos ainda assim, tratando como markdown
+        filename = f"{filename}.md"
+        logger.info(f"Arquivo renomeado para: {filename}")
+
+    update_progress(session_id, 25, "Preparando configurações...")
+    options = _read_conversion_options()
+
+    # Tamanho, hash e prévia foram calculados enquanto o upload era recebido
+    spool = spool_of(uploaded)
+    logger.info(f"Arquivo com {spool.size} bytes (sha256: {spool.sha256})")
+    logger.info(f"Conteúdo do arquivo (primeiros 200 chars): {spool.preview}")
+    # Conversão inteiramente em memória: o markdown é lido uma única vez
+    md_text = spool.read().decode('utf-8')
+
+    return {'filename': filename, 'md_text': md_text, **options}
+
+
+def _read_conversion_options():
+    """
+    Lê as opções comuns às conversões: CSS, dados da capa e logo.
+
+    Returns:
+        dict: css_text, logo_bytes e cover_data
+    """
+    css_text = request.form.get("css") or None
+
+    # Dados da capa vindos do formulário do front-end
+    cover_data = {
+        'topo_direito_email': request.form.get('cover_top_email', ''),
+        'topo_direito_site': request.form.get('cover_top_site', ''),
+        'representante_label': request.form.get('cover_rep_label', ''),
+        'representante_nome': request.form.get('cover_rep_nome', ''),
+        'subtitulo': request.form.get('cover_subtitulo', ''),
+        'descricao': request.form.get('cover_descricao', ''),
+        'preparado_nome': request.form.get('cover_prep_nome', ''),
+        'preparado_email': request.form.get('cover_prep_email', ''),
+        'preparado_phone': request.form.get('cover_prep_phone', ''),
+        'data': request.form.get('cover_data', ''),
+    }
+
+    logger.info(f"Cover data: {cover_data}")
+
+    logo_file = request.files.get("logo")
+    logo_bytes = None
+    if logo_file and logo_file.filename:
+        logo_bytes = spool_of(logo_file).read()
+        logger.info(f"Logo recebida: {Path(logo_file.filename).name} ({len(logo_bytes)} bytes)")
+
+    return {
+        'css_text': css_text,
+        'logo_bytes': logo_bytes,
+        'cover_data': cover_data,
+    }
+
+
+def _markdown_from_zip(spool):
+    """
+    Documentos .md de um arquivo .zip (inclusive em subpastas), ignorando
+    arquivos ocultos e metadados do macOS.
+
+    Returns:
+        list: Pares (caminho do .md dentro do zip, conteúdo em bytes)
+    """
+    limit = upload_limit('text')
+    documents = []
     try:
-        logger.info("=== INICIO DA CONVERSÃO ===")
-        update_progress(session_id, 5, "Iniciando conversão...")
+        with zipfile.ZipFile(spool) as archive:
+            for info in archive.infolist():
+                path = PurePosixPath(info.filename)
+                if info.is_dir() or path.suffix.lower() != '.md':
+                    continue
+                parts = [part for part in path.parts if part not in ('/', '..')]
+                if any(part.startswith('.') or part == '__MACOSX' for part in parts):
+                    continue
+                # O tamanho declarado limita também o que é descompactado
+                if limit is not None and info.file_size > limit:
+                    raise UploadTooLarge(info.filename, limit)
+                documents.append((str(PurePosixPath(*parts)), archive.read(info)))
+    except zipfile.BadZipFile as e:
+        abort(400, f"Arquivo .zip inválido: {e}")
+    return documents
+
+
+def _read_markdown_documents():
+    """
+    Lê os documentos enviados para /convert-zip: um ou mais .zip e/ou .md nos
+    campos `file` e `files`.
 
-        uploaded = request.files.get("file")
-        if not uploaded:
-            logger.error("Nenhum arquivo enviado")
-            abort(400, "Nenhum arquivo enviado")
-
-        filename = Path(uploaded.filename or "document.md").name
-        logger.info(f"Arquivo recebido: {filename}")
-        logger.info(f"Tipo de conteúdo: {uploaded.content_type}")
-        update_progress(session_id, 15, "Processando arquivo...")
-
-        if not filename.lower().endswith(".md"):
-            # Permitimos ainda assim, tratando como markdown
-            filename = f"{filename}.md"
-            logger.info(f"Arquivo renomeado para: {filename}")
-
-        css_text = request.form.get("css") or None
-        update_progress(session_id, 25, "Preparando configurações...")
-
-        # Dados da capa vindos do formulário do front-end
-        cover_data = {
-            'topo_direito_email': request.form.get('cover_top_email', ''),
-            'topo_direito_site': request.form.get('cover_top_site', ''),
-            'representante_label': request.form.get('cover_rep_label', ''),
-            'representante_nome': request.form.get('cover_rep_nome', ''),
-            'subtitulo': request.form.get('cover_subtitulo', ''),
-            'descricao': request.form.get('cover_descricao', ''),
-            'preparado_nome': request.form.get('cover_prep_nome', ''),
-            'preparado_email': request.form.get('cover_prep_email', ''),
-            'preparado_phone': request.form.get('cover_prep_phone', ''),
-            'data': request.form.get('cover_data', ''),
-        }
-
-        logger.info(f"Cover data: {cover_data}")
-
-        logo_file = request.files.get("logo")
-
-        # Usar diretório de upload configurável (persistente em produção)
-        upload_base = current_app.config.get('UPLOAD_FOLDER', '/tmp')
-        with tempfile.TemporaryDirectory(dir=upload_base) as tmpdir:
-            tmpdir_path = Path(tmpdir)
-            logger.info(f"Diretório temporário: {tmpdir_path}")
-
-            md_path = tmpdir_path / filename
-            uploaded.save(md_path)
-            logger.info(f"Arquivo salvo em: {md_path}")
-
-            # Verificar se o arquivo foi salvo corretamente
-            if not md_path.exists():
-                raise Exception(f"Falha ao salvar arquivo em {md_path}")
-
-            with open(md_path, 'r', encoding='utf-8') as f:
-                content_preview = f.read()[:200]
-                logger.info(f"Conteúdo do arquivo (primeiros 200 chars): {content_preview}")
-
-            logo_path = None
-            if logo_file and logo_file.filename:
-                logo_name = Path(logo_file.filename).name
-                logo_path = tmpdir_path / logo_name
-                logo_file.save(logo_path)
-                logger.info(f"Logo salva em: {logo_path}")
-
-            pdf_out = tmpdir_path / (Path(filename).stem + ".pdf")
-            logger.info(f"PDF será salvo em: {pdf_out}")
-
-            # Verificar se arquivos necessários existem no APP_ROOT
-            logo_zoi = APP_ROOT / "assets" / "images" / "logo_zoi.png"
-            capa_mockup = APP_ROOT / "assets" / "images" / "capa mockup.jpg"
-            logger.info(f"Logo ZOI existe: {logo_zoi.exists()}")
-            logger.info(f"Capa mockup existe: {capa_mockup.exists()}")
-
-            # Use o diretório do projeto como base para resolver fonts/ e logo_zoi.png
-            logger.info("Iniciando conversão MD -> PDF")
-            update_progress(session_id, 60, "Convertendo para PDF...")
-            md_to_pdf(
-                str(md_path),
-                str(pdf_out),
+    Returns:
+        list: Pares (nome do .md, conteúdo em bytes), ordenados pelo nome como no lote da CLI
+    """
+    documents = []
+    for uploaded in request.files.getlist('file') + request.files.getlist('files'):
+        if not uploaded or not uploaded.filename:
+            continue
+        name = Path(uploaded.filename).name
+        spool = spool_of(uploaded)
+        if name.lower().endswith('.zip'):
+            documents.extend(_markdown_from_zip(spool))
+        elif name.lower().endswith('.md'):
+            documents.append((name, spool.read()))
+        else:
+            logger.info(f"Arquivo ignorado (não é .md nem .zip): {name}")
+
+    if not documents:
+        abort(400, "Nenhum arquivo .md enviado")
+    if len(documents) > ZIP_MAX_FILES:
+        abort(400, f"Máximo de {ZIP_MAX_FILES} documentos por requisição")
+    return sorted(documents)
+
+
+def run_conversion(session_id, filename, md_text, css_text=None, logo_bytes=None, cover_data=None):
+    """
+    Converte o markdown para PDF (executado no pool de jobs), publicando o
+    progresso em `session_id`.
+
+    Returns:
+        JobResult: PDF gerado, com os cabeçalhos X-Cache e Server-Timing
+    """
+    try:
+        # Verificar se arquivos necessários existem no APP_ROOT (via índice de recursos)
+        assets = get_asset_index(APP_ROOT)
+        logger.info(f"Logo ZOI existe: {assets.find_logo() is not None}")
+        logger.info(f"Capa mockup existe: {assets.find_cover_template() is not None}")
+
+        # Use o diretório do projeto como base para resolver fonts/ e logo_zoi.png
+        logger.info("Iniciando conversão MD -> PDF")
+        update_progress(session_id, 60, "Convertendo para PDF...")
+        stats = RenderStats()
+        with CONVERSIONS_IN_FLIGHT.track(kind='convert-md'):
+            pdf_bytes, cache_status = cached_render_pdf(
+                md_text,
                 css_style=css_text,
-                logo_path=str(logo_path) if logo_path else None,
+                logo=logo_bytes,
                 base_dir=str(APP_ROOT),
                 cover_data=cover_data,
                 cover_template_path=None,
+                stats=stats,
             )
 
-            logger.info("Conversão concluída com sucesso")
-            update_progress(session_id, 90, "Finalizando...")
+        logger.info(f"Conversão concluída com sucesso (cache: {cache_status or 'desativado'})")
+        logger.info(f"render_stats {stats.to_json()}")
+        update_progress(session_id, 90, "Finalizando...")
 
-            # Verificar se o PDF foi criado
-            if not pdf_out.exists():
-                raise Exception(f"PDF não foi criado em {pdf_out}")
+        logger.info(f"Tamanho do PDF: {len(pdf_bytes)} bytes")
+        update_progress(session_id, 100, "Concluído!")
+    except Exception as e:
+        logger.error(f"ERRO DURANTE CONVERSÃO: {str(e)}")
+        update_progress(session_id, 100, f"Erro: {e}")
+        raise
 
-            logger.info(f"Tamanho do PDF: {pdf_out.stat().st_size} bytes")
-            update_progress(session_id, 100, "Concluído!")
+    headers = {'Server-Timing': stats.server_timing()}
+    if cache_status:
+        headers['X-Cache'] = cache_status
+    return JobResult(pdf_bytes, "application/pdf", Path(filename).with_suffix(".pdf").name, headers)
 
-            return send_file(
-                pdf_out,
-                mimetype="application/pdf",
-                as_attachment=True,
-                download_name=Path(filename).with_suffix(".pdf").name,
-            )
 
+@conversion_bp.route("/convert-md", methods=["POST"])
+def convert_md():
+    # Recusa (503) antes de receber o arquivo se a fila estiver cheia
+    get_job_queue().check_capacity()
+    # session_id inválido: 400 (antes do try, que transformaria o abort em 500)
+    session_id = request_job_id()
+    try:
+        logger.info("=== INICIO DA CONVERSÃO ===")
+        update_progress(session_id, 5, "Iniciando conversão...")
+        params = _read_conversion_form(session_id)
+
+        # A conversão roda no pool de jobs (limita as renderizações simultâneas);
+        # esta rota síncrona aguarda o resultado. Para não bloquear, use /jobs/convert-md.
+        try:
+            job = get_job_queue().submit(session_id, 'convert-md', run_conversion, session_id, **params)
+        except ValueError as e:
+            # session_id já usado por um job em andamento
+            return jsonify({"error": str(e)}), 409
+        return result_response(job.wait())
+
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"ERRO DURANTE CONVERSÃO: {str(e)}")
         logger.error(f"Traceback completo: {traceback.format_exc()}")
@@ -133,3 +234,105 @@ def convert_md():
             "error": str(e),
             "traceback": traceback.format_exc()
         }), 500
+
+
+@conversion_bp.route("/jobs/convert-md", methods=["POST"])
+def submit_convert_md():
+    """Enfileira a conversão e responde 202 com o id do job (= session_id do progresso)"""
+    get_job_queue().check_capacity()
+    session_id = request_job_id()
+    logger.info(f"=== NOVO JOB DE CONVERSÃO: {session_id} ===")
+    update_progress(session_id, 5, "Na fila de conversão...")
+    params = _read_conversion_form(session_id)
+    return submit_job(session_id, 'convert-md', run_conversion, session_id, **params)
+
+
+class _ZipBuffer:
+    """Destino do ZIP transmitido: acumula o que foi escrito até a próxima parte da resposta."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _stream_pdf_zip(session_id, documents, css_text=None, logo_bytes=None, cover_data=None):
+    """
+    Converte os documentos no pool da fila de jobs (o lote divide os
+    `RENDER_WORKERS` com as demais conversões, com no máximo `RENDER_WORKERS`
+    documentos na fila por vez; a capacidade é verificada uma vez, na rota)
+    e gera o ZIP com os PDFs em partes, uma a cada PDF pronto, publicando o
+    progresso de cada arquivo em `session_id`.
+    O ZIP termina com `resumo.json` (resultado de cada arquivo, como no lote da CLI).
+    """
+    total = len(documents)
+    results = []
+    buffer = _ZipBuffer()
+    queue = get_job_queue()
+
+    with CONVERSIONS_IN_FLIGHT.track(kind='convert-zip'):
+        # PDFs já são comprimidos: ZIP_STORED evita recompressão
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            batch = convert_markdown_batch(
+                documents,
+                css_style=css_text,
+                logo=logo_bytes,
+                base_dir=str(APP_ROOT),
+                cover_data=cover_data,
+                workers=queue.max_workers,
+                submit=partial(queue.submit_task, 'convert-zip'),
+            )
+            for done, (result, pdf_bytes) in enumerate(batch, 1):
+                results.append(result)
+                name = Path(result['file']).name
+                if result['ok']:
+                    archive.writestr(result['pdf'], pdf_bytes)
+                    message = f"[{done}/{total}] ✓ {name}"
+                else:
+                    logger.error(f"Erro ao converter {result['file']}: {result['error']}")
+                    message = f"[{done}/{total}] ✗ {name}: {result['error']}"
+                update_progress(session_id, 5 + int(90 * done / total), message)
+                yield buffer.take()
+
+            ok = sum(1 for result in results if result['ok'])
+            summary = {'converted': ok, 'failed': total - ok, 'files': results}
+            archive.writestr('resumo.json', json.dumps(summary, ensure_ascii=False, indent=2))
+
+    yield buffer.take()
+    logger.info(f"Lote concluído: {ok} convertidos, {total - ok} com erro")
+    update_progress(session_id, 100, f"Concluído! {ok} de {total} convertidos")
+
+
+@conversion_bp.route("/convert-zip", methods=["POST"])
+def convert_zip():
+    """
+    Converte vários .md (um .zip em `file` ou vários arquivos em `files`) com a
+    mesma capa e transmite um ZIP com os PDFs, à medida que cada um fica pronto
+    """
+    get_job_queue().check_capacity()
+    session_id = request_job_id()
+    logger.info(f"=== NOVO LOTE DE CONVERSÃO: {session_id} ===")
+    update_progress(session_id, 5, "Lendo arquivos...")
+    documents = _read_markdown_documents()
+    options = _read_conversion_options()
+    logger.info(f"Lote com {len(documents)} documentos")
+
+    archive_name = Path(request.files.get('file').filename).stem if request.files.get('file') else 'documentos'
+    return Response(
+        _stream_pdf_zip(session_id, documents, **options),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{archive_name}-pdfs.zip"',
+            'X-Accel-Buffering': 'no',
+        },
+    )
@@ -0,0 +1,118 @@
+"""
+Rotas para acompanhar jobs de conversão e baixar seus resultados
+"""
+
+from flask import Blueprint, abort, jsonify, request, send_file, url_for
+import io
+import logging
+import secrets
+import uuid
+
+from app.utils.jobs import DONE, ERROR, JOB_ID_RE, QUEUED, QueueFullError, get_job_queue
+from app.utils.metrics import Counter, Gauge
+from app.routes.progress import get_progress
+
+jobs_bp = Blueprint('jobs', __name__)
+logger = logging.getLogger(__name__)
+
+Gauge(
+    'render_jobs', 'Jobs de conversão por status', labelnames=('status',),
+    collect=lambda: {(status,): count for status, count in get_job_queue().counts().items()},
+)
+JOBS_REJECTED = Counter('render_jobs_rejected_total', 'Jobs recusados com a fila de conversão cheia', labelnames=('route',))
+
+
+@jobs_bp.app_errorhandler(QueueFullError)
+def handle_queue_full(e):
+    """Fila cheia: 503 com Retry-After, em vez de aceitar mais trabalho do que o worker suporta"""
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    return jsonify(queue_full_body(e, route)), 503, {'Retry-After': str(e.retry_after)}
+
+
+def queue_full_body(e, route):
+    """Registra a recusa e monta o corpo da resposta 503 (também usado pelo modo ASGI)."""
+    JOBS_REJECTED.inc(route=route)
+    logger.warning(f"Job recusado em {route}: {e}")
+    return {
+        "error": "Servidor ocupado, tente novamente em instantes",
+        "queue_position": e.position,
+        "estimated_wait": round(e.estimated_wait, 1),
+        "retry_after": e.retry_after,
+    }
+
+
+def result_response(result):
+    """Resposta HTTP com o arquivo de um `JobResult`."""
+    response = send_file(
+        io.BytesIO(result.body),
+        mimetype=result.mimetype,
+        as_attachment=True,
+        download_name=result.download_name,
+    )
+    response.headers.update(result.headers)
+    return response
+
+
+def request_job_id():
+    """Id do novo job: o `session_id` enviado pelo front (validado) ou um UUID."""
+    job_id = request.form.get('session_id') or str(uuid.uuid4())
+    if not JOB_ID_RE.match(job_id):
+        abort(400, "session_id inválido")
+    return job_id
+
+
+def submit_job(job_id, kind, fn, *args, **kwargs):
+    """
+    Enfileira um job (gravado no armazenamento em disco) e monta a resposta
+    202 com os endereços de status, resultado (com o token de acesso) e
+    progresso (SSE), a posição na fila e a espera estimada.
+    Com a fila cheia, `QueueFullError` vira uma resposta 503 (ver `handle_queue_full`).
+    """
+    queue = get_job_queue()
+    try:
+        job = queue.submit(job_id, kind, fn, *args, persist=True, **kwargs)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    status_url = url_for('jobs.job_status', job_id=job.id)
+    body = {
+        **job.as_dict(),
+        **queue.queue_status(job),
+        'status_url': status_url,
+        'result_url': url_for('jobs.job_result', job_id=job.id, token=job.token),
+        'progress_url': url_for('progress.progress_stream', session_id=job.id),
+    }
+    return jsonify(body), 202, {'Location': status_url}
+
+
+@jobs_bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status do job, com o último progresso publicado"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    body = job.as_dict()
+    if job.status == QUEUED:
+        body.update(get_job_queue().queue_status(job))
+    progress = get_progress(job_id)
+    if progress:
+        body['progress'] = {'percentage': progress['percentage'], 'message': progress['message']}
+    elif job.finished:
+        body['progress'] = {'percentage': 100, 'message': "Concluído!" if job.status == DONE else f"Erro: {job.error}"}
+    return jsonify(body)
+
+
+@jobs_bp.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Arquivo gerado pelo job (202 enquanto não terminar), com o token do `result_url`"""
+    job = get_job_queue().get(job_id)
+    # Sem o token certo, o job não existe (o id é escolhido pelo cliente e pode ser adivinhado)
+    if job is None or not job.token or not secrets.compare_digest(request.args.get('token', ''), job.token):
+        return jsonify({"error": "Job não encontrado"}), 404
+    if job.status == ERROR:
+        return jsonify({"error": job.error, "traceback": job.traceback}), 500
+    if job.status != DONE:
+        return jsonify(job.as_dict()), 202
+    result = get_job_queue().load_result(job)
+    if result is None:
+        return jsonify({"error": "Resultado expirado ou removido"}), 410
+    return result_response(result)
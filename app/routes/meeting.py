@@ -2,18 +2,25 @@
 Rotas para processamento de reuniões e geração de resumos
 """
 
-from flask import Blueprint, request, send_file, abort, jsonify, current_app
+from flask import Blueprint, request, abort, jsonify, current_app
 from pathlib import Path
+import shutil
 import tempfile
+import threading
 import traceback
 import logging
-import uuid
-import whisper
-from openai import OpenAI
+import re
 import os
 
-from app.utils.md_to_pdf import md_to_pdf
+from app.utils.md_to_pdf import render_pdf_pooled
+from app.utils.metrics import RenderStats
+from app.utils.jobs import JobResult, QueueFullError, get_job_queue
+from app.utils.uploads import spool_of
+from app.utils.summarization import MeetingSummarizer
 from app.routes.progress import update_progress
+from app.routes.metrics import CONVERSIONS_IN_FLIGHT
+from app.routes.jobs import request_job_id, result_response, submit_job
+from app.utils import transcription, warmup
 
 meeting_bp = Blueprint('meeting', __name__)
 logger = logging.getLogger(__name__)
@@ -24,113 +31,182 @@ APP_ROOT = Path(__file__).resolve().parent.parent.parent
 # Configurar OpenAI API e modelo
 openai_api_key = os.getenv('OPENAI_API_KEY')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
-if openai_api_key:
-    openai_client = OpenAI(api_key=openai_api_key)
+# Servidor compatível com a API de chat completions (ex.: um servidor local para testes)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+if OPENAI_BASE_URL:
+    logger.info(f"API de chat em {OPENAI_BASE_URL}. Modelo: {OPENAI_MODEL}")
+elif openai_api_key:
     logger.info(f"OpenAI API configurada. Modelo: {OPENAI_MODEL}")
 else:
-    openai_client = None
     logger.warning("OPENAI_API_KEY não encontrada - usando modo de demonstração")
 
-# Carregar modelo Whisper (nome via env)
-try:
-    whisper_model_name = os.getenv('WHISPER_MODEL', 'base')
-    whisper_model = whisper.load_model(whisper_model_name)
-    logger.info(f"Modelo Whisper '{whisper_model_name}' carregado com sucesso")
-except Exception as e:
-    whisper_model = None
-    logger.error(f"Erro ao carregar modelo Whisper: {e}")
+# Cliente OpenAI carregado na primeira utilização, não ao importar o módulo.
+# O modelo Whisper fica em app/utils/transcription.py (no processo de
+# transcrição dedicado, se TRANSCRIBER_SOCKET estiver configurado)
+_openai_client = None
+_openai_lock = threading.Lock()
 
 
-@meeting_bp.route("/process-meeting", methods=["POST"])
-def process_meeting():
-    session_id = request.form.get('session_id', str(uuid.uuid4()))
-    try:
-        logger.info("=== INICIO DO PROCESSAMENTO DE REUNIÃO ===")
-        update_progress(session_id, 5, "Iniciando processamento...")
+def get_openai_client():
+    """Cliente OpenAI, ou None sem OPENAI_API_KEY nem OPENAI_BASE_URL (modo de demonstração)."""
+    global _openai_client
+    if not openai_api_key and not OPENAI_BASE_URL:
+        return None
+    with _openai_lock:
+        if _openai_client is None:
+            from openai import OpenAI
+            # Servidores locais em geral não exigem chave, mas o cliente exige uma
+            _openai_client = OpenAI(api_key=openai_api_key or 'local', base_url=OPENAI_BASE_URL)
+        return _openai_client
+
 
-        meeting_file = request.files.get("meeting_file")
-        if not meeting_file:
-            logger.error("Nenhum arquivo de reunião enviado")
-            abort(400, "Nenhum arquivo de reunião enviado")
-
-        filename = Path(meeting_file.filename or "meeting").name
-        logger.info(f"Arquivo de reunião recebido: {filename}")
-        logger.info(f"Tipo de conteúdo: {meeting_file.content_type}")
-
-        # Meeting metadata
-        participants = request.form.get('meeting_participants', '')
-        meeting_date = request.form.get('meeting_date', '')
-        meeting_title = request.form.get('meeting_title', '') or 'Resumo de Reunião'
-
-        logger.info(f"Participantes: {participants}")
-        logger.info(f"Data: {meeting_date}")
-        logger.info(f"Título: {meeting_title}")
-
-        # Cover data from form
-        cover_data = {
-            'topo_direito_email': request.form.get('cover_top_email', ''),
-            'topo_direito_site': request.form.get('cover_top_site', ''),
-            'representante_label': request.form.get('cover_rep_label', ''),
-            'representante_nome': request.form.get('cover_rep_nome', ''),
-            'subtitulo': meeting_title,
-            'descricao': f"Reunião realizada em {meeting_date}" if meeting_date else "Resumo de reunião",
-            'preparado_nome': request.form.get('cover_prep_nome', ''),
-            'preparado_email': request.form.get('cover_prep_email', ''),
-            'preparado_phone': request.form.get('cover_prep_phone', ''),
-            'data': meeting_date or request.form.get('cover_data', ''),
-        }
-
-        upload_base = current_app.config.get('UPLOAD_FOLDER', '/tmp')
-        with tempfile.TemporaryDirectory(dir=upload_base) as tmpdir:
-            tmpdir_path = Path(tmpdir)
-            logger.info(f"Diretório temporário: {tmpdir_path}")
-
-            # Save uploaded meeting file
-            meeting_path = tmpdir_path / filename
-            meeting_file.save(meeting_path)
-            logger.info(f"Arquivo de reunião salvo em: {meeting_path}")
+warmup.register('whisper', transcription.warm)
+
+
+def _read_meeting_form(session_id):
+    """
+    Lê o arquivo e os dados da reunião enviados ao endpoint. O arquivo é salvo
+    em um diretório temporário que passa a pertencer ao job (removido por
+    `run_meeting` ao final).
+
+    Returns:
+        dict: Argumentos de `run_meeting`
+    """
+    meeting_file = request.files.get("meeting_file")
+    if not meeting_file:
+        logger.error("Nenhum arquivo de reunião enviado")
+        abort(400, "Nenhum arquivo de reunião enviado")
+
+    filename = Path(meeting_file.filename or "meeting").name
+    logger.info(f"Arquivo de reunião recebido: {filename}")
+    logger.info(f"Tipo de conteúdo: {meeting_file.content_type}")
+
+    # Meeting metadata
+    participants = request.form.get('meeting_participants', '')
+    meeting_date = request.form.get('meeting_date', '')
+    meeting_title = request.form.get('meeting_title', '') or 'Resumo de Reunião'
+
+    logger.info(f"Participantes: {participants}")
+    logger.info(f"Data: {meeting_date}")
+    logger.info(f"Título: {meeting_title}")
+
+    # Cover data from form
+    cover_data = {
+        'topo_direito_email': request.form.get('cover_top_email', ''),
+        'topo_direito_site': request.form.get('cover_top_site', ''),
+        'representante_label': request.form.get('cover_rep_label', ''),
+        'representante_nome': request.form.get('cover_rep_nome', ''),
+        'subtitulo': meeting_title,
+        'descricao': f"Reunião realizada em {meeting_date}" if meeting_date else "Resumo de reunião",
+        'preparado_nome': request.form.get('cover_prep_nome', ''),
+        'preparado_email': request.form.get('cover_prep_email', ''),
+        'preparado_phone': request.form.get('cover_prep_phone', ''),
+        'data': meeting_date or request.form.get('cover_data', ''),
+    }
+
+    upload_base = current_app.config.get('UPLOAD_FOLDER', '/tmp')
+    tmpdir_path = Path(tempfile.mkdtemp(dir=upload_base))
+    logger.info(f"Diretório temporário: {tmpdir_path}")
+
+    # Move o upload (já gravado em UPLOAD_FOLDER durante o recebimento) para o diretório do job
+    meeting_path = tmpdir_path / filename
+    try:
+        spool = spool_of(meeting_file)
+        spool.move_to(meeting_path)
+    except Exception:
+        shutil.rmtree(tmpdir_path, ignore_errors=True)
+        raise
+    logger.info(f"Arquivo de reunião salvo em: {meeting_path} ({spool.size} bytes, sha256: {spool.sha256})")
+
+    return {
+        'meeting_path': meeting_path,
+        'media_sha256': spool.sha256,
+        'participants': participants,
+        'meeting_date': meeting_date,
+        'meeting_title': meeting_title,
+        'cover_data': cover_data,
+    }
+
+
+def run_meeting(session_id, meeting_path, participants, meeting_date, meeting_title, cover_data, media_sha256=None):
+    """
+    Gera o resumo da reunião e o PDF (executado no pool de jobs), publicando o
+    progresso em `session_id`.
 
+    Returns:
+        JobResult: PDF do resumo
+    """
+    try:
+        try:
             # Process the meeting file and generate markdown summary
             update_progress(session_id, 15, "Processando arquivo de reunião...")
-            summary_md = process_meeting_file(meeting_path, participants, meeting_date, meeting_title, session_id)
-
-            # Save summary as markdown file
-            md_path = tmpdir_path / "resumo_reuniao.md"
-            with open(md_path, 'w', encoding='utf-8') as f:
-                f.write(summary_md)
-            logger.info(f"Resumo em markdown salvo em: {md_path}")
-
-            # Generate PDF from markdown
-            pdf_out = tmpdir_path / "resumo_reuniao.pdf"
-            logger.info("Convertendo resumo para PDF")
-            update_progress(session_id, 80, "Gerando PDF...")
-
-            md_to_pdf(
-                str(md_path),
-                str(pdf_out),
+            summary_md = process_meeting_file(
+                meeting_path, participants, meeting_date, meeting_title, session_id, media_sha256=media_sha256,
+            )
+        finally:
+            shutil.rmtree(meeting_path.parent, ignore_errors=True)
+
+        # Generate PDF from markdown (in memory, no intermediate files)
+        logger.info("Convertendo resumo para PDF")
+        update_progress(session_id, 80, "Gerando PDF...")
+
+        stats = RenderStats()
+        with CONVERSIONS_IN_FLIGHT.track(kind='process-meeting'):
+            pdf_bytes = render_pdf_pooled(
+                summary_md,
                 css_style=None,
-                logo_path=None,
+                logo=None,
                 base_dir=str(APP_ROOT),
                 cover_data=cover_data,
                 cover_template_path=None,
+                stats=stats,
             )
 
-            logger.info("Conversão para PDF concluída")
-            update_progress(session_id, 95, "Finalizando...")
+        logger.info("Conversão para PDF concluída")
+        logger.info(f"render_stats {stats.to_json()}")
+        update_progress(session_id, 95, "Finalizando...")
 
-            if not pdf_out.exists():
-                raise Exception(f"PDF não foi criado em {pdf_out}")
+        logger.info(f"Tamanho do PDF: {len(pdf_bytes)} bytes")
+        update_progress(session_id, 100, "Concluído!")
+    except Exception as e:
+        logger.error(f"ERRO DURANTE PROCESSAMENTO DE REUNIÃO: {str(e)}")
+        update_progress(session_id, 100, f"Erro: {e}")
+        raise
 
-            logger.info(f"Tamanho do PDF: {pdf_out.stat().st_size} bytes")
-            update_progress(session_id, 100, "Concluído!")
+    return JobResult(
+        pdf_bytes,
+        "application/pdf",
+        f"{meeting_title.replace(' ', '_')}.pdf",
+        {'Server-Timing': stats.server_timing()},
+    )
 
-            return send_file(
-                pdf_out,
-                mimetype="application/pdf",
-                as_attachment=True,
-                download_name=f"{meeting_title.replace(' ', '_')}.pdf",
-            )
 
+@meeting_bp.route("/process-meeting", methods=["POST"])
+def process_meeting():
+    # Recusa (503) antes de salvar o arquivo se a fila estiver cheia
+    get_job_queue().check_capacity()
+    # session_id inválido: 400 (antes do try, que transformaria o abort em 500)
+    session_id = request_job_id()
+    try:
+        logger.info("=== INICIO DO PROCESSAMENTO DE REUNIÃO ===")
+        update_progress(session_id, 5, "Iniciando processamento...")
+        params = _read_meeting_form(session_id)
+
+        # O processamento roda no pool de jobs; esta rota síncrona aguarda o resultado.
+        # Para não bloquear, use /jobs/process-meeting.
+        try:
+            job = get_job_queue().submit(session_id, 'process-meeting', run_meeting, session_id, **params)
+        except ValueError as e:
+            # session_id já usado por um job em andamento
+            shutil.rmtree(params['meeting_path'].parent, ignore_errors=True)
+            return jsonify({"error": str(e)}), 409
+        except Exception:
+            shutil.rmtree(params['meeting_path'].parent, ignore_errors=True)
+            raise
+        return result_response(job.wait())
+
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"ERRO DURANTE PROCESSAMENTO DE REUNIÃO: {str(e)}")
         logger.error(f"Traceback completo: {traceback.format_exc()}")
@@ -140,9 +216,28 @@ def process_meeting():
         }), 500
 
 
-def process_meeting_file(file_path: Path, participants: str, meeting_date: str, meeting_title: str, session_id: str) -> str:
+@meeting_bp.route("/jobs/process-meeting", methods=["POST"])
+def submit_process_meeting():
+    """Enfileira o processamento e responde 202 com o id do job (= session_id do progresso)"""
+    get_job_queue().check_capacity()
+    session_id = request_job_id()
+    logger.info(f"=== NOVO JOB DE REUNIÃO: {session_id} ===")
+    update_progress(session_id, 5, "Na fila de processamento...")
+    params = _read_meeting_form(session_id)
+    try:
+        response = submit_job(session_id, 'process-meeting', run_meeting, session_id, **params)
+    except QueueFullError:
+        shutil.rmtree(params['meeting_path'].parent, ignore_errors=True)
+        raise
+    if response[1] != 202:
+        shutil.rmtree(params['meeting_path'].parent, ignore_errors=True)
+    return response
+
+
+def process_meeting_file(file_path: Path, participants: str, meeting_date: str, meeting_title: str, session_id: str, media_sha256: str = None) -> str:
     """
     Process meeting file and generate markdown summary using AI.
+    `media_sha256` (the upload hash) identifies the recording in the transcript cache.
     """
     logger.info(f"Processando arquivo de reunião: {file_path}")
 
@@ -160,20 +255,25 @@ def process_meeting_file(file_path: Path, participants: str, meeting_date: str,
 
     elif file_ext in ['.mp3', '.wav', '.mp4', '.avi', '.mov', '.m4a']:
         # Audio/Video file - use Whisper for speech-to-text
-        if whisper_model:
-            try:
-                update_progress(session_id, 25, "Transcrevendo áudio...")
-                logger.info("Iniciando transcrição com Whisper...")
-                result = whisper_model.transcribe(str(file_path), language="pt")
-                transcript = result["text"]
-                logger.info(f"Transcrição concluída. Tamanho: {len(transcript)} caracteres")
-                update_progress(session_id, 50, "Transcrição concluída")
-            except Exception as e:
-                logger.error(f"Erro na transcrição Whisper: {e}")
-                transcript = f"[ERRO NA TRANSCRIÇÃO]\n\nArquivo: {file_path.name}\nErro: {str(e)}\n\nPor favor, tente novamente ou use um arquivo de texto."
-        else:
-            transcript = f"[WHISPER NÃO DISPONÍVEL]\n\nArquivo de áudio/vídeo detectado: {file_path.name}\n\nO modelo Whisper não foi carregado corretamente. Verifique as dependências."
-            logger.warning("Whisper não disponível para transcrição")
+        try:
+            update_progress(session_id, 25, "Transcrevendo áudio...")
+            logger.info("Iniciando transcrição com Whisper...")
+
+            def transcription_progress(done, total):
+                # Áudios longos: 25% a 50% conforme os trechos são transcritos
+                update_progress(session_id, 25 + 25 * done // total, f"Transcrevendo áudio (trecho {done} de {total})...")
+
+            transcript = transcription.transcribe(
+                file_path, language="pt", progress=transcription_progress, media_sha256=media_sha256,
+            )
+            logger.info(f"Transcrição concluída. Tamanho: {len(transcript)} caracteres")
+            update_progress(session_id, 50, "Transcrição concluída")
+        except transcription.TranscriberUnavailable as e:
+            transcript = f"[WHISPER NÃO DISPONÍVEL]\n\nArquivo de áudio/vídeo detectado: {file_path.name}\n\nO modelo Whisper não foi carregado corretamente ({e}). Verifique as dependências."
+            logger.warning(f"Whisper não disponível para transcrição: {e}")
+        except Exception as e:
+            logger.error(f"Erro na transcrição Whisper: {e}")
+            transcript = f"[ERRO NA TRANSCRIÇÃO]\n\nArquivo: {file_path.name}\nErro: {str(e)}\n\nPor favor, tente novamente ou use um arquivo de texto."
 
     else:
         # Unknown file type
@@ -187,6 +287,14 @@ def process_meeting_file(file_path: Path, participants: str, meeting_date: str,
     return summary
 
 
+# Avisos no lugar da transcrição ("[ERRO NA TRANSCRIÇÃO]", ...), diferentes dos horários "[00:01:02]"
+PLACEHOLDER_RE = re.compile(r'\[[^\]\d]+\]')
+
+
+def is_placeholder_transcript(transcript: str) -> bool:
+    return bool(PLACEHOLDER_RE.match(transcript))
+
+
 def generate_meeting_summary(transcript: str, participants: str, meeting_date: str, meeting_title: str, session_id: str) -> str:
     """
     Generate a structured meeting summary in markdown format using OpenAI GPT.
@@ -195,7 +303,8 @@ def generate_meeting_summary(transcript: str, participants: str, meeting_date: s
     formatted_participants = participants if participants else "Participantes não informados"
 
     # Use OpenAI GPT for intelligent summarization if available
-    if openai_client and transcript and not transcript.startswith('['):
+    openai_client = get_openai_client()
+    if openai_client and transcript and not is_placeholder_transcript(transcript):
         try:
             logger.info("Gerando resumo com OpenAI GPT...")
 
@@ -204,22 +313,15 @@ def generate_meeting_summary(transcript: str, participants: str, meeting_date: s
             with open(prompt_file, 'r', encoding='utf-8') as f:
                 prompt_template = f.read()
 
-            prompt = prompt_template.replace('<<DATA>>', formatted_date)
-            prompt = prompt.replace('<<NOMES>>', formatted_participants)
-            prompt = prompt.replace('<<PARTICIPANTES_INTERNOS>>', formatted_participants)
-            prompt = prompt.replace('<<TRANSCRIÇÂO>>', transcript[:4000])
-            prompt = prompt.replace(' <<TRANSCRIÇÂO >>', transcript[:4000])
-
-            response = openai_client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Você é um especialista em resumir reuniões de negócios de forma clara e profissional."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_completion_tokens=4000
-            )
+            def summary_progress(done, total):
+                # Transcrições longas: 60% a 72% conforme as partes são resumidas
+                update_progress(session_id, 60 + 12 * done // total, f"Resumindo a reunião (parte {done} de {total})...")
 
-            ai_summary = response.choices[0].message.content
+            # Transcrição inteira, resumida em partes e depois consolidada (ver app/utils/summarization.py)
+            summarizer = MeetingSummarizer(openai_client, OPENAI_MODEL)
+            ai_summary = summarizer.summarize(
+                transcript, prompt_template, formatted_date, formatted_participants, progress=summary_progress,
+            )
             logger.info("Resumo gerado com sucesso pelo OpenAI GPT")
             update_progress(session_id, 75, "Resumo gerado com sucesso")
 
@@ -252,7 +354,7 @@ def generate_meeting_summary(transcript: str, participants: str, meeting_date: s
 
 ## Resumo Executivo
 
-{'Este resumo foi gerado automaticamente a partir da transcrição da reunião.' if not transcript.startswith('[') else 'Modo de demonstração - integração completa com IA disponível com chave OpenAI.'}
+{'Este resumo foi gerado automaticamente a partir da transcrição da reunião.' if not is_placeholder_transcript(transcript) else 'Modo de demonstração - integração completa com IA disponível com chave OpenAI.'}
 
 ## Pontos Principais Discutidos
 
@@ -0,0 +1,111 @@
+"""
+Métricas da aplicação no formato do Prometheus (/metrics)
+"""
+
+from flask import Blueprint, Response, g, request
+import os
+import time
+
+from app.utils.metrics import Counter, Gauge, Histogram, SECONDS_BUCKETS, render_prometheus
+
+metrics_bp = Blueprint('metrics', __name__)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'Requisições HTTP atendidas', labelnames=('route', 'method', 'status')
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Duração das requisições HTTP', SECONDS_BUCKETS, labelnames=('route', 'method')
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requisições HTTP em andamento', labelnames=('route',)
+)
+CONVERSIONS_IN_FLIGHT = Gauge(
+    'conversions_in_flight', 'Conversões para PDF em andamento', labelnames=('kind',)
+)
+SSE_STREAMS_ACTIVE = Gauge(
+    'sse_streams_active', 'Conexões SSE de progresso abertas'
+)
+
+
+def _route_label():
+    # Regra da rota (ex.: /relatorio/progress/<session_id>) para não criar uma série por URL
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@metrics_bp.before_app_request
+def _start_request_timer():
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = _route_label()
+    HTTP_REQUESTS_IN_FLIGHT.inc(route=g.metrics_route)
+
+
+@metrics_bp.after_app_request
+def _record_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        route = g.pop('metrics_route')
+        HTTP_REQUESTS_IN_FLIGHT.dec(route=route)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+
+def _cache_counters():
+    """Acertos e falhas do cache de PDFs (disco) e do cache de capas (memória)."""
+    from app.utils.md_to_pdf import _renderers
+    from app.utils.pdf_cache import get_pdf_cache
+
+    counters = {}
+    cache = get_pdf_cache()
+    if cache is not None:
+        counters['pdf'] = (cache.hits, cache.misses)
+    renderers = list(_renderers.values())
+    if renderers:
+        counters['cover'] = (
+            sum(r.cover_hits for r in renderers),
+            sum(r.cover_misses for r in renderers),
+        )
+    return counters
+
+
+def _collect_cache_requests():
+    values = {}
+    for cache, (hits, misses) in _cache_counters().items():
+        values[(cache, 'hit')] = hits
+        values[(cache, 'miss')] = misses
+    return values
+
+
+def _collect_cache_hit_ratio():
+    return {
+        (cache,): hits / (hits + misses)
+        for cache, (hits, misses) in _cache_counters().items() if hits + misses
+    }
+
+
+def _collect_rss():
+    """Memória residente do processo (Linux; None se /proc não estiver disponível)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+Counter(
+    'cache_requests_total', 'Consultas aos caches de PDF e de capas', labelnames=('cache', 'result'),
+    collect=_collect_cache_requests,
+)
+Gauge(
+    'cache_hit_ratio', 'Proporção de acertos dos caches de PDF e de capas', labelnames=('cache',),
+    collect=_collect_cache_hit_ratio,
+)
+Gauge(
+    'process_resident_memory_bytes', 'Memória residente do worker', collect=_collect_rss,
+)
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Métricas do worker no formato texto do Prometheus"""
+    return Response(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
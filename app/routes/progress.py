@@ -1,70 +1,239 @@
 """
 Rotas para monitoramento de progresso via Server-Sent Events
+
+Cada sessão tem um canal de publicação/assinatura: `update_progress` publica
+o novo estado e acorda na hora os streams inscritos (sem polling). Streams
+ociosos enviam comentários de heartbeat, e uma thread de limpeza remove as
+sessões sem atualização há mais de `PROGRESS_TTL` segundos e sem inscritos.
+
+O mesmo canal atende o modo assíncrono (asgi.py): `progress_events` é um
+gerador assíncrono que aguarda no event loop, sem ocupar uma thread por conexão.
 """
 
 from flask import Blueprint, Response
+import asyncio
+import contextlib
+import json
+import os
 import threading
 import time
 import logging
 
+from app.routes.metrics import SSE_STREAMS_ACTIVE
+from app.utils.metrics import Gauge
+
 logger = logging.getLogger(__name__)
 
 progress_bp = Blueprint('progress', __name__)
 
-# Progress tracking
-progress_data = {}
-progress_lock = threading.Lock()
+# Intervalo entre heartbeats, validade das sessões sem atualização e duração máxima de um stream
+HEARTBEAT_INTERVAL = float(os.environ.get('PROGRESS_HEARTBEAT', 15))
+PROGRESS_TTL = float(os.environ.get('PROGRESS_TTL', 600))
+STREAM_TIMEOUT = 300  # 5 minutes timeout
+
+
+class ProgressChannel:
+    """Último estado de progresso de uma sessão e notificação dos inscritos."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.state = None
+        self.version = 0
+        self.updated_at = time.monotonic()
+        self.subscribers = 0
+        self._listeners = []
+
+    def publish(self, state):
+        with self._cond:
+            self.state = state
+            self.version += 1
+            self.updated_at = time.monotonic()
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_listener(self, callback):
+        """Registra `callback()` para ser chamado a cada publicação (de qualquer thread)."""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            self._listeners.remove(callback)
+
+    def snapshot(self):
+        """Returns: tuple (versão, estado) atuais"""
+        with self._cond:
+            return self.version, self.state
+
+    def wait(self, after_version, timeout):
+        """
+        Aguarda um estado mais novo que `after_version`.
+
+        Returns:
+            tuple: (versão, estado), ou None se o tempo acabar sem atualização
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.version > after_version, timeout):
+                return None
+            return self.version, self.state
+
+
+# Canais por sessão
+_channels = {}
+_channels_lock = threading.Lock()
+_sweeper = None
+
+Gauge('progress_sessions', 'Sessões de progresso em memória', collect=lambda: len(_channels))
+
+
+def _sweep_loop():
+    while True:
+        time.sleep(max(1.0, PROGRESS_TTL / 4))
+        limit = time.monotonic() - PROGRESS_TTL
+        with _channels_lock:
+            stale = [
+                session_id for session_id, channel in _channels.items()
+                if channel.subscribers == 0 and channel.updated_at < limit
+            ]
+            for session_id in stale:
+                del _channels[session_id]
+        if stale:
+            logger.info(f"{len(stale)} sessões de progresso expiradas removidas")
+
+
+def _get_channel(session_id, create=True):
+    global _sweeper
+    with _channels_lock:
+        channel = _channels.get(session_id)
+        if channel is None and create:
+            channel = _channels[session_id] = ProgressChannel()
+            # Iniciada sob demanda (depois do fork dos workers do gunicorn)
+            if _sweeper is None:
+                _sweeper = threading.Thread(target=_sweep_loop, name='progress-sweeper', daemon=True)
+                _sweeper.start()
+        return channel
 
 
 def update_progress(session_id: str, percentage: int, message: str):
     """Update progress for a specific session"""
-    with progress_lock:
-        progress_data[session_id] = {
-            'percentage': percentage,
-            'message': message,
-            'timestamp': time.time()
-        }
+    _get_channel(session_id).publish({
+        'percentage': percentage,
+        'message': message,
+        'timestamp': time.time()
+    })
     logger.info(f"Progress updated - Session: {session_id}, {percentage}%: {message}")
 
 
 def get_progress(session_id: str):
     """Get progress for a specific session"""
-    with progress_lock:
-        return progress_data.get(session_id)
+    channel = _get_channel(session_id, create=False)
+    return channel.state if channel is not None else None
+
+
+def _sse_data(state):
+    payload = {'percentage': state['percentage'], 'message': state['message']}
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+HEARTBEAT = ": heartbeat\n\n"
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'X-Accel-Buffering': 'no',
+    'Access-Control-Allow-Origin': '*'
+}
+
+
+@contextlib.contextmanager
+def _subscription(session_id):
+    """Canal da sessão, contado como inscrito (não expira) enquanto o stream estiver aberto."""
+    channel = _get_channel(session_id)
+    with _channels_lock:
+        channel.subscribers += 1
+    try:
+        with SSE_STREAMS_ACTIVE.track():
+            # Initialize with 0% if no progress exists yet
+            if channel.state is None:
+                update_progress(session_id, 0, "Conectando...")
+            yield channel
+    finally:
+        with _channels_lock:
+            channel.subscribers -= 1
+
+
+async def progress_events(session_id):
+    """
+    Gerador assíncrono com as mensagens SSE de progresso da sessão (modo ASGI).
+    Aguarda as publicações no event loop: conexões ociosas não ocupam threads.
+    """
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def wake():
+        # Chamado pela thread que publicou o progresso
+        try:
+            loop.call_soon_threadsafe(changed.set)
+        except RuntimeError:
+            pass  # event loop já encerrado
+
+    with _subscription(session_id) as channel:
+        channel.add_listener(wake)
+        try:
+            deadline = loop.time() + STREAM_TIMEOUT
+            version = 0
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.warning(f"SSE connection timeout for session {session_id}")
+                    break
+
+                changed.clear()
+                current, state = channel.snapshot()
+                if current > version:
+                    version = current
+                    yield _sse_data(state)
+                    if state['percentage'] >= 100:
+                        break
+                    continue
+
+                try:
+                    await asyncio.wait_for(changed.wait(), min(HEARTBEAT_INTERVAL, remaining))
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+        finally:
+            channel.remove_listener(wake)
 
 
 @progress_bp.route('/progress/<session_id>')
 def progress_stream(session_id):
     """Server-Sent Events endpoint for progress updates"""
     def generate():
-        # Initialize with 0% if no progress exists yet
-        if not get_progress(session_id):
-            update_progress(session_id, 0, "Conectando...")
-
-        start_time = time.time()
-        timeout = 300  # 5 minutes timeout
+        with _subscription(session_id) as channel:
+            yield from _stream(channel)
 
+    def _stream(channel):
+        deadline = time.monotonic() + STREAM_TIMEOUT
+        version = 0
         while True:
-            # Check timeout
-            if time.time() - start_time > timeout:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
                 logger.warning(f"SSE connection timeout for session {session_id}")
                 break
 
-            progress = get_progress(session_id)
-            if progress:
-                yield f"data: {{'percentage': {progress['percentage']}, 'message': '{progress['message']}'}}\n\n"
+            update = channel.wait(version, min(HEARTBEAT_INTERVAL, remaining))
+            if update is None:
+                # Comentário SSE: mantém a conexão viva através de proxies
+                yield HEARTBEAT
+                continue
 
-                # If completed, stop streaming
-                if progress['percentage'] >= 100:
-                    # Clean up old progress data
-                    with progress_lock:
-                        if session_id in progress_data:
-                            del progress_data[session_id]
-                    break
-            time.sleep(0.5)
+            version, state = update
+            yield _sse_data(state)
+
+            # If completed, stop streaming
+            if state['percentage'] >= 100:
+                break
 
-    return Response(generate(), mimetype='text/event-stream', headers={
-        'Cache-Control': 'no-cache',
-        'Connection': 'keep-alive',
-        'Access-Control-Allow-Origin': '*'
-    })
\ No newline at end of file
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
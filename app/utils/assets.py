@@ -0,0 +1,199 @@
+"""
+Índice de recursos (logos, capas e fontes) com invalidação por mtime.
+
+Em vez de testar a existência de cada caminho candidato a cada conversão,
+os diretórios de recursos são varridos uma vez e os caminhos ficam em
+memória. O índice só é refeito quando o mtime de algum diretório observado
+muda (arquivo criado, removido ou renomeado) ou quando um dos recursos
+indexados (logos, capas e fontes) é sobrescrito no lugar, e essa verificação
+é feita no máximo uma vez a cada `ASSET_INDEX_CHECK_INTERVAL` segundos.
+
+O SHA-256 de um arquivo (ex.: a logo, na chave do cache de PDFs) também fica
+em memória e só é recalculado quando o tamanho ou o mtime do arquivo mudam.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+LOGO_NAMES = ['logo_zoi.png']
+COVER_TEMPLATE_NAMES = [
+    'capa mockup.jpg',
+    'capa_mockup.jpg',
+    'capa-mockup.jpg',
+    'capa.png',
+    'capa.jpg',
+]
+FONT_EXTENSIONS = ('.woff2', '.woff', '.ttf', '.otf')
+
+DEFAULT_CHECK_INTERVAL = float(os.environ.get('ASSET_INDEX_CHECK_INTERVAL', 2.0))
+
+
+def file_stamp(path):
+    """(tamanho, mtime em ns) do arquivo, ou None se ele não existir."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class AssetIndex:
+    """
+    Índice dos recursos de um diretório base.
+
+    Diretórios observados (em ordem de prioridade):
+        - assets/images e a raiz do diretório base (logos e capas)
+        - fonts/ (fontes)
+    """
+
+    def __init__(self, base_dir, check_interval=None):
+        self.base_dir = Path(base_dir).resolve()
+        self.check_interval = DEFAULT_CHECK_INTERVAL if check_interval is None else check_interval
+        self.images_dirs = [self.base_dir / 'assets' / 'images', self.base_dir]
+        self.fonts_dirs = [self.base_dir / 'fonts']
+        self._dirs = self.images_dirs + self.fonts_dirs
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._last_check = 0.0
+        self._files = {}
+        self._tracked = []
+        self._version = ''
+        self._digests = {}
+
+    def _snapshot_mtimes(self):
+        mtimes = []
+        for d in self._dirs:
+            try:
+                mtimes.append(os.stat(d).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        # Sobrescrever um arquivo no lugar não altera o mtime do diretório
+        for path in self._tracked:
+            mtimes.append(file_stamp(path))
+        return tuple(mtimes)
+
+    def _is_tracked(self, d, name):
+        if d in self.fonts_dirs:
+            return name.lower().endswith(FONT_EXTENSIONS)
+        return name in LOGO_NAMES or name in COVER_TEMPLATE_NAMES
+
+    def _scan(self):
+        files = {}
+        tracked = []
+        fingerprint = hashlib.sha1()
+        for d in self._dirs:
+            entries = {}
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                        entries[entry.name] = Path(entry.path)
+                        if self._is_tracked(d, entry.name):
+                            tracked.append(entry.path)
+                        fingerprint.update(
+                            f"{entry.path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8', 'surrogateescape')
+                        )
+            except OSError:
+                pass
+            files[d] = entries
+        self._files = files
+        self._tracked = tracked
+        self._version = fingerprint.hexdigest()
+
+    def refresh(self, force=False):
+        """Refaz o índice se algum diretório observado mudou desde a última varredura."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._mtimes is not None and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            mtimes = self._snapshot_mtimes()
+            if force or mtimes != self._mtimes:
+                self._scan()
+                self._mtimes = self._snapshot_mtimes()
+
+    @property
+    def version(self):
+        """Impressão digital do conteúdo indexado (nomes, tamanhos e mtimes dos arquivos)."""
+        self.refresh()
+        return self._version
+
+    def _lookup(self, dirs, names):
+        self.refresh()
+        files = self._files
+        for d in dirs:
+            entries = files.get(d, {})
+            for name in names:
+                if name in entries:
+                    return entries[name]
+        return None
+
+    def file_digest(self, path):
+        """SHA-256 do conteúdo de `path`, memorizado por (caminho, tamanho, mtime), ou None se não existir."""
+        path = str(path)
+        stamp = file_stamp(path)
+        if stamp is None:
+            return None
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        h = hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(block)
+        except OSError:
+            return None
+        with self._lock:
+            self._digests[path] = (stamp, h.hexdigest())
+        return h.hexdigest()
+
+    def find_logo(self, prefer_root=False):
+        """
+        Logo padrão do rodapé (assets/images/logo_zoi.png ou logo_zoi.png na
+        raiz). Com `prefer_root`, a raiz tem prioridade (arquivo .md na raiz).
+        """
+        dirs = self.images_dirs[::-1] if prefer_root else self.images_dirs
+        return self._lookup(dirs, LOGO_NAMES)
+
+    def find_cover_template(self):
+        """Imagem de fundo da capa (mockup), na ordem de `COVER_TEMPLATE_NAMES`."""
+        return self._lookup(self.images_dirs, COVER_TEMPLATE_NAMES)
+
+    def find_font(self, name_candidates):
+        """
+        Primeira fonte em fonts/ cujo nome, em minúsculas, contenha um dos
+        candidatos (mesma regra da busca original: o candidato não é convertido).
+        """
+        self.refresh()
+        files = self._files
+        for d in self.fonts_dirs:
+            entries = files.get(d, {})
+            names = sorted(entries)
+            for cand in name_candidates:
+                for name in names:
+                    path = entries[name]
+                    if path.suffix.lower() in FONT_EXTENSIONS and cand in path.stem.lower():
+                        return path
+        return None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_asset_index(base_dir):
+    """Retorna o `AssetIndex` do processo para `base_dir`, criando-o na primeira chamada."""
+    key = str(Path(base_dir).resolve())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = AssetIndex(key)
+            _indexes[key] = index
+        return index
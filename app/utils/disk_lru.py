@@ -0,0 +1,92 @@
+"""
+Base dos caches em disco (PDFs e transcrições): arquivos em um diretório,
+limitados por tamanho total, com remoção dos menos usados recentemente.
+
+Cada acerto atualiza o mtime do arquivo; quando o total passa de
+`max_bytes`, o diretório é relido (pode ser compartilhado entre processos)
+e os arquivos de mtime mais antigo são removidos. As gravações são
+atômicas (arquivo temporário + `os.replace`).
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class DiskLRU:
+    """Diretório de arquivos com limite de tamanho total e remoção LRU (pelo mtime)."""
+
+    # Extensões dos arquivos do cache (os demais arquivos do diretório são ignorados)
+    suffixes = ()
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(self.suffixes):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, Path(entry.path), st.st_size))
+        except OSError:
+            pass
+        return entries
+
+    def _touch(self, path):
+        """Marca `path` como usado recentemente e conta o acerto (True) ou a falta (False)."""
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def _store(self, name, size, write):
+        """Grava `name` com `write(arquivo)` e aplica o limite de tamanho."""
+        if size > self.max_bytes:
+            return
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                write(out)
+            os.replace(tmp_name, self.cache_dir / name)
+        except Exception:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Reler o diretório: outros processos (workers do gunicorn) compartilham o cache
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+                logger.debug(f"Removido do cache {self.cache_dir}: {path.name}")
+            except OSError:
+                pass
+        self._total_bytes = total
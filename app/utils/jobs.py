@@ -0,0 +1,378 @@
+"""
+Fila de jobs de conversão.
+
+As rotas enfileiram o trabalho e respondem imediatamente com o id do job;
+um pool limitado de threads (`RENDER_WORKERS`) executa as conversões, de
+modo que as threads do gunicorn fiquem livres para outras requisições (e
+para o stream de progresso). O id do job é o mesmo `session_id` usado por
+`update_progress`, que continua sendo o canal de status do job.
+
+Com um `ResultStore` (ver result_store.py), status e resultados dos jobs
+enfileirados com `persist=True` (rotas /jobs/*) também são gravados em disco:
+jobs que já saíram da memória (ou que rodaram em outro worker) continuam
+consultáveis e baixáveis pelo id. O resultado só é entregue com o `token`
+gerado pelo servidor para o job (o id é escolhido pelo cliente).
+
+Admissão: além das conversões em execução, no máximo `RENDER_QUEUE_SIZE`
+jobs aguardam na fila; acima disso `submit` recusa o job com `QueueFullError`
+(as rotas respondem 503 com `Retry-After`), em vez de aceitar trabalho até o
+processo estourar a memória. Os tempos de espera são estimados pela duração
+média dos jobs recentes de cada tipo (uma reunião leva minutos, uma conversão
+de markdown menos de um segundo), aplicada aos jobs que estão à frente.
+
+Configuração via ambiente:
+    RENDER_WORKERS: conversões simultâneas (padrão: 2)
+    RENDER_QUEUE_SIZE: jobs aguardando na fila (padrão: 8)
+    JOB_TTL: segundos que um job concluído fica em memória (padrão: 3600;
+        com armazenamento em disco, no máximo 60)
+"""
+
+import logging
+import math
+import os
+import re
+import secrets
+import threading
+import time
+import heapq
+import traceback
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.result_store import get_result_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDER_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_JOB_TTL = 3600
+# Durações consideradas por tipo de job na estimativa de espera, e a estimativa
+# para um tipo que ainda não rodou
+RECENT_DURATIONS = 20
+DEFAULT_DURATION_ESTIMATE = 30.0
+# Com armazenamento em disco, jobs concluídos só ficam em memória por pouco tempo
+STORED_JOB_MEMORY_TTL = 60
+
+# Ids aceitos (o front usa "session_<timestamp>_<aleatório>")
+JOB_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+
+class QueueFullError(Exception):
+    """Fila de conversão cheia: o job foi recusado."""
+
+    def __init__(self, position, estimated_wait, retry_after):
+        super().__init__(f"Fila de conversão cheia ({position - 1} jobs aguardando)")
+        self.position = position
+        self.estimated_wait = estimated_wait
+        self.retry_after = retry_after
+
+
+class JobResult:
+    """Arquivo produzido por um job (conteúdo, tipo, nome e cabeçalhos extras da resposta)."""
+
+    def __init__(self, body, mimetype, download_name, headers=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.download_name = download_name
+        self.headers = headers or {}
+
+
+class Job:
+    """Estado de um job: status, resultado ou erro e horários."""
+
+    def __init__(self, job_id, kind, persist=False):
+        self.id = job_id
+        self.kind = kind
+        self.persist = persist
+        # Acesso ao resultado em /jobs/<id>/result
+        self.token = secrets.token_urlsafe(16)
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.exception = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, ERROR)
+
+    def wait(self, timeout=None):
+        """
+        Aguarda o fim do job.
+
+        Returns:
+            JobResult: Resultado do job (a exceção do job é relançada em caso de erro)
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Job {self.id} não terminou em {timeout}s")
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+    @classmethod
+    def from_record(cls, record):
+        """Job reconstruído a partir dos metadados do armazenamento em disco."""
+        job = cls(record['id'], record['kind'], persist=True)
+        job.token = record['token']
+        job.status = record['status']
+        job.error = record['error']
+        job.created_at = record['created_at']
+        job.started_at = record['started_at']
+        job.finished_at = record['finished_at']
+        if job.finished:
+            job._done.set()
+        return job
+
+    def as_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """Pool limitado de threads de conversão e registro dos jobs do processo."""
+
+    def __init__(self, max_workers=DEFAULT_RENDER_WORKERS, ttl=DEFAULT_JOB_TTL, store=None, max_queued=DEFAULT_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.store = store
+        self.ttl = min(ttl, STORED_JOB_MEMORY_TTL) if store is not None else ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # Tipo do job -> durações recentes (os documentos de um lote têm o tipo próprio da tarefa)
+        self._durations = defaultdict(lambda: deque(maxlen=RECENT_DURATIONS))
+
+    def submit(self, job_id, kind, fn, *args, persist=False, **kwargs):
+        """
+        Enfileira `fn(*args, **kwargs)`, que deve retornar um `JobResult`.
+        Com `persist`, status e resultado também vão para o armazenamento em disco.
+
+        Raises:
+            ValueError: Id inválido ou já usado por um job em andamento
+            QueueFullError: Fila de espera cheia
+        """
+        if not JOB_ID_RE.match(job_id or ''):
+            raise ValueError(f"Id de job inválido: {job_id!r}")
+        with self._lock:
+            self._purge()
+            existing = self._jobs.get(job_id)
+            if existing is not None and not existing.finished:
+                raise ValueError(f"Job {job_id} já está em andamento")
+            self._check_capacity()
+            job = Job(job_id, kind, persist)
+            self._jobs[job_id] = job
+        self._persist(job)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        logger.info(f"Job {job_id} ({kind}) enfileirado")
+        return job
+
+    def submit_task(self, kind, fn, *args, **kwargs):
+        """
+        Executa `fn(*args, **kwargs)` no pool de conversão como parte de um
+        pedido já admitido (ex.: cada documento de um lote /convert-zip): a
+        tarefa ocupa um worker e conta na fila como um job, mas não passa pelo
+        controle de admissão, não é gravada em disco e sai do registro ao terminar.
+
+        Returns:
+            Future: Retorno de `fn` (ou a exceção); cancelar o future tira a tarefa da fila
+        """
+        job = Job(uuid.uuid4().hex, kind)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+
+        def task():
+            try:
+                self._run(job, fn, args, kwargs)
+            finally:
+                self._forget(job)
+            return job.wait(0)
+
+        def cancelled(future):
+            if future.cancelled():
+                job.error = "Cancelado"
+                job.status = ERROR
+                job.finished_at = time.time()
+                job._done.set()
+                self._forget(job)
+
+        future = self._executor.submit(task)
+        future.add_done_callback(cancelled)
+        return future
+
+    def _forget(self, job):
+        with self._lock:
+            self._jobs.pop(job.id, None)
+
+    def check_capacity(self):
+        """
+        Verifica se há lugar na fila, para recusar um job antes de receber seus arquivos.
+
+        Raises:
+            QueueFullError: Fila de espera cheia
+        """
+        with self._lock:
+            self._check_capacity()
+
+    def _check_capacity(self):
+        # Chamado com o lock
+        queued, running = self._pending()
+        if len(queued) >= self.max_queued:
+            free_at = self._workers_free_at(running)
+            raise QueueFullError(
+                position=len(queued) + 1,
+                estimated_wait=self._estimate_wait(queued, free_at),
+                # Uma vaga na fila abre quando o primeiro job em execução terminar
+                retry_after=max(1, math.ceil(free_at[0])),
+            )
+
+    def _pending(self):
+        # Chamado com o lock: (jobs aguardando, na ordem de chegada; jobs em execução)
+        queued = []
+        running = []
+        for job in self._jobs.values():
+            if job.status == QUEUED:
+                queued.append(job)
+            elif job.status == RUNNING:
+                running.append(job)
+        queued.sort(key=lambda job: job.created_at)
+        return queued, running
+
+    def _average_duration(self, kind):
+        durations = self._durations.get(kind)
+        if not durations:
+            return DEFAULT_DURATION_ESTIMATE
+        return sum(durations) / len(durations)
+
+    def _workers_free_at(self, running):
+        # Segundos até cada worker ficar livre (heap), pelo tempo restante dos jobs em execução
+        now = time.time()
+        free_at = [max(0.0, self._average_duration(job.kind) - (now - (job.started_at or now))) for job in running]
+        free_at += [0.0] * max(0, self.max_workers - len(free_at))
+        heapq.heapify(free_at)
+        return free_at
+
+    def _estimate_wait(self, ahead, free_at):
+        # Distribui os jobs à frente (cada um com a duração média do seu tipo) pelo
+        # worker que fica livre primeiro; a espera é até o próximo worker livre
+        free_at = list(free_at)
+        for job in ahead:
+            heapq.heapreplace(free_at, free_at[0] + self._average_duration(job.kind))
+        return free_at[0]
+
+    def queue_status(self, job):
+        """
+        Posição de um job na fila e espera estimada até ele começar.
+
+        Returns:
+            dict: {'queue_position', 'estimated_wait'} (posição 0 quando já está em execução)
+        """
+        with self._lock:
+            if job.status != QUEUED:
+                return {'queue_position': 0, 'estimated_wait': 0}
+            queued, running = self._pending()
+            ahead = [other for other in queued if other.created_at < job.created_at]
+            wait = self._estimate_wait(ahead, self._workers_free_at(running))
+        return {'queue_position': len(ahead) + 1, 'estimated_wait': round(wait, 1)}
+
+    def get(self, job_id):
+        """Job em memória ou, se não estiver mais, reconstruído do armazenamento em disco."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            record = self.store.get(job_id)
+            if record is not None:
+                job = Job.from_record(record)
+        return job
+
+    def load_result(self, job):
+        """Resultado de um job concluído (da memória ou do disco), ou None se não existir mais."""
+        if job.result is not None or self.store is None:
+            return job.result
+        stored = self.store.load_result(job.id)
+        return JobResult(*stored) if stored is not None else None
+
+    def _persist(self, job, with_result=False):
+        if self.store is None or not job.persist:
+            return
+        try:
+            # O arquivo é gravado antes do status "done", para nunca haver job concluído sem resultado
+            if with_result:
+                self.store.save_result(job)
+            self.store.save_job(job)
+            if with_result:
+                self.store.evict()
+        except Exception as e:
+            # O armazenamento em disco é um complemento: o job em memória continua válido
+            logger.error(f"Falha ao gravar o job {job.id} no armazenamento: {e}")
+
+    def counts(self):
+        """Quantidade de jobs por status."""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, ERROR: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._persist(job)
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.exception = e
+            job.error = str(e)
+            job.traceback = traceback.format_exc()
+            job.status = ERROR
+            logger.error(f"Job {job.id} falhou: {e}")
+        finally:
+            job.finished_at = time.time()
+            if job.status == DONE:
+                with self._lock:
+                    self._durations[job.kind].append(job.finished_at - job.started_at)
+            self._persist(job, with_result=job.status == DONE)
+            job._done.set()
+        logger.info(f"Job {job.id} {job.status} em {job.finished_at - job.started_at:.2f}s")
+
+    def _purge(self):
+        # Chamado com o lock: descarta jobs concluídos há mais de `ttl` segundos
+        limit = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < limit:
+                del self._jobs[job_id]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Retorna a fila de jobs do processo, criando-a na primeira chamada (após o fork do gunicorn)."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            workers = int(os.environ.get('RENDER_WORKERS', DEFAULT_RENDER_WORKERS))
+            ttl = int(os.environ.get('JOB_TTL', DEFAULT_JOB_TTL))
+            max_queued = int(os.environ.get('RENDER_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+            _queue = JobQueue(workers, ttl, get_result_store(), max_queued)
+            logger.info(f"Fila de jobs iniciada com {workers} workers de conversão e até {max_queued} jobs aguardando")
+        return _queue
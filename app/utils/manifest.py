@@ -0,0 +1,91 @@
+"""
+Manifesto da conversão em lote incremental.
+
+Guarda, no diretório de saída, o hash de conteúdo de cada arquivo .md
+convertido e o hash dos insumos compartilhados (CSS, logo, capa e fontes).
+Na execução seguinte só são convertidos os arquivos cujo conteúdo mudou,
+cujo PDF sumiu, ou todos eles se algum insumo compartilhado mudou.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+MANIFEST_NAME = '.md_to_pdf_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hash SHA-256 do conteúdo de um arquivo."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def inputs_digest(texts=(), files=()):
+    """
+    Hash combinado dos insumos compartilhados de um lote.
+
+    Args:
+        texts (iterable): Textos que influenciam o resultado (ex.: CSS)
+        files (iterable): Caminhos de arquivos (ou None) cujo conteúdo influencia o resultado
+    """
+    h = hashlib.sha256()
+    for text in texts:
+        h.update(b'text\0' + (text or '').encode('utf-8') + b'\0')
+    for path in files:
+        if path and os.path.isfile(path):
+            h.update(f"file\0{Path(path).name}\0{file_sha256(path)}\0".encode('utf-8'))
+        else:
+            h.update(b'file\0-\0')
+    return h.hexdigest()
+
+
+class BatchManifest:
+    """Manifesto `{arquivo .md: {hash do conteúdo, PDF gerado}}` de um diretório de saída."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.inputs = None
+        self.files = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.inputs = data.get('inputs')
+                self.files = data.get('files', {})
+        except (OSError, ValueError):
+            pass
+
+    def is_fresh(self, name, source_hash, pdf_path):
+        """True se o PDF de `name` existe e foi gerado a partir do mesmo conteúdo."""
+        entry = self.files.get(name)
+        return bool(entry) and entry.get('source') == source_hash and Path(pdf_path).exists()
+
+    def record(self, name, source_hash, pdf_path):
+        self.files[name] = {'source': source_hash, 'pdf': str(pdf_path)}
+
+    def forget(self, name):
+        self.files.pop(name, None)
+
+    def save(self):
+        """Grava o manifesto de forma atômica."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(
+                    {'version': MANIFEST_VERSION, 'inputs': self.inputs, 'files': self.files},
+                    f, ensure_ascii=False, indent=2, sort_keys=True,
+                )
+            os.replace(tmp_name, self.path)
+        except Exception:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,294 @@
+"""
+Backends de conversão Markdown → HTML.
+
+O padrão é o markdown2 (Python puro). Como alternativa mais rápida há o
+markdown-it-py (CommonMark), configurado para produzir o mesmo HTML nos
+recursos usados pelo conversor: tabelas, blocos de código cercados, IDs nos
+títulos, texto riscado, listas de tarefas, notas de rodapé, tipografia
+inteligente e sublinhados literais (modo "code-friendly" do markdown2).
+
+Seleção via ambiente (MARKDOWN_BACKEND) ou `--parser` na CLI. A
+equivalência entre os backends é verificada com `compare_backends` sobre o
+corpus em assets/markdown_corpus (`python md_to_pdf.py --check-parsers`).
+"""
+
+import html
+import os
+import re
+import threading
+import unicodedata
+from html.parser import HTMLParser
+from pathlib import Path
+
+import markdown2
+
+DEFAULT_BACKEND = 'markdown2'
+CORPUS_DIR = Path(__file__).resolve().parent.parent.parent / 'assets' / 'markdown_corpus'
+
+
+def slugify(value):
+    """Slug de título no mesmo formato do markdown2 (header-ids)."""
+    value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
+    value = re.sub(r'[^\w\s-]', '', value).strip().lower()
+    return re.sub(r'[-\s]+', '-', value)
+
+
+class Markdown2Backend:
+    """Backend padrão: markdown2 com as extensões do conversor."""
+
+    name = 'markdown2'
+
+    extras = [
+        'tables',           # Suporte para tabelas
+        'fenced-code-blocks',  # Blocos de código com ```
+        'header-ids',       # IDs automáticos para headers
+        'strike',           # Texto riscado
+        'task_list',        # Listas de tarefas [ ] [x]
+        'footnotes',        # Notas de rodapé
+        'smarty-pants',     # Tipografia inteligente
+        'code-friendly',    # Melhor suporte para código
+    ]
+
+    def convert(self, md_content):
+        return markdown2.markdown(md_content, extras=self.extras)
+
+
+class MarkdownItBackend:
+    """
+    Backend CommonMark (markdown-it-py + mdit-py-plugins), ajustado para
+    gerar o mesmo HTML que o markdown2 com as extensões do conversor.
+    """
+
+    name = 'markdown-it'
+
+    _DASHES = [
+        (re.compile(r'---'), '—'),
+        (re.compile(r'--'), '–'),
+        (re.compile(r'\.\.\.|\. \. \.'), '…'),
+    ]
+
+    def __init__(self):
+        from markdown_it import MarkdownIt
+        from mdit_py_plugins.footnote import footnote_plugin
+        from mdit_py_plugins.tasklists import tasklists_plugin
+
+        md = MarkdownIt('commonmark', {'typographer': True, 'html': True, 'langPrefix': ''})
+        md.enable(['table', 'strikethrough', 'smartquotes'])
+        md.use(tasklists_plugin).use(footnote_plugin)
+        md.core.ruler.after('inline', 'code_friendly', self._code_friendly_rule)
+        md.core.ruler.before('smartquotes', 'smart_dashes', self._dashes_rule)
+        md.core.ruler.push('header_ids', self._header_ids_rule)
+        md.core.ruler.push('plain_task_lists', self._plain_task_lists_rule)
+        # Notas de rodapé com a mesma marcação do markdown2
+        for name in ('footnote_ref', 'footnote_block_open', 'footnote_block_close', 'footnote_open', 'footnote_anchor'):
+            md.add_render_rule(name, getattr(self, f"_render_{name}"))
+        self._md = md
+
+    def convert(self, md_content):
+        return self._md.render(md_content)
+
+    @staticmethod
+    def _code_friendly_rule(state):
+        # Como o "code-friendly" do markdown2: _texto_ e __texto__ não viram ênfase
+        for token in state.tokens:
+            if token.type != 'inline' or not token.children:
+                continue
+            for child in token.children:
+                if child.type in ('em_open', 'em_close', 'strong_open', 'strong_close') and child.markup.startswith('_'):
+                    child.type = 'text'
+                    child.tag = ''
+                    child.nesting = 0
+                    child.content = child.markup
+
+    @classmethod
+    def _dashes_rule(cls, state):
+        # Travessões e reticências como no smarty-pants do markdown2 (sem (c), (tm), +- ...)
+        for token in state.tokens:
+            if token.type != 'inline' or not token.children:
+                continue
+            for child in token.children:
+                if child.type == 'text':
+                    for pattern, replacement in cls._DASHES:
+                        child.content = pattern.sub(replacement, child.content)
+
+    @staticmethod
+    def _header_ids_rule(state):
+        seen = {}
+        tokens = state.tokens
+        for i, token in enumerate(tokens):
+            if token.type != 'heading_open':
+                continue
+            text = ''.join(
+                child.content for child in (tokens[i + 1].children or [])
+                if child.type in ('text', 'code_inline')
+            )
+            slug = slugify(text)
+            count = seen.get(slug, 0) + 1
+            seen[slug] = count
+            token.attrSet('id', slug if count == 1 else f"{slug}-{count}")
+
+    @staticmethod
+    def _plain_task_lists_rule(state):
+        # O markdown2 não marca <li>/<ul> das listas de tarefas com classes
+        for token in state.tokens:
+            if token.type in ('list_item_open', 'bullet_list_open', 'ordered_list_open') and token.attrGet('class'):
+                token.attrs.pop('class', None)
+
+    @staticmethod
+    def _footnote_label(token):
+        return token.meta.get('label') or str(token.meta['id'] + 1)
+
+    @staticmethod
+    def _render_footnote_ref(renderer, tokens, idx, options, env):
+        token = tokens[idx]
+        label = MarkdownItBackend._footnote_label(token)
+        return (
+            f'<sup class="footnote-ref" id="fnref-{label}">'
+            f'<a href="#fn-{label}">{token.meta["id"] + 1}</a></sup>'
+        )
+
+    @staticmethod
+    def _render_footnote_block_open(renderer, tokens, idx, options, env):
+        return '<div class="footnotes">\n<hr />\n<ol>\n'
+
+    @staticmethod
+    def _render_footnote_block_close(renderer, tokens, idx, options, env):
+        return '</ol>\n</div>\n'
+
+    @staticmethod
+    def _render_footnote_open(renderer, tokens, idx, options, env):
+        return f'<li id="fn-{MarkdownItBackend._footnote_label(tokens[idx])}">\n'
+
+    @staticmethod
+    def _render_footnote_anchor(renderer, tokens, idx, options, env):
+        token = tokens[idx]
+        n = token.meta['id'] + 1
+        return (
+            f'&#160;<a href="#fnref-{MarkdownItBackend._footnote_label(token)}" class="footnoteBackLink" '
+            f'title="Jump back to footnote {n} in the text.">&#8617;</a>'
+        )
+
+
+BACKENDS = {
+    Markdown2Backend.name: Markdown2Backend,
+    MarkdownItBackend.name: MarkdownItBackend,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """
+    Retorna o backend `name` (ou o configurado em MARKDOWN_BACKEND), criando-o
+    na primeira chamada.
+    """
+    name = name or os.environ.get('MARKDOWN_BACKEND') or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de markdown desconhecido: {name} (opções: {', '.join(BACKENDS)})")
+    with _instances_lock:
+        backend = _instances.get(name)
+        if backend is None:
+            backend = BACKENDS[name]()
+            _instances[name] = backend
+        return backend
+
+
+class _HtmlStructure(HTMLParser):
+    """Estrutura comparável de um HTML: tags, atributos relevantes e texto normalizado."""
+
+    # Atributos que alteram o PDF (classes de destaque de código e títulos são ignorados)
+    KEPT_ATTRS = ('id', 'href', 'src', 'checked', 'colspan', 'rowspan', 'align')
+    # Marcação de realce de sintaxe (pygments) não altera o texto
+    IGNORED_TAGS = ('span',)
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.items = []
+        self._divs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'div':
+            # <div class="codehilite"> envolve o <pre> quando o pygments está instalado
+            self._divs.append(dict(attrs).get('class') == 'codehilite')
+            if self._divs[-1]:
+                return
+        if tag in self.IGNORED_TAGS:
+            return
+        kept = tuple(sorted((k, v if k != 'checked' else '') for k, v in attrs if k in self.KEPT_ATTRS))
+        self.items.append(('start', tag, kept))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'div' and self._divs and self._divs.pop():
+            return
+        if tag in self.IGNORED_TAGS:
+            return
+        self.items.append(('end', tag))
+
+    def handle_data(self, data):
+        # Trechos consecutivos (ex.: separados por <span> ignorados) formam um único texto
+        if self.items and self.items[-1][0] == 'text':
+            self.items[-1] = ('text', self.items[-1][1] + data)
+        else:
+            self.items.append(('text', data))
+
+
+def html_structure(html_content):
+    parser = _HtmlStructure()
+    parser.feed(html_content)
+    parser.close()
+    items = []
+    for item in parser.items:
+        if item[0] == 'text':
+            text = ' '.join(html.unescape(item[1]).split())
+            if not text:
+                continue
+            item = ('text', text)
+        items.append(item)
+    return items
+
+
+def compare_backends(md_content, first=DEFAULT_BACKEND, second=MarkdownItBackend.name):
+    """
+    Compara o HTML de dois backends para o mesmo markdown.
+
+    Returns:
+        list: Diferenças encontradas (vazia se as saídas forem equivalentes)
+    """
+    a = html_structure(get_backend(first).convert(md_content))
+    b = html_structure(get_backend(second).convert(md_content))
+    diffs = []
+    for i, (item_a, item_b) in enumerate(zip(a, b)):
+        if item_a != item_b:
+            diffs.append(f"#{i}: {first}={item_a!r} {second}={item_b!r}")
+            break
+    if len(a) != len(b) and not diffs:
+        diffs.append(f"tamanhos diferentes: {first}={len(a)} itens, {second}={len(b)} itens")
+    return diffs
+
+
+def check_corpus(paths=None, first=DEFAULT_BACKEND, second=MarkdownItBackend.name, preprocess=None):
+    """
+    Verifica a equivalência dos backends em cada arquivo do corpus.
+
+    Args:
+        paths (list): Arquivos .md (padrão: todos de CORPUS_DIR)
+        preprocess (callable): Transformação aplicada ao markdown antes da conversão (opcional)
+
+    Returns:
+        dict: {arquivo: diferenças} apenas para os arquivos divergentes
+    """
+    paths = paths or sorted(CORPUS_DIR.glob('*.md'))
+    failures = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+        if preprocess:
+            md_content = preprocess(md_content)
+        diffs = compare_backends(md_content, first, second)
+        if diffs:
+            failures[str(path)] = diffs
+    return failures
@@ -1,9 +1,259 @@
-import markdown2
+import base64
+import contextlib
+import hashlib
+import io
+import multiprocessing
 import os
 import re
-from weasyprint import HTML, CSS
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
 import argparse
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+
+try:
+    from app.utils.assets import file_stamp, get_asset_index
+    from app.utils.pdf_cache import PdfCache, get_pdf_cache, make_cache_key
+    from app.utils.manifest import MANIFEST_NAME, BatchManifest, file_sha256, inputs_digest
+    from app.utils.markdown_backends import BACKENDS, check_corpus, get_backend
+    from app.utils.metrics import RENDER_COALESCED, RenderStats, record_render, timed
+    from app.utils.singleflight import SingleFlight
+except ImportError:  # executado como script (python md_to_pdf.py)
+    from assets import file_stamp, get_asset_index
+    from pdf_cache import PdfCache, get_pdf_cache, make_cache_key
+    from manifest import MANIFEST_NAME, BatchManifest, file_sha256, inputs_digest
+    from markdown_backends import BACKENDS, check_corpus, get_backend
+    from metrics import RENDER_COALESCED, RenderStats, record_render, timed
+    from singleflight import SingleFlight
+
+# Quantidade de capas paginadas mantidas em memória por renderer
+COVER_CACHE_SIZE = int(os.environ.get('COVER_CACHE_SIZE', 16))
+
+# CSS padrão para melhor formatação
+DEFAULT_CSS = """
+@page {
+    size: A4;
+    margin: 2cm;
+    @bottom-left {
+        content: element(footer-left);
+    }
+    @bottom-right {
+        content: counter(page);
+        color: #666;
+        font-size: 10px;
+    }
+}
+
+/* Página de capa (sem margens e sem rodapé) */
+@page cover {
+    size: A4;
+    margin: 0;
+    @bottom-left { content: none; }
+    @bottom-right { content: none; }
+}
+.cover-page {
+    page: cover;
+    position: relative;
+    width: 210mm;
+    height: 297mm;
+    overflow: hidden;
+}
+.cover-bg {
+    position: absolute;
+    inset: 0;
+    width: 210mm;
+    height: 297mm;
+    object-fit: contain; /* garantir proporção exata do mockup */
+    object-position: -5mm 0;
+    display: block;
+}
+/* Bloco de contatos no topo direito */
+.cover-top-right {
+    position: absolute; top: 30mm; right: 22mm; width: 75mm;
+    color: #111; font-size: 10pt; line-height: 1.35; text-align: left;
+    font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+}
+.cover-top-right .label { color: #333; font-weight: 600; }
+/* Subtítulo abaixo do "Relatório" no mockup */
+.cover-title-sub {
+    position: absolute; left: 26mm; top: 126mm; width: 120mm;
+    color: #111; font-size: 16pt; font-weight: 700; line-height: 1.2; text-align: left; margin: 0;
+    font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+}
+.cover-desc {
+    position: absolute; left: 26mm; top: 134mm; width: 120mm;
+    color: #555; font-size: 10.5pt; line-height: 1.35; text-align: left; margin: 0;
+    font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+}
+/* Blocos na faixa verde inferior */
+.cover-prep { position: absolute; left: 14mm; bottom: 39mm; width: 120mm; color: #111; text-align: left; font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
+.cover-prep .name { display: block; margin-top: 2mm; font-size: 13pt; font-weight: 700; color: #111; font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
+.cover-prep .contact { margin-top: 1mm; color: #111; font-size: 10.5pt; font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
+.cover-date { position: absolute; right: 72mm; bottom: 49mm; width: 40mm; color: #111; font-size: 11pt; text-align: left; font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
+
+body {
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    line-height: 1.6;
+    color: #333;
+    max-width: 100%;
+    margin: 0 auto;
+    padding: 20px;
+}
+
+/* Títulos com estilo de 'badge' verde arredondado */
+h1, h2, h3, h4, h5, h6 {
+    background-color: #B5FF81;
+    color: #111111;
+    display: table;
+    padding: 6px 12px;
+    border-radius: 12px;
+    border: none;
+    margin-top: 24px;
+    margin-bottom: 16px;
+    font-weight: 600;
+    line-height: 1.25;
+    page-break-inside: avoid;
+    page-break-after: avoid;
+}
+
+h1 {
+    font-size: 2em;
+    border: none;
+    padding-bottom: 0;
+}
+
+h2 {
+    font-size: 1.5em;
+    border: none;
+    padding-bottom: 0;
+}
+
+h3 {
+    font-size: 1.25em;
+    border: none;
+    padding-bottom: 0;
+}
+
+code {
+    background-color: #e4ffda;
+    padding: 2px 4px;
+    border-radius: 2px;
+    font-family: 'Courier New', Courier, monospace;
+    font-size: 0.9em;
+    font-weight: 500;
+}
+
+pre {
+    background-color: #f6f8fa;
+    padding: 16px;
+    border-radius: 6px;
+    overflow-x: auto;
+    line-height: 1.45;
+}
+
+pre code {
+    background-color: transparent;
+    padding: 0;
+}
+
+blockquote {
+    border-left: 4px solid #d0d7de;
+    padding-left: 16px;
+    color: #656d76;
+    margin: 16px 0;
+}
+
+table {
+    border-collapse: collapse;
+    width: 100%;
+    margin: 16px 0;
+    table-layout: fixed;
+    word-wrap: break-word;
+    page-break-inside: auto;
+}
+
+table th,
+table td {
+    border: 1px solid #d0d7de;
+    padding: 6px 10px;
+    text-align: left;
+    overflow-wrap: break-word;
+    word-break: break-word;
+    font-size: 0.88em;
+}
+
+table th {
+    background-color: #f6f8fa;
+    font-weight: 600;
+}
+
+table tr {
+    page-break-inside: avoid;
+}
+
+table tr:nth-child(even) {
+    background-color: #f9f9f9;
+}
+
+ul, ol {
+    margin: 16px 0;
+    padding-left: 2em;
+}
+
+li {
+    margin: 4px 0;
+}
+
+a {
+    color: #0969da;
+    text-decoration: none;
+}
+
+a:hover {
+    text-decoration: underline;
+}
+
+img {
+    max-width: 100%;
+    height: auto;
+    display: block;
+    margin: 16px auto;
+}
+
+hr {
+    border: none;
+    border-top: 2px solid #e1e4e8;
+    margin: 24px 0;
+}
+
+.footnote {
+    font-size: 0.85em;
+    color: #656d76;
+}
+
+.task-list-item {
+    list-style-type: none;
+    margin-left: -1.5em;
+}
+
+.task-list-item input {
+    margin-right: 0.5em;
+}
+
+/* Rodapé com logo no canto inferior esquerdo */
+.footer-left {
+    position: running(footer-left);
+}
+
+.footer-left img {
+    height: 30px; /* Aumenta o tamanho da logo */
+    margin: 0;
+    padding-right: 50mm; /* Move mais para a esquerda */
+    display: inline-block;
+}
+"""
 
 def normalize_markdown_content(content):
     """
@@ -29,312 +279,150 @@ def normalize_markdown_content(content):
 
     return '\n'.join(normalized_lines)
 
-def md_to_pdf(md_file_path, pdf_file_path=None, css_style=None, logo_path=None, base_dir=None, cover_data=None, cover_template_path=None):
+
+def markdown_to_html(md_content):
     """
-    Converte um arquivo Markdown para PDF.
-    
-    Args:
-        md_file_path (str): Caminho do arquivo Markdown de entrada
-        pdf_file_path (str): Caminho do arquivo PDF de saída (opcional)
-        css_style (str): CSS personalizado para estilização (opcional)
-        logo_path (str): Caminho para imagem da logo a exibir no rodapé (opcional). Se não informado, tenta usar 'logo_zoi.png' ao lado do .md ou no diretório base.
-        base_dir (str|Path): Diretório base para recursos (imagens, fonts/). Se None, usa o diretório do arquivo .md.
-        cover_data (dict): Dados para a capa (ex.: subtitulo, descricao, topo_direito_email, topo_direito_site, representante_nome, preparado_nome, preparado_email, preparado_phone, data).
-        cover_template_path (str): Caminho para a imagem da capa em branco (mockup). Se None, tenta localizar automaticamente.
-    
+    Converte Markdown (já normalizado) para HTML com extensões úteis, usando o
+    backend configurado em MARKDOWN_BACKEND (padrão: markdown2).
+    """
+    return get_backend().convert(md_content)
+
+
+# Abertura/fechamento de bloco de código: 3+ crases ou tis (o fechamento usa o
+# mesmo caractere, com pelo menos o mesmo comprimento, e nada além de espaços)
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})(.*)$')
+_FOOTNOTE_DEF_RE = re.compile(r'^\[\^([^\]]+)\]:')
+
+
+def split_markdown_sections(md_content):
+    """
+    Divide o markdown nos títulos de nível 1 (`# Título`), ignorando linhas
+    dentro de blocos de código.
+
+    Usado pelo modo para documentos grandes: cada seção é renderizada em um
+    processo e começa em uma nova página. Definições de notas de rodapé são
+    copiadas para as seções que as referenciam (a numeração das notas
+    recomeça em cada seção).
+
     Returns:
-        str: Caminho do arquivo PDF gerado
+        list: Markdown de cada seção, na ordem do documento
     """
-    # Verificar se o arquivo existe
-    if not os.path.exists(md_file_path):
-        raise FileNotFoundError(f"Arquivo não encontrado: {md_file_path}")
-    
-    # Definir o nome do arquivo PDF de saída se não fornecido
-    if pdf_file_path is None:
-        pdf_file_path = Path(md_file_path).with_suffix('.pdf')
-    
-    # Diretório base para resolução de recursos
-    resolved_base_dir = Path(base_dir).resolve() if base_dir else Path(md_file_path).resolve().parent
+    sections = [[]]
+    footnotes = {}
+    fence = None  # marcador que abriu o bloco de código atual
+    current_footnote = None
+    for line in md_content.split('\n'):
+        match = _FENCE_RE.match(line)
+        if match:
+            marker, rest = match.groups()
+            if fence is None:
+                # Crases não podem aparecer na info string de um bloco aberto com crases
+                if not (marker[0] == '`' and '`' in rest):
+                    fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence) and not rest.strip():
+                fence = None
+                sections[-1].append(line)
+                continue
+        if fence is None:
+            match = _FOOTNOTE_DEF_RE.match(line)
+            if match:
+                current_footnote = match.group(1)
+                footnotes[current_footnote] = [line]
+                continue
+            if current_footnote is not None:
+                # Continuação da definição (linhas indentadas)
+                if line.startswith(('    ', '\t')):
+                    footnotes[current_footnote].append(line)
+                    continue
+                current_footnote = None
+            if line.startswith('# ') and any(l.strip() for l in sections[-1]):
+                sections.append([])
+        sections[-1].append(line)
 
-    # Se logo não for informada, tentar logo_zoi.png ao lado do .md e no assets/images
-    if logo_path is None:
-        candidates = [
-            Path(md_file_path).with_name('logo_zoi.png'),
-            resolved_base_dir / 'assets' / 'images' / 'logo_zoi.png',
-            resolved_base_dir / 'logo_zoi.png',  # fallback para compatibilidade
-        ]
-        for cand in candidates:
-            if cand.exists():
-                logo_path = str(cand)
-                break
-    
-    # Ler o conteúdo do arquivo Markdown
-    with open(md_file_path, 'r', encoding='utf-8') as file:
-        md_content = file.read()
+    result = []
+    for lines in sections:
+        text = '\n'.join(lines)
+        refs = [name for name in footnotes if f"[^{name}]" in text]
+        if refs:
+            text += '\n\n' + '\n'.join('\n'.join(footnotes[name]) for name in refs)
+        if text.strip():
+            result.append(text)
+    return result or [md_content]
 
-    # Normalizar o conteúdo markdown (garantir quebras de linha corretas)
-    md_content = normalize_markdown_content(md_content)
-
-    # Converter Markdown para HTML com extensões úteis
-    html_content = markdown2.markdown(
-        md_content,
-        extras=[
-            'tables',           # Suporte para tabelas
-            'fenced-code-blocks',  # Blocos de código com ```
-            'header-ids',       # IDs automáticos para headers
-            'strike',           # Texto riscado
-            'task_list',        # Listas de tarefas [ ] [x]
-            'footnotes',        # Notas de rodapé
-            'smarty-pants',     # Tipografia inteligente
-            'code-friendly',    # Melhor suporte para código
-        ]
-    )
-    
-    # CSS padrão para melhor formatação
-    default_css = """
-    @page {
-        size: A4;
-        margin: 2cm;
-        @bottom-left {
-            content: element(footer-left);
-        }
-        @bottom-right {
-            content: counter(page);
-            color: #666;
-            font-size: 10px;
-        }
-    }
 
-    /* Página de capa (sem margens e sem rodapé) */
-    @page cover {
-        size: A4;
-        margin: 0;
-        @bottom-left { content: none; }
-        @bottom-right { content: none; }
-    }
-    .cover-page {
-        page: cover;
-        position: relative;
-        width: 210mm;
-        height: 297mm;
-        overflow: hidden;
-    }
-    .cover-bg {
-        position: absolute;
-        inset: 0;
-        width: 210mm;
-        height: 297mm;
-        object-fit: contain; /* garantir proporção exata do mockup */
-        object-position: -5mm 0;
-        display: block;
-    }
-    /* Bloco de contatos no topo direito */
-    .cover-top-right {
-        position: absolute; top: 30mm; right: 22mm; width: 75mm;
-        color: #111; font-size: 10pt; line-height: 1.35; text-align: left;
-        font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-    }
-    .cover-top-right .label { color: #333; font-weight: 600; }
-    /* Subtítulo abaixo do "Relatório" no mockup */
-    .cover-title-sub {
-        position: absolute; left: 26mm; top: 126mm; width: 120mm;
-        color: #111; font-size: 16pt; font-weight: 700; line-height: 1.2; text-align: left; margin: 0;
-        font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-    }
-    .cover-desc {
-        position: absolute; left: 26mm; top: 134mm; width: 120mm;
-        color: #555; font-size: 10.5pt; line-height: 1.35; text-align: left; margin: 0;
-        font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-    }
-    /* Blocos na faixa verde inferior */
-    .cover-prep { position: absolute; left: 14mm; bottom: 39mm; width: 120mm; color: #111; text-align: left; font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
-    .cover-prep .name { display: block; margin-top: 2mm; font-size: 13pt; font-weight: 700; color: #111; font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
-    .cover-prep .contact { margin-top: 1mm; color: #111; font-size: 10.5pt; font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
-    .cover-date { position: absolute; right: 72mm; bottom: 49mm; width: 40mm; color: #111; font-size: 11pt; text-align: left; font-family: 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
-    
-    body {
-        font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        line-height: 1.6;
-        color: #333;
-        max-width: 100%;
-        margin: 0 auto;
-        padding: 20px;
-    }
-    
-    /* Títulos com estilo de 'badge' verde arredondado */
-    h1, h2, h3, h4, h5, h6 {
-        background-color: #B5FF81;
-        color: #111111;
-        display: table;
-        padding: 6px 12px;
-        border-radius: 12px;
-        border: none;
-        margin-top: 24px;
-        margin-bottom: 16px;
-        font-weight: 600;
-        line-height: 1.25;
-        page-break-inside: avoid;
-        page-break-after: avoid;
-    }
-    
-    h1 {
-        font-size: 2em;
-        border: none;
-        padding-bottom: 0;
-    }
-    
-    h2 {
-        font-size: 1.5em;
-        border: none;
-        padding-bottom: 0;
-    }
-    
-    h3 {
-        font-size: 1.25em;
-        border: none;
-        padding-bottom: 0;
-    }
-    
-    code {
-        background-color: #e4ffda;
-        padding: 2px 4px;
-        border-radius: 2px;
-        font-family: 'Courier New', Courier, monospace;
-        font-size: 0.9em;
-        font-weight: 500;
-    }
-    
-    pre {
-        background-color: #f6f8fa;
-        padding: 16px;
-        border-radius: 6px;
-        overflow-x: auto;
-        line-height: 1.45;
-    }
-    
-    pre code {
-        background-color: transparent;
-        padding: 0;
-    }
-    
-    blockquote {
-        border-left: 4px solid #d0d7de;
-        padding-left: 16px;
-        color: #656d76;
-        margin: 16px 0;
-    }
-    
-    table {
-        border-collapse: collapse;
-        width: 100%;
-        margin: 16px 0;
-        table-layout: fixed;
-        word-wrap: break-word;
-        page-break-inside: auto;
-    }
+def build_cover_html(cover_template, cover_data=None):
+    """Monta o HTML da capa: imagem de fundo (mockup) com os campos sobrepostos."""
+    cd = cover_data or {}
+    top_email = cd.get('topo_direito_email', '')
+    top_site = cd.get('topo_direito_site', '')
+    # rótulo desabilitado; mesmo que venha no payload, não será renderizado
+    rep_label = ''
+    rep_nome = cd.get('representante_nome', '')
+    subtitulo = cd.get('subtitulo', '')
+    descricao = cd.get('descricao', '')
+    prep_nome = cd.get('preparado_nome', '')
+    prep_email = cd.get('preparado_email', '')
+    prep_phone = cd.get('preparado_phone', '')
+    data_text = cd.get('data', '')
+    rep_label_html = ""
 
-    table th,
-    table td {
-        border: 1px solid #d0d7de;
-        padding: 6px 10px;
-        text-align: left;
-        overflow-wrap: break-word;
-        word-break: break-word;
-        font-size: 0.88em;
-    }
+    return f"""
+    <section class=\"cover-page\">
+        <img class=\"cover-bg\" src=\"{cover_template}\" alt=\"Capa\" />
+        <div class=\"cover-top-right\">
+            <div>{top_email}</div>
+            <div>{top_site}</div>
+            {rep_label_html}
+            <div>{rep_nome}</div>
+        </div>
+        <div class=\"cover-title-sub\">{subtitulo}</div>
+        <div class=\"cover-desc\">{descricao}</div>
+        <div class=\"cover-prep\">
+            <span class=\"name\">{prep_nome}</span>
+            <div class=\"contact\">{prep_email}</div>
+            <div class=\"contact\">{prep_phone}</div>
+        </div>
+        <div class=\"cover-date\">{data_text}</div>
+    </section>
+    """
 
-    table th {
-        background-color: #f6f8fa;
-        font-weight: 600;
-    }
 
-    table tr {
-        page-break-inside: avoid;
-    }
+# Capa vazia (sem imagem nem campos) que reserva a 1ª página do corpo
+COVER_PLACEHOLDER_HTML = '<section class="cover-page"></section>'
+COVER_BREAK_HTML = '<div style="page-break-after: always;"></div>'
 
-    table tr:nth-child(even) {
-        background-color: #f9f9f9;
-    }
-    
-    ul, ol {
-        margin: 16px 0;
-        padding-left: 2em;
-    }
-    
-    li {
-        margin: 4px 0;
-    }
-    
-    a {
-        color: #0969da;
-        text-decoration: none;
-    }
-    
-    a:hover {
-        text-decoration: underline;
-    }
-    
-    img {
-        max-width: 100%;
-        height: auto;
-        display: block;
-        margin: 16px auto;
-    }
-    
-    hr {
-        border: none;
-        border-top: 2px solid #e1e4e8;
-        margin: 24px 0;
-    }
-    
-    .footnote {
-        font-size: 0.85em;
-        color: #656d76;
-    }
-    
-    .task-list-item {
-        list-style-type: none;
-        margin-left: -1.5em;
-    }
-    
-    .task-list-item input {
-        margin-right: 0.5em;
-    }
 
-    /* Rodapé com logo no canto inferior esquerdo */
-    .footer-left {
-        position: running(footer-left);
-    }
+def _html_document(footer_logo_html, cover_html, html_content):
+    """Monta o HTML completo do documento (rodapé, capa e conteúdo)."""
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    </head>
+    <body>
+        {footer_logo_html}
+        {cover_html}
+        {html_content}
+    </body>
+    </html>
+    """
 
-    .footer-left img {
-        height: 30px; /* Aumenta o tamanho da logo */
-        margin: 0;
-        padding-right: 50mm; /* Move mais para a esquerda */
-        display: inline-block;
-    }
+
+def build_fonts_css(assets):
     """
-    
-    # Usar CSS padrão e, se houver, anexar CSS personalizado para sobrescrever o padrão
-    css_to_use = f"{default_css}\n{css_style}" if css_style else default_css
-
-    # Fonte customizada: procurar arquivos na pasta 'fonts' ao lado do .md
-    fonts_dir = resolved_base_dir / 'fonts'
-
-    def _find_font(fonts_dir: Path, name_candidates):
-        if not fonts_dir.is_dir():
-            return None
-        exts = ['.woff2', '.woff', '.ttf', '.otf']
-        files = list(fonts_dir.glob('*'))
-        for cand in name_candidates:
-            for f in files:
-                if not f.is_file():
-                    continue
-                if f.suffix.lower() in exts and cand in f.stem.lower():
-                    return f.name
-        return None
+    Monta as regras @font-face para as fontes encontradas no índice de recursos.
 
-    clash_file = _find_font(fonts_dir, ['clash'])
-    Satoshi_file = _find_font(fonts_dir, ['Satoshi'])
+    Returns:
+        str: CSS das fontes detectadas (vazio se nenhuma for encontrada)
+    """
+    def _font_url(font_path):
+        # URL como na versão original: nome do arquivo de fonts/ sob assets/fonts
+        return f"assets/fonts/{font_path.name}" if font_path else None
+
+    clash_file = _font_url(assets.find_font(['clash']))
+    Satoshi_file = _font_url(assets.find_font(['Satoshi']))
 
     fonts_css_parts = []
     if clash_file:
@@ -342,7 +430,7 @@ def md_to_pdf(md_file_path, pdf_file_path=None, css_style=None, logo_path=None,
             f"""
             @font-face {{
                 font-family: 'Clash';
-                src: url('assets/fonts/{clash_file}');
+                src: url('{clash_file}');
                 font-weight: 400;
                 font-style: normal;
             }}
@@ -353,7 +441,7 @@ def md_to_pdf(md_file_path, pdf_file_path=None, css_style=None, logo_path=None,
             f"""
             @font-face {{
                 font-family: 'Satoshi';
-                src: url('assets/fonts/{Satoshi_file}');
+                src: url('{Satoshi_file}');
                 font-weight: 400;
                 font-style: normal;
             }}
@@ -368,100 +456,773 @@ def md_to_pdf(md_file_path, pdf_file_path=None, css_style=None, logo_path=None,
             h1, h2, h3, h4, h5, h6 { font-family: 'Clash', 'Satoshi', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; }
             """
         )
-        css_to_use = f"{css_to_use}\n{''.join(fonts_css_parts)}"
-    
-    # Elemento de rodapé (logo) como running element para @page @bottom-left
-    footer_logo_html = f"<div class=\"footer-left\"><img src=\"{logo_path}\" alt=\"logo\"></div>" if logo_path else ""
-
-    # Construir capa, se houver template
-    def _find_cover_template():
-        if cover_template_path and Path(cover_template_path).exists():
-            return str(cover_template_path)
-        candidates = [
-            resolved_base_dir / 'assets' / 'images' / 'capa mockup.jpg',
-            resolved_base_dir / 'assets' / 'images' / 'capa_mockup.jpg',
-            resolved_base_dir / 'assets' / 'images' / 'capa-mockup.jpg',
-            resolved_base_dir / 'assets' / 'images' / 'capa.png',
-            resolved_base_dir / 'assets' / 'images' / 'capa.jpg',
-            # Fallbacks para compatibilidade
-            resolved_base_dir / 'capa mockup.jpg',
-            resolved_base_dir / 'capa_mockup.jpg',
-            resolved_base_dir / 'capa-mockup.jpg',
-            resolved_base_dir / 'capa.png',
-            resolved_base_dir / 'capa.jpg',
-        ]
-        for c in candidates:
-            if c.exists():
-                return str(c)
-        return None
+    return ''.join(fonts_css_parts)
 
-    cover_template = _find_cover_template()
 
-    cover_html = ""
-    if cover_template:
-        cd = cover_data or {}
-        top_email = cd.get('topo_direito_email', '')
-        top_site = cd.get('topo_direito_site', '')
-        # rótulo desabilitado; mesmo que venha no payload, não será renderizado
-        rep_label = ''
-        rep_nome = cd.get('representante_nome', '')
-        subtitulo = cd.get('subtitulo', '')
-        descricao = cd.get('descricao', '')
-        prep_nome = cd.get('preparado_nome', '')
-        prep_email = cd.get('preparado_email', '')
-        prep_phone = cd.get('preparado_phone', '')
-        data_text = cd.get('data', '')
-        rep_label_html = ""
-
-        cover_html = f"""
-        <section class=\"cover-page\">
-            <img class=\"cover-bg\" src=\"{cover_template}\" alt=\"Capa\" />
-            <div class=\"cover-top-right\">
-                <div>{top_email}</div>
-                <div>{top_site}</div>
-                {rep_label_html}
-                <div>{rep_nome}</div>
-            </div>
-            <div class=\"cover-title-sub\">{subtitulo}</div>
-            <div class=\"cover-desc\">{descricao}</div>
-            <div class=\"cover-prep\">
-                <span class=\"name\">{prep_nome}</span>
-                <div class=\"contact\">{prep_email}</div>
-                <div class=\"contact\">{prep_phone}</div>
-            </div>
-            <div class=\"cover-date\">{data_text}</div>
-        </section>
-        <div style=\"page-break-after: always;\"></div>
+class PdfRenderer:
+    """
+    Renderizador reutilizável para um diretório base de recursos.
+
+    Mantém o CSS padrão e as regras @font-face já processados pelo WeasyPrint
+    (objetos `CSS`) e uma `FontConfiguration` compartilhada, de modo que cada
+    conversão só precise processar o HTML do markdown e o CSS personalizado.
+    Use `get_renderer` para obter a instância do processo.
+
+    O WeasyPrint (import lento) só é importado quando o primeiro renderer é
+    criado, e não ao importar este módulo.
+    """
+
+    def __init__(self, base_dir):
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        self.base_dir = Path(base_dir).resolve()
+        self.base_url = str(self.base_dir)
+        self.assets = get_asset_index(self.base_dir)
+        self.font_config = FontConfiguration()
+        self.default_stylesheet = CSS(
+            string=DEFAULT_CSS, base_url=self.base_url, font_config=self.font_config
+        )
+        self._fonts_lock = threading.Lock()
+        self._fonts_version = None
+        self._fonts_stylesheet = None
+        self._cover_lock = threading.Lock()
+        self._cover_pages = OrderedDict()
+        self.cover_hits = 0
+        self.cover_misses = 0
+
+    @property
+    def fonts_stylesheet(self):
         """
+        CSS das fontes detectadas, refeito apenas quando o índice de recursos
+        muda (fonte adicionada, removida ou substituída).
+        """
+        from weasyprint import CSS
 
-    # Criar o HTML completo
-    full_html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <style>
-            {css_to_use}
-        </style>
-    </head>
-    <body>
-        {footer_logo_html}
-        {cover_html}
-        {html_content}
-    </body>
-    </html>
+        version = self.assets.version
+        with self._fonts_lock:
+            if version != self._fonts_version:
+                fonts_css = build_fonts_css(self.assets)
+                self._fonts_stylesheet = CSS(
+                    string=fonts_css, base_url=self.base_url, font_config=self.font_config
+                ) if fonts_css else None
+                self._fonts_version = version
+            return self._fonts_stylesheet
+
+    def stylesheets(self, css_style=None):
+        """
+        Lista de folhas de estilo na ordem da cascata: padrão, personalizada
+        (sobrescreve o padrão) e fontes detectadas.
+        """
+        from weasyprint import CSS
+
+        sheets = [self.default_stylesheet]
+        if css_style:
+            sheets.append(CSS(string=css_style, base_url=self.base_url, font_config=self.font_config))
+        fonts_stylesheet = self.fonts_stylesheet
+        if fonts_stylesheet is not None:
+            sheets.append(fonts_stylesheet)
+        return sheets
+
+    def render(self, html_string, css_style=None):
+        """
+        Faz o layout do HTML sem gerar o PDF.
+
+        Returns:
+            weasyprint.Document: Documento paginado
+        """
+        from weasyprint import HTML
+
+        html = HTML(string=html_string, base_url=self.base_url)
+        return html.render(
+            stylesheets=self.stylesheets(css_style),
+            font_config=self.font_config,
+        )
+
+    def render_document(self, footer_logo_html, cover_html, html_content, css_style=None, stats=None):
+        """
+        Faz o layout do documento completo (rodapé, capa e conteúdo).
+
+        A capa é renderizada à parte (e reaproveitada enquanto os dados da capa
+        forem os mesmos); o corpo reserva a 1ª página com uma capa vazia, de modo
+        que a numeração das páginas continue igual, e essa página é substituída.
+        Com `stats` (RenderStats), mede as fases `html` e `layout`.
+
+        Returns:
+            weasyprint.Document: Documento paginado
+        """
+        with timed(stats, 'html'):
+            cover_block = COVER_PLACEHOLDER_HTML + COVER_BREAK_HTML if cover_html else ''
+            full_html = _html_document(footer_logo_html, cover_block, html_content)
+        with timed(stats, 'layout'):
+            document = self.render(full_html, css_style=css_style)
+            if not cover_html:
+                return document
+            cover_page = self.cover_page(cover_html, css_style=css_style)
+            return document.copy([cover_page] + document.pages[1:])
+
+    def cover_page(self, cover_html, css_style=None):
+        """
+        Página de capa já paginada para `cover_html`, guardada em um cache LRU
+        (`COVER_CACHE_SIZE` entradas) por hash da capa, CSS e versão dos recursos.
+        O layout e a imagem de fundo da capa são processados uma única vez.
+        """
+        key = hashlib.sha256(
+            f"{cover_html}\0{css_style or ''}\0{self.assets.version}".encode('utf-8')
+        ).hexdigest()
+        with self._cover_lock:
+            page = self._cover_pages.get(key)
+            if page is not None:
+                self._cover_pages.move_to_end(key)
+                self.cover_hits += 1
+                return page
+            self.cover_misses += 1
+
+        document = self.render(_html_document('', cover_html, ''), css_style=css_style)
+        page = document.pages[0]
+        with self._cover_lock:
+            self._cover_pages[key] = page
+            while len(self._cover_pages) > COVER_CACHE_SIZE:
+                self._cover_pages.popitem(last=False)
+        return page
+
+    def write_pdf(self, html_string, target=None, css_style=None):
+        """
+        Converte o HTML em PDF usando as folhas de estilo pré-processadas.
+
+        Returns:
+            bytes | None: O PDF em bytes se `target` for None
+        """
+        from weasyprint import HTML
+
+        html = HTML(string=html_string, base_url=self.base_url)
+        return html.write_pdf(
+            target,
+            stylesheets=self.stylesheets(css_style),
+            font_config=self.font_config,
+        )
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(base_dir):
+    """
+    Retorna o `PdfRenderer` do processo para `base_dir`, criando-o na
+    primeira chamada.
+    """
+    key = str(Path(base_dir).resolve())
+    with _renderers_lock:
+        renderer = _renderers.get(key)
+        if renderer is None:
+            renderer = PdfRenderer(key)
+            _renderers[key] = renderer
+        return renderer
+
+
+def _resolve_default_logo(md_file_path, resolved_base_dir, assets):
+    """Logo padrão: logo_zoi.png ao lado do .md, em assets/images ou na raiz do diretório base."""
+    md_dir = Path(md_file_path).resolve().parent
+    md_side_logo = md_dir / 'logo_zoi.png'
+    if md_dir != resolved_base_dir and md_side_logo.exists():
+        return str(md_side_logo)
+    indexed_logo = assets.find_logo(prefer_root=md_dir == resolved_base_dir)
+    return str(indexed_logo) if indexed_logo else None
+
+
+# Tipos de imagem aceitos para a logo em bytes (assinatura → MIME)
+_LOGO_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'RIFF', 'image/webp'),
+]
+
+
+def _logo_data_uri(logo_bytes):
+    """Data URI da logo recebida em bytes (PNG, JPG, GIF, WebP ou SVG)."""
+    mime = 'image/svg+xml'
+    for signature, signature_mime in _LOGO_SIGNATURES:
+        if logo_bytes.startswith(signature):
+            mime = signature_mime
+            break
+    return f"data:{mime};base64,{base64.b64encode(logo_bytes).decode('ascii')}"
+
+
+def _resolve_cover_template(cover_template_path, assets):
+    """Imagem da capa: o caminho informado, se existir, ou a encontrada no índice de recursos."""
+    if cover_template_path and Path(cover_template_path).exists():
+        return str(cover_template_path)
+    indexed_cover = assets.find_cover_template()
+    return str(indexed_cover) if indexed_cover else None
+
+
+def render_pdf(markdown, css_style=None, logo=None, base_dir=None, cover_data=None, cover_template_path=None, large_document=False, workers=None, stats=None):
+    """
+    Converte Markdown para PDF em memória, sem gravar arquivos.
+
+    Args:
+        markdown (str): Conteúdo Markdown
+        css_style (str): CSS personalizado para estilização (opcional)
+        logo (bytes|str): Logo do rodapé, em bytes (PNG/JPG/GIF/WebP/SVG) ou caminho de arquivo.
+            Se None, usa a logo padrão do diretório base.
+        base_dir (str|Path): Diretório base para recursos (imagens, fonts/). Se None, usa o diretório atual.
+        cover_data (dict): Dados para a capa (ver `md_to_pdf`)
+        cover_template_path (str): Caminho para a imagem da capa em branco (mockup). Se None, tenta localizar automaticamente.
+        large_document (bool): Modo para documentos grandes (ver `md_to_pdf`)
+        workers (int): Número de processos do modo para documentos grandes (padrão: núcleos da CPU).
+        stats (RenderStats): Recebe o tempo de cada fase, páginas e tamanhos (opcional).
+            As medições são sempre registradas nos histogramas do processo.
+
+    Returns:
+        bytes: Conteúdo do PDF
+    """
+    if stats is None:
+        stats = RenderStats()
+    stats.input_bytes = len(markdown.encode('utf-8'))
+    resolved_base_dir = Path(base_dir).resolve() if base_dir else Path.cwd()
+    assets = get_asset_index(resolved_base_dir)
+
+    if logo is None:
+        indexed_logo = assets.find_logo()
+        logo = str(indexed_logo) if indexed_logo else None
+    logo_src = _logo_data_uri(logo) if isinstance(logo, bytes) else logo
+
+    # Normalizar o conteúdo markdown (garantir quebras de linha corretas)
+    with stats.phase('normalize'):
+        md_content = normalize_markdown_content(markdown)
+
+    with stats.phase('html'):
+        # Elemento de rodapé (logo) como running element para @page @bottom-left
+        footer_logo_html = f"<div class=\"footer-left\"><img src=\"{logo_src}\" alt=\"logo\"></div>" if logo_src else ""
+
+        # Construir capa, se houver template
+        cover_template = _resolve_cover_template(cover_template_path, assets)
+        cover_html = build_cover_html(cover_template, cover_data) if cover_template else ""
+
+    # Converter HTML para PDF (CSS padrão e fontes já pré-processados no renderer)
+    renderer = get_renderer(resolved_base_dir)
+    sections = split_markdown_sections(md_content) if large_document else [md_content]
+    if len(sections) > 1 and workers != 1:
+        pdf_bytes = _write_sections_pdf(renderer, sections, footer_logo_html, cover_html, css_style, workers, stats)
+    else:
+        with stats.phase('markdown'):
+            html_content = markdown_to_html(md_content)
+        document = renderer.render_document(footer_logo_html, cover_html, html_content, css_style=css_style, stats=stats)
+        with stats.phase('write'):
+            pdf_bytes = document.write_pdf()
+        stats.pages = len(document.pages)
+
+    stats.output_bytes = len(pdf_bytes)
+    record_render(stats)
+    return pdf_bytes
+
+
+# Pool de processos das conversões do servidor (RENDER_PROCESSES; 0 = na própria thread)
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """
+    Retorna o pool de processos de renderização, ou None se desativado
+    (RENDER_PROCESSES=0, o padrão no modo WSGI). É criado na primeira chamada,
+    depois do fork dos workers do servidor.
+    """
+    global _render_pool
+    processes = int(os.environ.get('RENDER_PROCESSES', 0))
+    if processes <= 0:
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn: o processo do servidor tem threads, e fork com threads não é seguro
+            _render_pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+            print(f"Pool de renderização iniciado com {processes} processos")
+        return _render_pool
+
+
+def _render_pdf_worker(args, kwargs):
+    stats = RenderStats()
+    return render_pdf(*args, stats=stats, **kwargs), stats
+
+
+def render_pdf_pooled(*args, stats=None, **kwargs):
+    """
+    `render_pdf` executado no pool de processos de renderização, se configurado
+    (ver `get_render_pool`), liberando o processo do servidor do trabalho de CPU.
+    As medições do processo filho são somadas a `stats` e registradas nos
+    histogramas deste processo.
+
+    Returns:
+        bytes: Conteúdo do PDF
     """
+    pool = get_render_pool()
+    if pool is None:
+        return render_pdf(*args, stats=stats, **kwargs)
+
+    pdf_bytes, child_stats = pool.submit(_render_pdf_worker, args, kwargs).result()
+    record_render(child_stats)
+    if stats is not None:
+        for name, seconds in child_stats.phases.items():
+            stats.phases[name] = stats.phases.get(name, 0.0) + seconds
+        stats.pages = child_stats.pages
+        stats.input_bytes = child_stats.input_bytes
+        stats.output_bytes = child_stats.output_bytes
+    return pdf_bytes
+
+
+def _read_md_file(md_file_path, pdf_file_path, logo_path, base_dir):
+    """
+    Lê o arquivo .md e resolve os padrões da conversão a partir do seu caminho.
+
+    Returns:
+        tuple: (markdown, caminho do PDF, logo, diretório base)
+    """
+    # Verificar se o arquivo existe
+    if not os.path.exists(md_file_path):
+        raise FileNotFoundError(f"Arquivo não encontrado: {md_file_path}")
+
+    # Definir o nome do arquivo PDF de saída se não fornecido
+    if pdf_file_path is None:
+        pdf_file_path = Path(md_file_path).with_suffix('.pdf')
+
+    # Diretório base para resolução de recursos
+    resolved_base_dir = Path(base_dir).resolve() if base_dir else Path(md_file_path).resolve().parent
+
+    # Se logo não for informada, tentar logo_zoi.png ao lado do .md e no assets/images
+    if logo_path is None:
+        logo_path = _resolve_default_logo(md_file_path, resolved_base_dir, get_asset_index(resolved_base_dir))
+
+    with open(md_file_path, 'r', encoding='utf-8') as file:
+        md_content = file.read()
+    return md_content, pdf_file_path, logo_path, resolved_base_dir
+
+
+def md_to_pdf(md_file_path, pdf_file_path=None, css_style=None, logo_path=None, base_dir=None, cover_data=None, cover_template_path=None, large_document=False, workers=None):
+    """
+    Converte um arquivo Markdown para PDF.
     
-    # Converter HTML para PDF
-    html = HTML(string=full_html, base_url=str(resolved_base_dir))
-    html.write_pdf(pdf_file_path)
+    Args:
+        md_file_path (str): Caminho do arquivo Markdown de entrada
+        pdf_file_path (str): Caminho do arquivo PDF de saída (opcional)
+        css_style (str): CSS personalizado para estilização (opcional)
+        logo_path (str): Caminho para imagem da logo a exibir no rodapé (opcional). Se não informado, tenta usar 'logo_zoi.png' ao lado do .md ou no diretório base.
+        base_dir (str|Path): Diretório base para recursos (imagens, fonts/). Se None, usa o diretório do arquivo .md.
+        cover_data (dict): Dados para a capa (ex.: subtitulo, descricao, topo_direito_email, topo_direito_site, representante_nome, preparado_nome, preparado_email, preparado_phone, data).
+        cover_template_path (str): Caminho para a imagem da capa em branco (mockup). Se None, tenta localizar automaticamente.
+        large_document (bool): Modo para documentos grandes: divide o markdown nos títulos de nível 1
+            e renderiza as seções em paralelo (ver `split_markdown_sections`).
+        workers (int): Número de processos do modo para documentos grandes (padrão: núcleos da CPU).
+    
+    Returns:
+        str: Caminho do arquivo PDF gerado
+    """
+    md_content, pdf_file_path, logo_path, resolved_base_dir = _read_md_file(md_file_path, pdf_file_path, logo_path, base_dir)
+    pdf_bytes = render_pdf(
+        md_content, css_style, logo_path, resolved_base_dir, cover_data, cover_template_path, large_document, workers
+    )
+    Path(pdf_file_path).write_bytes(pdf_bytes)
     
     print(f"✓ PDF criado com sucesso: {pdf_file_path}")
     return pdf_file_path
 
 
-def batch_convert(directory, output_dir=None, css_style=None, logo_path=None):
+# Seções do modo para documentos grandes: sem número de página (aplicado depois)
+SECTION_CSS = "@page { @bottom-right { content: none; } }"
+
+# Documento só com os números das páginas, sobreposto às seções já unidas
+PAGE_NUMBERS_CSS = """
+@page { background: none; @bottom-left { content: none; } }
+html, body { background: none; }
+"""
+
+
+def _render_section(base_dir, footer_logo_html, cover_html, section_md, css_style=None):
+    """
+    Renderiza uma seção do modo para documentos grandes (em um processo do pool).
+
+    Returns:
+        tuple: (PDF da seção em bytes, número de páginas)
+    """
+    renderer = get_renderer(base_dir)
+    section_css = f"{css_style}\n{SECTION_CSS}" if css_style else SECTION_CSS
+    document = renderer.render_document(footer_logo_html, cover_html, markdown_to_html(section_md), css_style=section_css)
+    return document.write_pdf(), len(document.pages)
+
+
+def _write_sections_pdf(renderer, sections, footer_logo_html, cover_html, css_style, workers=None, stats=None):
+    """
+    Renderiza as seções em paralelo e as une em um único PDF.
+
+    As seções são geradas sem o número de página; depois de unidas, cada página
+    recebe por sobreposição o número correspondente de um documento leve com as
+    mesmas páginas (a capa continua sem número), mantendo a numeração contínua.
+    Com `stats`, mede as fases `sections` (renderização paralela) e `merge`.
+
+    Returns:
+        bytes: Conteúdo do PDF unido
+    """
+    base_dir = str(renderer.base_dir)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(sections)))
+    print(f"Documento grande: {len(sections)} seções em {workers} processos")
+    with timed(stats, 'sections'), ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_batch_worker, initargs=(base_dir,)
+    ) as pool:
+        futures = [
+            pool.submit(_render_section, base_dir, footer_logo_html, cover_html if i == 0 else '', section, css_style)
+            for i, section in enumerate(sections)
+        ]
+        rendered = [future.result() for future in futures]
+
+    with timed(stats, 'merge'):
+        return _merge_sections(renderer, rendered, cover_html, css_style, stats)
+
+
+def _merge_sections(renderer, rendered, cover_html, css_style, stats=None):
+    """Une os PDFs das seções e sobrepõe a numeração contínua das páginas."""
+    from pypdf import PdfReader, PdfWriter
+
+    total_pages = sum(page_count for _, page_count in rendered)
+    page_divs = ['<div>&nbsp;</div>'] + ['<div style="page-break-before: always;">&nbsp;</div>'] * (total_pages - 1)
+    if cover_html:
+        page_divs[0] = COVER_PLACEHOLDER_HTML
+    numbers_css = f"{css_style}\n{PAGE_NUMBERS_CSS}" if css_style else PAGE_NUMBERS_CSS
+    numbers_pdf = renderer.write_pdf(_html_document('', '', ''.join(page_divs)), css_style=numbers_css)
+
+    writer = PdfWriter()
+    for pdf_bytes, _ in rendered:
+        for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+            writer.add_page(page)
+    for page, numbers_page in zip(writer.pages, PdfReader(io.BytesIO(numbers_pdf)).pages):
+        page.merge_page(numbers_page)
+    output = io.BytesIO()
+    writer.write(output)
+    if stats is not None:
+        stats.pages = total_pages
+    return output.getvalue()
+
+
+def render_cache_key(markdown, css_style=None, logo=None, base_dir=None, cover_data=None, cover_template_path=None, large_document=False):
+    """
+    Calcula a chave de cache de uma conversão com os mesmos argumentos de `render_pdf`.
+
+    Returns:
+        str: Hash do markdown normalizado, CSS, capa, logo e versão dos recursos
+    """
+    resolved_base_dir = Path(base_dir).resolve() if base_dir else Path.cwd()
+    assets = get_asset_index(resolved_base_dir)
+
+    if logo is None:
+        logo = assets.find_logo()
+    logo_bytes = logo if isinstance(logo, bytes) else None
+
+    extra = {
+        'base_dir': str(resolved_base_dir),
+        'large_document': bool(large_document),
+        'markdown_backend': get_backend().name,
+    }
+    if logo and logo_bytes is None:
+        # Logo em arquivo: hash memorizado no índice, sem reler a imagem a cada conversão
+        extra['logo_file'] = assets.file_digest(logo)
+    # Capa e fontes efetivamente usadas, com tamanho e mtime: um arquivo
+    # sobrescrito no lugar muda a chave mesmo antes de o índice ser refeito
+    cover_template = _resolve_cover_template(cover_template_path, assets)
+    if cover_template:
+        extra['cover_template'] = [cover_template, file_stamp(cover_template)]
+    extra['fonts'] = [
+        [str(font), file_stamp(font)]
+        for font in (assets.find_font(['clash']), assets.find_font(['Satoshi'])) if font
+    ]
+
+    md_content = normalize_markdown_content(markdown)
+    return make_cache_key(md_content, css_style, cover_data, logo_bytes, assets.version, extra)
+
+
+def _flight_key(markdown, css_style=None, logo=None, base_dir=None, cover_data=None, cover_template_path=None, large_document=False):
+    # Sem cache, a chave só serve para coalescer conversões simultâneas: basta a
+    # entrada como veio (sem normalizar o markdown nem ler os recursos)
+    if isinstance(logo, bytes):
+        logo_bytes, logo = logo, None
+    else:
+        logo_bytes, logo = None, [str(logo), file_stamp(logo)] if logo else None
+    extra = {
+        'base_dir': str(base_dir or ''),
+        'logo': logo,
+        'cover_template': str(cover_template_path or ''),
+        'large_document': bool(large_document),
+        'flight': True,
+    }
+    return make_cache_key(markdown, css_style, cover_data, logo_bytes, '', extra)
+
+
+# Conversões idênticas simultâneas (ex.: duplo clique, retentativa após timeout do proxy)
+_render_flight = SingleFlight()
+
+
+def cached_render_pdf(markdown, css_style=None, logo=None, base_dir=None, cover_data=None, cover_template_path=None, cache=None, large_document=False, workers=None, stats=None):
+    """
+    Converte Markdown para PDF em memória consultando antes o cache de PDFs.
+
+    Chamadas simultâneas com a mesma entrada (mesma chave de cache) são
+    coalescidas: só a primeira renderiza, as demais aguardam e recebem o
+    mesmo PDF, mesmo com o cache desativado.
+
+    Recebe os mesmos argumentos de `render_pdf`, mais:
+        cache (PdfCache): Cache a usar. Se None, usa o configurado via PDF_CACHE_DIR.
+    Com `stats`, o cálculo da chave e a consulta ao cache são medidos como a fase
+    `cache` e a espera por uma conversão idêntica como a fase `coalesced`. Com o
+    cache desativado, a chave de cache não é calculada (nem a fase `cache` medida).
+
+    Returns:
+        tuple: (PDF em bytes, status: 'HIT', 'MISS', 'SHARED' se veio de uma conversão
+            idêntica em andamento, ou None se o cache estiver desativado)
+    """
+    args = (markdown, css_style, logo, base_dir, cover_data, cover_template_path)
+    if cache is None:
+        cache = get_pdf_cache()
+
+    if cache is None:
+        key = _flight_key(*args, large_document)
+        pdf_bytes = None
+    else:
+        with timed(stats, 'cache'):
+            key = render_cache_key(*args, large_document)
+            pdf_bytes = cache.read(key)
+    if pdf_bytes is not None:
+        if stats is not None:
+            stats.cache = 'HIT'
+            stats.input_bytes = len(markdown.encode('utf-8'))
+            stats.output_bytes = len(pdf_bytes)
+        return pdf_bytes, 'HIT'
+
+    def _render():
+        pdf = render_pdf_pooled(*args, large_document, workers, stats=stats)
+        if cache is not None:
+            try:
+                cache.put_bytes(key, pdf)
+            except Exception as e:
+                # O PDF já foi gerado: uma falha no cache (disco cheio, volume) não derruba a conversão
+                print(f"⚠️  Falha ao gravar o PDF no cache: {e}")
+        return pdf
+
+    start = time.perf_counter()
+    pdf_bytes, shared = _render_flight.do(key, _render)
+    if shared:
+        RENDER_COALESCED.inc()
+        if stats is not None:
+            stats.phases['coalesced'] = time.perf_counter() - start
+            stats.cache = 'SHARED'
+            stats.input_bytes = len(markdown.encode('utf-8'))
+            stats.output_bytes = len(pdf_bytes)
+        return pdf_bytes, 'SHARED'
+
+    status = 'MISS' if cache is not None else None
+    if stats is not None:
+        stats.cache = status
+    return pdf_bytes, status
+
+
+def cached_md_to_pdf(md_file_path, pdf_file_path=None, css_style=None, logo_path=None, base_dir=None, cover_data=None, cover_template_path=None, cache=None, large_document=False, workers=None):
+    """
+    Converte um arquivo Markdown para PDF consultando antes o cache de PDFs.
+
+    Em caso de acerto o PDF vem do cache, sem passar pelo WeasyPrint.
+    Recebe os mesmos argumentos de `md_to_pdf`, mais:
+        cache (PdfCache): Cache a usar. Se None, usa o configurado via PDF_CACHE_DIR.
+
+    Returns:
+        tuple: (caminho do PDF gerado, status do cache: ver `cached_render_pdf`)
+    """
+    md_content, pdf_file_path, logo_path, resolved_base_dir = _read_md_file(md_file_path, pdf_file_path, logo_path, base_dir)
+    pdf_bytes, cache_status = cached_render_pdf(
+        md_content, css_style, logo_path, resolved_base_dir, cover_data, cover_template_path,
+        cache=cache, large_document=large_document, workers=workers,
+    )
+    Path(pdf_file_path).write_bytes(pdf_bytes)
+
+    if cache_status == 'HIT':
+        print(f"✓ PDF obtido do cache: {pdf_file_path}")
+    else:
+        print(f"✓ PDF criado com sucesso: {pdf_file_path}")
+    return pdf_file_path, cache_status
+
+
+# Estado dos processos do pool de conversão em lote (ver _init_batch_worker)
+_worker_cache = None
+
+
+def _init_batch_worker(base_dir, cache_dir=None, cache_max_bytes=None):
+    """
+    Inicializa um processo do pool de conversão em lote: carrega uma única vez
+    o renderer (CSS padrão e fontes) e abre o cache de PDFs, se houver.
+    """
+    global _worker_cache
+    # Pré-carrega o CSS padrão e o das fontes detectadas
+    get_renderer(base_dir).stylesheets()
+    if cache_dir:
+        _worker_cache = PdfCache(cache_dir, cache_max_bytes)
+
+
+def _run_batch_item(file, pdf, convert):
+    """
+    Executa `convert()` (que retorna a saída e o status do cache) para um
+    arquivo do lote, sem interromper o lote em caso de erro.
+
+    Returns:
+        tuple: (resultado — arquivo, pdf, ok, erro, segundos, cache —, saída ou None)
+    """
+    result = {'file': file, 'pdf': pdf, 'ok': False, 'error': None, 'seconds': 0.0, 'cache': None}
+    output = None
+    start = time.perf_counter()
+    try:
+        output, result['cache'] = convert()
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result, output
+
+
+def _convert_batch_file(md_file, pdf_path, css_style, logo_path, cache=None):
+    """
+    Converte um arquivo do lote, sem interromper o lote em caso de erro.
+
+    Returns:
+        dict: Resultado (arquivo, pdf, ok, erro, segundos, cache)
+    """
+    def convert():
+        # A saída é impressa pelo processo principal, na ordem dos arquivos
+        with contextlib.redirect_stdout(io.StringIO()):
+            return cached_md_to_pdf(str(md_file), str(pdf_path), css_style, logo_path, cache=cache or _worker_cache)
+
+    result, _ = _run_batch_item(str(md_file), str(pdf_path), convert)
+    return result
+
+
+def convert_markdown_batch(documents, css_style=None, logo=None, base_dir=None, cover_data=None, workers=None, cache=None, submit=None):
+    """
+    Converte vários documentos em memória, em paralelo, com a semântica do lote
+    da CLI (`batch_convert`): cada arquivo vira `<nome>.pdf`, um erro não
+    interrompe os demais e cada resultado tem o mesmo formato.
+
+    As conversões passam por `cached_render_pdf` (cache, coalescência e pool de
+    processos de renderização, se configurado) em até `workers` threads, ou
+    nas threads de quem fornecer `submit` (ex.: a fila de jobs do servidor).
+    No máximo `workers` documentos são entregues por vez: o próximo só é
+    submetido quando um termina, para o lote não ocupar a fila inteira.
+
+    Args:
+        documents (list): Pares (nome do .md, conteúdo em texto ou bytes UTF-8)
+        workers (int): Conversões simultâneas (padrão: 1)
+        submit (callable): Como `Executor.submit`, deve retornar um `Future`
+            (padrão: um pool próprio de `workers` threads)
+        Demais argumentos: ver `render_pdf` e `cached_render_pdf`.
+
+    Yields:
+        tuple: (resultado — ver `_run_batch_item` —, PDF em bytes ou None), na ordem em que ficam prontos
+    """
+    def convert(markdown):
+        if isinstance(markdown, bytes):
+            markdown = markdown.decode('utf-8')
+        return cached_render_pdf(markdown, css_style, logo, base_dir, cover_data, cache=cache)
+
+    workers = max(1, min(workers or 1, len(documents) or 1))
+    pool = None
+    if submit is None:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch')
+        submit = pool.submit
+    pending = iter(documents)
+    in_flight = set()
+
+    def submit_next():
+        for name, markdown in pending:
+            in_flight.add(submit(_run_batch_item, name, str(PurePosixPath(name).with_suffix('.pdf')), partial(convert, markdown)))
+            return
+
+    try:
+        for _ in range(workers):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.discard(future)
+                submit_next()
+                yield future.result()
+    finally:
+        # Consumidor interrompido (ex.: cliente desconectou): descarta o que não começou
+        for future in in_flight:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+
+def _plan_incremental_batch(directory, jobs, manifest_dir, css_style=None, logo_path=None):
+    """
+    Filtra os arquivos do lote que precisam ser (re)convertidos, segundo o
+    manifesto em `manifest_dir`, e remove os PDFs cujo .md de origem sumiu.
+
+    Returns:
+        tuple: (manifesto, jobs pendentes, hashes dos .md pendentes, quantidade ignorada)
+    """
+    resolved_dir = directory.resolve()
+    assets = get_asset_index(resolved_dir)
+    manifest = BatchManifest(Path(manifest_dir) / MANIFEST_NAME)
+
+    # Insumos compartilhados: tema padrão, CSS, logo, capa e fontes
+    logo = logo_path or _resolve_default_logo(resolved_dir / 'logo_zoi.png', resolved_dir, assets)
+    digest = inputs_digest(
+        texts=[DEFAULT_CSS, css_style, get_backend().name],
+        files=[logo, assets.find_cover_template(), assets.find_font(['clash']), assets.find_font(['Satoshi'])],
+    )
+    inputs_changed = manifest.inputs != digest
+    if inputs_changed and manifest.inputs is not None:
+        print("Insumos compartilhados (CSS, logo, capa ou fontes) mudaram: todos os arquivos serão convertidos")
+    manifest.inputs = digest
+
+    # Remover saídas de arquivos que deixaram de existir
+    current = {md_file.name for md_file, _ in jobs}
+    for name in list(manifest.files):
+        if name not in current:
+            old_pdf = Path(manifest.files[name].get('pdf', ''))
+            if old_pdf.is_file():
+                old_pdf.unlink()
+                print(f"🗑 Removido {old_pdf} (origem {name} não existe mais)")
+            manifest.forget(name)
+
+    pending = []
+    hashes = {}
+    for md_file, pdf_path in jobs:
+        source_hash = file_sha256(md_file)
+        if not inputs_changed and manifest.is_fresh(md_file.name, source_hash, pdf_path):
+            continue
+        pending.append((md_file, pdf_path))
+        hashes[md_file.name] = source_hash
+    return manifest, pending, hashes, len(jobs) - len(pending)
+
+
+def _print_batch_summary(results, elapsed, skipped=0):
+    ok = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    cached = [r for r in ok if r['cache'] == 'HIT']
+    render_times = [r['seconds'] for r in ok if r['cache'] != 'HIT']
+
+    print("\nResumo da conversão em lote:")
+    print(f"  ✓ {len(ok)} convertidos ({len(cached)} do cache)")
+    print(f"  ✗ {len(failed)} com erro")
+    if skipped:
+        print(f"  = {skipped} sem alterações (ignorados)")
+    print(f"  Tempo total: {elapsed:.2f}s")
+    if render_times:
+        print(
+            f"  Tempo por arquivo: média {sum(render_times) / len(render_times):.2f}s, "
+            f"mín {min(render_times):.2f}s, máx {max(render_times):.2f}s"
+        )
+    for r in failed:
+        print(f"  ✗ {r['file']}: {r['error']}")
+
+
+def batch_convert(directory, output_dir=None, css_style=None, logo_path=None, cache=None, workers=1, incremental=False):
     """
     Converte todos os arquivos .md em um diretório para PDF.
     
@@ -470,6 +1231,14 @@ def batch_convert(directory, output_dir=None, css_style=None, logo_path=None):
         output_dir (str): Diretório de saída para os PDFs (opcional)
         css_style (str): CSS personalizado para estilização (opcional)
         logo_path (str): Caminho para imagem da logo a exibir no rodapé (opcional)
+        cache (PdfCache): Cache de PDFs (opcional). Se None, usa o configurado via PDF_CACHE_DIR.
+        workers (int): Número de processos de conversão. Com mais de 1, os arquivos
+            são distribuídos em um pool de processos (o WeasyPrint é limitado pela GIL).
+        incremental (bool): Converte apenas os arquivos alterados desde a última execução,
+            segundo o manifesto gravado no diretório de saída, e remove os PDFs cujo .md sumiu.
+
+    Returns:
+        list: Resultado de cada arquivo, na ordem de conversão (ver `_convert_batch_file`)
     """
     directory = Path(directory)
     
@@ -482,25 +1251,77 @@ def batch_convert(directory, output_dir=None, css_style=None, logo_path=None):
         output_dir.mkdir(parents=True, exist_ok=True)
     
     # Encontrar todos os arquivos .md
-    md_files = list(directory.glob('*.md'))
+    md_files = sorted(directory.glob('*.md'))
+
+    jobs = []
+    for md_file in md_files:
+        if output_dir:
+            pdf_path = output_dir / md_file.with_suffix('.pdf').name
+        else:
+            pdf_path = md_file.with_suffix('.pdf')
+        jobs.append((md_file, pdf_path))
+
+    manifest = None
+    skipped = 0
+    if incremental:
+        manifest, jobs, source_hashes, skipped = _plan_incremental_batch(
+            directory, jobs, output_dir or directory, css_style, logo_path
+        )
     
     if not md_files:
         print(f"Nenhum arquivo .md encontrado em {directory}")
-        return
+        if manifest is not None:
+            manifest.save()
+        return []
     
-    print(f"Encontrados {len(md_files)} arquivos .md para converter")
-    
-    # Converter cada arquivo
-    for md_file in md_files:
-        try:
-            if output_dir:
-                pdf_path = output_dir / md_file.with_suffix('.pdf').name
+    workers = max(1, min(workers or 1, len(jobs) or 1))
+    print(f"Encontrados {len(md_files)} arquivos .md para converter" + (f" ({workers} processos)" if workers > 1 else ""))
+    if incremental:
+        print(f"Modo incremental: {len(jobs)} alterados, {skipped} sem alterações")
+
+    def _report(i, result):
+        name = Path(result['file']).name
+        if result['ok']:
+            origin = " [cache]" if result['cache'] == 'HIT' else ""
+            print(f"[{i}/{len(jobs)}] ✓ {name} ({result['seconds']:.2f}s){origin}")
+        else:
+            print(f"[{i}/{len(jobs)}] ✗ Erro ao converter {result['file']}: {result['error']}")
+
+    results = []
+    start = time.perf_counter()
+    if workers == 1:
+        for i, (md_file, pdf_path) in enumerate(jobs, 1):
+            result = _convert_batch_file(md_file, pdf_path, css_style, logo_path, cache)
+            results.append(result)
+            _report(i, result)
+    else:
+        cache_args = (str(cache.cache_dir), cache.max_bytes) if cache is not None else (None, None)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_batch_worker,
+            initargs=(str(directory.resolve()),) + cache_args,
+        ) as pool:
+            futures = [
+                pool.submit(_convert_batch_file, md_file, pdf_path, css_style, logo_path)
+                for md_file, pdf_path in jobs
+            ]
+            # Resultados reportados na ordem dos arquivos, à medida que ficam prontos
+            for i, future in enumerate(futures, 1):
+                result = future.result()
+                results.append(result)
+                _report(i, result)
+
+    if manifest is not None:
+        for result in results:
+            name = Path(result['file']).name
+            if result['ok']:
+                manifest.record(name, source_hashes[name], result['pdf'])
             else:
-                pdf_path = md_file.with_suffix('.pdf')
-            
-            md_to_pdf(str(md_file), str(pdf_path), css_style, logo_path)
-        except Exception as e:
-            print(f"✗ Erro ao converter {md_file}: {e}")
+                manifest.forget(name)
+        manifest.save()
+
+    _print_batch_summary(results, time.perf_counter() - start, skipped)
+    return results
 
 
 def main():
@@ -516,6 +1337,12 @@ Exemplos de uso:
   python md_to_pdf.py arquivo.md --css custom.css
   python md_to_pdf.py arquivo.md --logo ./logo.png
   python md_to_pdf.py --batch ./documentos --logo ./logo.png
+  python md_to_pdf.py --batch ./documentos -o ./pdfs --cache-dir ./.pdf-cache
+  python md_to_pdf.py --batch ./documentos -o ./pdfs --jobs 4
+  python md_to_pdf.py --batch ./documentos -o ./pdfs --incremental
+  python md_to_pdf.py relatorio_grande.md --large --jobs 8
+  python md_to_pdf.py arquivo.md --parser markdown-it
+  python md_to_pdf.py --check-parsers
         """
     )
     
@@ -546,7 +1373,57 @@ Exemplos de uso:
         help="Caminho da imagem da logo a exibir no rodapé (PNG/JPG/SVG). Se omitido, o script tenta usar 'logo_zoi.png' no mesmo diretório do arquivo .md"
     )
     
+    parser.add_argument(
+        '--cache-dir',
+        help='Diretório do cache de PDFs; conversões idênticas são servidas do cache (padrão: PDF_CACHE_DIR)'
+    )
+    
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='Número de processos para a conversão em lote (padrão: 1) ou para o modo --large (padrão: núcleos da CPU)'
+    )
+
+    parser.add_argument(
+        '--large',
+        action='store_true',
+        help='Documento grande: divide nos títulos de nível 1 e renderiza as seções em paralelo'
+    )
+    
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Com --batch: converte apenas os arquivos alterados desde a última execução e remove PDFs cujo .md sumiu'
+    )
+
+    parser.add_argument(
+        '--parser',
+        choices=sorted(BACKENDS),
+        help='Backend de conversão Markdown → HTML (padrão: MARKDOWN_BACKEND ou markdown2)'
+    )
+
+    parser.add_argument(
+        '--check-parsers',
+        action='store_true',
+        help='Compara o HTML dos backends de markdown no corpus de assets/markdown_corpus e sai'
+    )
+    
     args = parser.parse_args()
+
+    if args.parser:
+        # Via ambiente para valer também nos processos do lote/modo --large
+        os.environ['MARKDOWN_BACKEND'] = args.parser
+
+    if args.check_parsers:
+        failures = check_corpus(preprocess=normalize_markdown_content)
+        for path, diffs in failures.items():
+            print(f"❌ {Path(path).name}")
+            for diff in diffs:
+                print(f"   {diff}")
+        if failures:
+            return 1
+        print("✅ Backends equivalentes em todo o corpus")
+        return 0
     
     # Validar argumentos
     if not args.input:
@@ -554,13 +1431,17 @@ Exemplos de uso:
         return
     
     try:
+        cache = PdfCache(args.cache_dir) if args.cache_dir else None
+
         # Modo batch
         if args.batch:
             css_content = None
             if args.css:
                 with open(args.css, 'r', encoding='utf-8') as f:
                     css_content = f.read()
-            batch_convert(args.input, args.output, css_content, args.logo)
+            results = batch_convert(args.input, args.output, css_content, args.logo, cache=cache, workers=args.jobs or 1, incremental=args.incremental)
+            if any(not r['ok'] for r in results):
+                return 1
         # Modo arquivo único
         else:
             css_content = None
@@ -568,7 +1449,10 @@ Exemplos de uso:
                 with open(args.css, 'r', encoding='utf-8') as f:
                     css_content = f.read()
             
-            md_to_pdf(args.input, args.output, css_content, args.logo)
+            cached_md_to_pdf(
+                args.input, args.output, css_content, args.logo,
+                cache=cache, large_document=args.large, workers=args.jobs,
+            )
             
     except Exception as e:
         print(f"Erro: {e}")
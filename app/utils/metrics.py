@@ -0,0 +1,252 @@
+"""
+Instrumentação da conversão: tempo por fase, páginas e tamanhos.
+
+Cada conversão preenche um `RenderStats` (fases `normalize`, `markdown`,
+`html`, `layout` e `write`, além de páginas, bytes de entrada e de saída),
+que é registrado nos histogramas do processo por `record_render`. As rotas
+usam o mesmo objeto para o log estruturado e o cabeçalho `Server-Timing`.
+
+As métricas (`Counter`, `Gauge`, `Histogram`) ficam em `REGISTRY` e são
+exportadas no formato texto do Prometheus por `render_prometheus`. Os valores
+são do processo: com vários workers do gunicorn, cada um tem os seus.
+"""
+
+import bisect
+import contextlib
+import json
+import threading
+import time
+
+# Limites dos histogramas (segundos, páginas e bytes)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PAGES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+
+
+REGISTRY = []
+
+
+class _Metric:
+    """
+    Base das métricas: nome, descrição, rótulos e registro em `REGISTRY`.
+
+    Com `collect`, os valores são lidos na exportação: a função retorna um
+    número ou {tupla de rótulos: número} (ex.: contadores mantidos por outro objeto).
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=(), collect=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._lock = threading.Lock()
+        self._series = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """
+        Returns:
+            list: Amostras [(sufixo do nome, {rótulo: valor}, valor)]
+        """
+        if self.collect is not None:
+            values = self.collect()
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._series)
+        return [
+            ('', dict(zip(self.labelnames, key)), value)
+            for key, value in values.items() if value is not None
+        ]
+
+
+class Counter(_Metric):
+    """Contador monotônico, com séries por rótulos."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valor instantâneo, com séries por rótulos."""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextlib.contextmanager
+    def track(self, **labels):
+        """Incrementa o valor enquanto o bloco executa (ex.: conversões em andamento)."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Histograma cumulativo (estilo Prometheus), com séries por rótulos."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {rótulos: {'buckets': [(limite, contagem acumulada)], 'sum': ..., 'count': ...}}
+        """
+        with self._lock:
+            result = {}
+            for key, series in self._series.items():
+                cumulative = 0
+                buckets = []
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    buckets.append((bound, cumulative))
+                result[key] = {'buckets': buckets, 'sum': series['sum'], 'count': series['count']}
+            return result
+
+    def samples(self):
+        samples = []
+        for key, series in self.snapshot().items():
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in series['buckets']:
+                samples.append(('_bucket', {**labels, 'le': _format_value(bound)}, count))
+            samples.append(('_bucket', {**labels, 'le': '+Inf'}, series['count']))
+            samples.append(('_sum', labels, series['sum']))
+            samples.append(('_count', labels, series['count']))
+        return samples
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render_prometheus(metrics=None):
+    """Exporta as métricas (padrão: todo o `REGISTRY`) no formato texto do Prometheus."""
+    lines = []
+    for metric in REGISTRY if metrics is None else metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for suffix, labels, value in metric.samples():
+            label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            label_text = f"{{{label_text}}}" if label_text else ''
+            lines.append(f"{metric.name}{suffix}{label_text} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+RENDER_PHASE_SECONDS = Histogram(
+    'render_phase_seconds', 'Duração de cada fase da conversão', SECONDS_BUCKETS, labelnames=('phase',)
+)
+RENDER_SECONDS = Histogram('render_seconds', 'Duração total da conversão', SECONDS_BUCKETS)
+RENDER_PAGES = Histogram('render_pages', 'Páginas por PDF gerado', PAGES_BUCKETS)
+RENDER_INPUT_BYTES = Histogram('render_input_bytes', 'Tamanho do markdown de entrada', BYTES_BUCKETS)
+RENDER_OUTPUT_BYTES = Histogram('render_output_bytes', 'Tamanho do PDF gerado', BYTES_BUCKETS)
+
+RENDER_COALESCED = Counter(
+    'render_coalesced_total', 'Conversões atendidas por uma conversão idêntica já em andamento'
+)
+
+RENDER_HISTOGRAMS = [RENDER_PHASE_SECONDS, RENDER_SECONDS, RENDER_PAGES, RENDER_INPUT_BYTES, RENDER_OUTPUT_BYTES]
+
+
+class RenderStats:
+    """Medições de uma conversão (preenchidas por `render_pdf`)."""
+
+    def __init__(self):
+        self.phases = {}
+        self.pages = None
+        self.input_bytes = None
+        self.output_bytes = None
+        self.cache = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Cronometra o bloco como a fase `name` (fases repetidas são somadas)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        return {
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+            'total_ms': round(self.total * 1000, 2),
+            'pages': self.pages,
+            'input_bytes': self.input_bytes,
+            'output_bytes': self.output_bytes,
+            'cache': self.cache,
+        }
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    def server_timing(self):
+        """Valor do cabeçalho `Server-Timing` (durações em milissegundos)."""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()]
+        entries.append(f"total;dur={self.total * 1000:.1f}")
+        return ', '.join(entries)
+
+
+def timed(stats, name):
+    """`stats.phase(name)`, ou um contexto vazio se não houver medição."""
+    return stats.phase(name) if stats is not None else contextlib.nullcontext()
+
+
+def record_render(stats):
+    """Registra as medições de uma conversão nos histogramas do processo."""
+    for name, seconds in stats.phases.items():
+        RENDER_PHASE_SECONDS.observe(seconds, phase=name)
+    RENDER_SECONDS.observe(stats.total)
+    if stats.pages is not None:
+        RENDER_PAGES.observe(stats.pages)
+    if stats.input_bytes is not None:
+        RENDER_INPUT_BYTES.observe(stats.input_bytes)
+    if stats.output_bytes is not None:
+        RENDER_OUTPUT_BYTES.observe(stats.output_bytes)
@@ -0,0 +1,138 @@
+"""
+Cache em disco de PDFs gerados, endereçado pelo conteúdo da conversão.
+
+A chave é o hash (SHA-256) de tudo o que influencia o PDF: markdown
+normalizado, CSS personalizado, dados da capa, bytes da logo e versão do
+índice de recursos. Os PDFs ficam em `<cache_dir>/<chave>.pdf`; cada acerto
+atualiza o mtime do arquivo, e quando o tamanho total passa de `max_bytes`
+os arquivos menos usados recentemente (mtime mais antigo) são removidos.
+
+Configuração via ambiente:
+    PDF_CACHE_DIR: diretório do cache (se ausente, o cache fica desativado)
+    PDF_CACHE_MAX_BYTES: tamanho máximo do cache (padrão: 512MB)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+try:
+    from app.utils.disk_lru import DiskLRU
+except ImportError:  # importado por md_to_pdf executado como script
+    from disk_lru import DiskLRU
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def make_cache_key(md_content, css_style=None, cover_data=None, logo_bytes=None, assets_version='', extra=None):
+    """
+    Calcula a chave de cache de uma conversão.
+
+    Args:
+        md_content (str): Markdown já normalizado
+        css_style (str): CSS personalizado (opcional)
+        cover_data (dict): Dados da capa (opcional)
+        logo_bytes (bytes): Conteúdo da logo do rodapé (opcional)
+        assets_version (str): Versão do índice de recursos
+        extra (dict): Outros parâmetros que alteram o resultado (opcional)
+
+    Returns:
+        str: Hash hexadecimal da conversão
+    """
+    h = hashlib.sha256()
+
+    def _feed(label, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        h.update(label.encode('ascii'))
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+
+    _feed('md', md_content or '')
+    _feed('css', css_style or '')
+    _feed('cover', json.dumps(cover_data or {}, sort_keys=True, ensure_ascii=False))
+    _feed('logo', logo_bytes or b'')
+    _feed('assets', assets_version or '')
+    _feed('extra', json.dumps(extra or {}, sort_keys=True, ensure_ascii=False))
+    return h.hexdigest()
+
+
+class PdfCache(DiskLRU):
+    """Cache LRU de PDFs em disco, limitado por tamanho total (ver disk_lru.py)."""
+
+    suffixes = ('.pdf',)
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.pdf"
+
+    def get(self, key):
+        """
+        Retorna o caminho do PDF em cache para `key`, ou None.
+        Um acerto marca a entrada como usada recentemente.
+        """
+        path = self._path(key)
+        return path if self._touch(path) else None
+
+    def fetch(self, key, dest):
+        """Copia o PDF em cache para `dest`. Retorna True em caso de acerto."""
+        path = self.get(key)
+        if path is None:
+            return False
+        try:
+            shutil.copyfile(path, dest)
+        except FileNotFoundError:
+            # Removido por outro processo entre o get e a cópia
+            return False
+        return True
+
+    def read(self, key):
+        """Conteúdo do PDF em cache para `key`, ou None."""
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            # Removido por outro processo entre o get e a leitura
+            return None
+
+    def put(self, key, pdf_path):
+        """Armazena o PDF `pdf_path` sob `key` e aplica o limite de tamanho."""
+        def _copy(out):
+            with open(pdf_path, 'rb') as src:
+                shutil.copyfileobj(src, out)
+
+        self._store(self._path(key).name, os.path.getsize(pdf_path), _copy)
+
+    def put_bytes(self, key, pdf_bytes):
+        """Armazena o PDF em memória `pdf_bytes` sob `key` e aplica o limite de tamanho."""
+        self._store(self._path(key).name, len(pdf_bytes), lambda out: out.write(pdf_bytes))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache():
+    """
+    Retorna o cache de PDFs configurado via ambiente (PDF_CACHE_DIR), ou
+    None se o cache estiver desativado.
+    """
+    global _cache
+    cache_dir = os.environ.get('PDF_CACHE_DIR')
+    if not cache_dir:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            max_bytes = int(os.environ.get('PDF_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+            _cache = PdfCache(cache_dir, max_bytes)
+            logger.info(f"Cache de PDFs ativo em {cache_dir} (limite: {max_bytes} bytes)")
+        return _cache
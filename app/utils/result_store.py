@@ -0,0 +1,228 @@
+"""
+Armazenamento persistente dos jobs e de seus resultados.
+
+Os metadados ficam em um índice SQLite e os arquivos gerados em
+`<diretório>/<job_id><extensão>`. Assim um cliente que perdeu a conexão (ou
+outro worker do gunicorn) pode baixar de novo o resultado pelo id, sem nova
+conversão. Resultados expiram após `ttl` segundos e, se o total passar de
+`max_bytes`, os mais antigos são removidos primeiro.
+
+Só os jobs das rotas /jobs/* são gravados (as rotas síncronas devolvem o
+resultado na própria resposta). Cada job guarda o token gerado pelo servidor
+que dá acesso ao resultado, e o pid do processo que o executa: ao abrir o
+armazenamento, jobs ainda "queued"/"running" de um processo que não existe
+mais são marcados como erro, em vez de ficarem pendentes até expirar.
+
+Configuração via ambiente:
+    RESULT_STORE_DIR: diretório do armazenamento (padrão: <UPLOAD_FOLDER>/results;
+        "off" desativa)
+    RESULT_TTL: segundos que um resultado fica disponível (padrão: 86400)
+    RESULT_MAX_BYTES: tamanho máximo dos resultados (padrão: 1GB)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    file TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    mimetype TEXT,
+    download_name TEXT,
+    headers TEXT,
+    token TEXT,
+    owner INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+"""
+
+
+class ResultStore:
+    """Índice SQLite dos jobs e arquivos de resultado, com expiração e limite de tamanho."""
+
+    def __init__(self, root, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / 'jobs.sqlite3'
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            # Bancos criados antes das colunas token/owner
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (('token', 'TEXT'), ('owner', 'INTEGER')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._fail_orphans()
+
+    def _connect(self):
+        # Uma conexão por operação: seguro entre threads e entre processos do gunicorn
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _fail_orphans(self):
+        # Jobs pendentes de processos que morreram (reinício, OOM) nunca vão terminar
+        with closing(self._connect()) as conn:
+            pending = conn.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+            orphans = [(row['id'],) for row in pending if not _process_alive(row['owner'])]
+            if not orphans:
+                return
+            with conn:
+                conn.executemany(
+                    "UPDATE jobs SET status = 'error', error = ?, finished_at = ? WHERE id = ?",
+                    [("Processamento interrompido (o servidor foi reiniciado)", time.time(), job_id) for job_id, in orphans],
+                )
+        logger.warning(f"{len(orphans)} jobs interrompidos marcados como erro")
+
+    def save_job(self, job):
+        """Grava (ou atualiza) os metadados de um job."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (id, kind, status, error, created_at, started_at, finished_at, token, owner)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    kind = excluded.kind, status = excluded.status, error = excluded.error,
+                    created_at = excluded.created_at, started_at = excluded.started_at,
+                    finished_at = excluded.finished_at, token = excluded.token, owner = excluded.owner
+                """,
+                (job.id, job.kind, job.status, job.error, job.created_at, job.started_at, job.finished_at,
+                 job.token, os.getpid()),
+            )
+
+    def save_result(self, job):
+        """
+        Grava o arquivo do resultado de um job concluído e atualiza o índice
+        (chame `evict` depois de gravar o status final com `save_job`).
+        """
+        result = job.result
+        path = self.root / f"{job.id}{Path(result.download_name).suffix}"
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(result.body)
+            os.replace(tmp_name, path)
+        except Exception:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            raise
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET file = ?, size = ?, mimetype = ?, download_name = ?, headers = ? WHERE id = ?",
+                (path.name, len(result.body), result.mimetype, result.download_name,
+                 json.dumps(result.headers), job.id),
+            )
+
+    def get(self, job_id):
+        """Metadados do job `job_id` (dict), ou None se não existir ou tiver expirado."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (row['finished_at'] and row['finished_at'] < time.time() - self.ttl):
+            return None
+        return dict(row)
+
+    def load_result(self, job_id):
+        """
+        Returns:
+            tuple: (conteúdo, mimetype, nome do arquivo, cabeçalhos) ou None
+        """
+        record = self.get(job_id)
+        if record is None or not record['file']:
+            return None
+        try:
+            body = (self.root / record['file']).read_bytes()
+        except FileNotFoundError:
+            return None
+        return body, record['mimetype'], record['download_name'], json.loads(record['headers'] or '{}')
+
+    def evict(self):
+        """Remove os resultados expirados e, acima de `max_bytes`, os mais antigos."""
+        with self._evict_lock, closing(self._connect()) as conn:
+            limit = time.time() - self.ttl
+            # Também jobs que nunca terminaram (processo reiniciado no meio da conversão)
+            expired = conn.execute(
+                "SELECT id, file FROM jobs WHERE COALESCE(finished_at, created_at) < ?", (limit,)
+            ).fetchall()
+            removed = list(expired)
+
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM jobs WHERE finished_at >= ?", (limit,)).fetchone()[0]
+            if total > self.max_bytes:
+                for row in conn.execute(
+                    "SELECT id, file, size FROM jobs WHERE finished_at >= ? AND size > 0 ORDER BY finished_at",
+                    (limit,),
+                ):
+                    if total <= self.max_bytes:
+                        break
+                    removed.append(row)
+                    total -= row['size']
+
+            for row in removed:
+                if row['file']:
+                    try:
+                        (self.root / row['file']).unlink()
+                    except OSError:
+                        pass
+            with conn:
+                conn.executemany("DELETE FROM jobs WHERE id = ?", [(row['id'],) for row in removed])
+            if removed:
+                logger.info(f"{len(removed)} resultados removidos do armazenamento")
+
+
+def _process_alive(pid):
+    # O próprio processo acabou de abrir o armazenamento: um job dele seria de um pid reaproveitado
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """
+    Retorna o armazenamento de resultados configurado via ambiente, ou None
+    se estiver desativado (RESULT_STORE_DIR=off).
+    """
+    global _store
+    root = os.environ.get('RESULT_STORE_DIR') or os.path.join(os.environ.get('UPLOAD_FOLDER', '/tmp'), 'results')
+    if root.lower() == 'off':
+        return None
+    with _store_lock:
+        if _store is None:
+            ttl = int(os.environ.get('RESULT_TTL', DEFAULT_TTL))
+            max_bytes = int(os.environ.get('RESULT_MAX_BYTES', DEFAULT_MAX_BYTES))
+            _store = ResultStore(root, ttl, max_bytes)
+            _store.evict()
+            logger.info(f"Armazenamento de resultados em {root} (TTL: {ttl}s, limite: {max_bytes} bytes)")
+        return _store
@@ -0,0 +1,65 @@
+"""
+Coalescência de chamadas concorrentes idênticas ("single flight").
+
+Enquanto uma chamada com determinada chave está em andamento, as chamadas
+seguintes com a mesma chave não executam a função: aguardam e recebem o
+mesmo resultado (ou a mesma exceção). Vale dentro do processo; entre workers
+do gunicorn o cache de PDFs cobre as repetições.
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Executa uma única vez as chamadas concorrentes com a mesma chave."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Executa `fn(*args, **kwargs)`, ou aguarda a execução em andamento para `key`.
+
+        Returns:
+            tuple: (resultado, True se foi compartilhado de outra chamada)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Quantidade de chaves em execução."""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,207 @@
+"""
+Engines de transcrição (speech-to-text).
+
+O padrão é o openai-whisper (implementação de referência, em PyTorch). Como
+alternativa mais rápida em CPU há o faster-whisper (CTranslate2) com pesos
+quantizados em int8, a partir dos mesmos modelos (`WHISPER_MODEL`). As duas
+engines recebem o áudio já decodificado (`load_audio`) e devolvem o texto e os
+segmentos com horário, com a mesma decodificação (gulosa, temperatura 0).
+
+Seleção via ambiente (STT_ENGINE). O fator de tempo real de cada engine sobre
+um áudio fixo é medido com:
+
+    python -m app.utils.stt_engines [áudio] [--engines whisper,faster-whisper]
+
+Configuração via ambiente:
+    STT_ENGINE: engine de transcrição (padrão: whisper)
+    WHISPER_MODEL: modelo (tiny, base, small, ...; padrão: base)
+    STT_COMPUTE_TYPE: tipo de cálculo do faster-whisper (padrão: int8)
+    STT_THREADS: threads de CPU por engine (padrão: as da biblioteca)
+"""
+
+import argparse
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_ENGINE = 'whisper'
+DEFAULT_MODEL = 'base'
+DEFAULT_COMPUTE_TYPE = 'int8'
+SAMPLE_RATE = 16000
+BENCHMARK_AUDIO = Path(__file__).resolve().parent.parent.parent / 'assets' / 'audio' / 'benchmark.wav'
+
+
+def engine_name():
+    return os.environ.get('STT_ENGINE') or DEFAULT_ENGINE
+
+
+def model_name():
+    return os.environ.get('WHISPER_MODEL', DEFAULT_MODEL)
+
+
+def _threads():
+    return int(os.environ.get('STT_THREADS', 0))
+
+
+def decode_audio(path):
+    """
+    Decodifica um arquivo de áudio/vídeo com o ffmpeg.
+
+    Returns:
+        bytes: PCM de 16 bits, mono, 16 kHz
+    """
+    cmd = [
+        'ffmpeg', '-nostdin', '-threads', '0', '-i', str(path),
+        '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-',
+    ]
+    try:
+        return subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Falha ao decodificar o áudio: {e.stderr.decode(errors='replace')[-500:]}") from e
+
+
+def pcm_to_samples(pcm):
+    """
+    Returns:
+        numpy.ndarray: Amostras do PCM de 16 bits em float32 entre -1 e 1
+    """
+    import numpy as np
+
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+def load_audio(path):
+    """Decodifica um arquivo de áudio/vídeo em amostras float32 (mono, 16 kHz)."""
+    return pcm_to_samples(decode_audio(path))
+
+
+class WhisperEngine:
+    """Engine padrão: openai-whisper (PyTorch)."""
+
+    name = 'whisper'
+
+    def __init__(self):
+        import whisper
+
+        if _threads():
+            import torch
+            torch.set_num_threads(_threads())
+        self._model = whisper.load_model(model_name())
+
+    def transcribe(self, audio, language):
+        # fp16 não existe em CPU (o whisper avisaria e usaria fp32 de qualquer forma)
+        result = self._model.transcribe(audio, language=language, fp16=False)
+        segments = [(s['start'], s['end'], s['text'].strip()) for s in result['segments']]
+        return {'text': result['text'], 'segments': segments}
+
+
+class FasterWhisperEngine:
+    """
+    faster-whisper (CTranslate2): o mesmo modelo com pesos quantizados
+    (STT_COMPUTE_TYPE, int8 por padrão), bem mais rápido em CPU.
+    """
+
+    name = 'faster-whisper'
+
+    def __init__(self):
+        from faster_whisper import WhisperModel
+
+        compute_type = os.environ.get('STT_COMPUTE_TYPE', DEFAULT_COMPUTE_TYPE)
+        self._model = WhisperModel(model_name(), device='cpu', compute_type=compute_type, cpu_threads=_threads())
+
+    def transcribe(self, audio, language):
+        # beam_size=1: decodificação gulosa, como o transcribe do openai-whisper
+        segments, _ = self._model.transcribe(audio, language=language, beam_size=1)
+        segments = [(s.start, s.end, s.text.strip()) for s in segments]
+        return {'text': ''.join(f" {text}" for _, _, text in segments), 'segments': segments}
+
+
+ENGINES = {
+    WhisperEngine.name: WhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_engine(name=None):
+    """
+    Retorna a engine `name` (ou a configurada em STT_ENGINE), carregando o
+    modelo na primeira chamada.
+    """
+    name = name or engine_name()
+    if name not in ENGINES:
+        raise ValueError(f"Engine de transcrição desconhecida: {name} (opções: {', '.join(ENGINES)})")
+    with _instances_lock:
+        engine = _instances.get(name)
+        if engine is None:
+            engine = ENGINES[name]()
+            _instances[name] = engine
+        return engine
+
+
+def benchmark(audio_path, engines=None, language='pt', runs=1):
+    """
+    Mede cada engine sobre o mesmo áudio.
+
+    Returns:
+        tuple: (duração do áudio em s, lista com `engine`, `load` (s),
+        `transcribe` (melhor de `runs`, em s), `rtf` (tempo de transcrição /
+        duração do áudio) e `chars` de cada engine, ou `error` se a engine
+        não puder ser usada)
+    """
+    audio = load_audio(audio_path)
+    duration = len(audio) / SAMPLE_RATE
+    results = []
+    for name in engines or list(ENGINES):
+        try:
+            start = time.perf_counter()
+            engine = get_engine(name)
+            load = time.perf_counter() - start
+            best = None
+            for _ in range(runs):
+                start = time.perf_counter()
+                result = engine.transcribe(audio, language)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        except Exception as e:
+            results.append({'engine': name, 'error': str(e)})
+            continue
+        results.append({
+            'engine': name,
+            'load': round(load, 2),
+            'transcribe': round(best, 2),
+            'rtf': round(best / duration, 3),
+            'chars': len(result['text']),
+        })
+    return duration, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fator de tempo real (RTF) das engines de transcrição')
+    parser.add_argument('audio', nargs='?', default=str(BENCHMARK_AUDIO), help=f'Áudio de referência (padrão: {BENCHMARK_AUDIO})')
+    parser.add_argument('--engines', default=','.join(ENGINES), help='Engines separadas por vírgula (padrão: todas)')
+    parser.add_argument('--language', default='pt', help='Idioma do áudio (padrão: pt)')
+    parser.add_argument('--runs', type=int, default=1, help='Execuções por engine; vale a mais rápida (padrão: 1)')
+    args = parser.parse_args()
+
+    if not Path(args.audio).exists():
+        print(f"Erro: áudio de referência não encontrado: {args.audio}")
+        return 1
+
+    duration, results = benchmark(args.audio, args.engines.split(','), args.language, args.runs)
+    print(f"Áudio: {args.audio} ({duration:.1f}s), modelo: {model_name()}")
+    print(f"{'engine':<16}{'carga (s)':>10}{'transcrição (s)':>17}{'RTF':>8}{'caracteres':>12}")
+    for row in results:
+        if 'error' in row:
+            print(f"{row['engine']:<16}  erro: {row['error']}")
+        else:
+            print(f"{row['engine']:<16}{row['load']:>10.2f}{row['transcribe']:>17.2f}{row['rtf']:>8.3f}{row['chars']:>12}")
+    return 1 if any('error' in row for row in results) else 0
+
+
+if __name__ == '__main__':
+    exit(main())
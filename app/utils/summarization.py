@@ -0,0 +1,257 @@
+"""
+Resumo de transcrições longas em duas etapas (map-reduce).
+
+A transcrição inteira é dividida em partes de até `SUMMARY_CHUNK_TOKENS`
+tokens (nas quebras de linha, depois nas frases), e cada parte é resumida com
+prompts/prompt_trecho.md, com no máximo `SUMMARY_CONCURRENCY` chamadas
+simultâneas à API. Os resumos parciais, na ordem, passam então pelo
+prompts/prompt_resumo.md, que produz o documento final. Se os resumos
+parciais ainda forem grandes demais para uma única chamada, eles são
+resumidos de novo em grupos até caberem. Uma transcrição que cabe em uma
+parte vai direto para o prompt final.
+
+Os tokens são estimados pelo tamanho do texto (`CHARS_PER_TOKEN`, uma
+estimativa conservadora para português), e cada job tem um teto de tokens
+(prompt + resposta) em `SUMMARY_MAX_TOKENS`: o job é recusado antes da
+primeira chamada se a estimativa não couber, e cada chamada reserva a sua
+parte do orçamento (ajustada pelo uso informado pela API).
+
+Configuração via ambiente:
+    SUMMARY_CHUNK_TOKENS: tokens da transcrição por parte (padrão: 3000)
+    SUMMARY_CONCURRENCY: chamadas simultâneas à API por processo (padrão: 4)
+    SUMMARY_MAX_TOKENS: teto de tokens por job (padrão: 200000)
+    SUMMARY_PARTIAL_TOKENS: resposta máxima de cada resumo parcial (padrão: 800)
+    SUMMARY_FINAL_TOKENS: resposta máxima do resumo final (padrão: 4000)
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = Path(__file__).resolve().parent.parent.parent / 'prompts'
+SYSTEM_PROMPT = "Você é um especialista em resumir reuniões de negócios de forma clara e profissional."
+
+DEFAULT_CHUNK_TOKENS = 3000
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_TOKENS = 200000
+DEFAULT_PARTIAL_TOKENS = 800
+DEFAULT_FINAL_TOKENS = 4000
+# Estimativa conservadora (o português fica perto de 3,5-4 caracteres por token)
+CHARS_PER_TOKEN = 3
+# Tokens de cada mensagem além do texto (papéis, separadores)
+MESSAGE_OVERHEAD = 16
+# Entrada máxima do prompt final, em partes: acima disso os resumos parciais são reagrupados
+FINAL_INPUT_CHUNKS = 4
+
+
+class TokenBudgetExceeded(Exception):
+    """O resumo ultrapassaria o teto de tokens do job (SUMMARY_MAX_TOKENS)."""
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class TokenBudget:
+    """Teto de tokens de um job, compartilhado pelas chamadas concorrentes."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        with self._lock:
+            if self.used + tokens > self.limit:
+                raise TokenBudgetExceeded(
+                    f"limite de {self.limit} tokens por resumo atingido ({self.used} usados, {tokens} necessários)"
+                )
+            self.used += tokens
+
+    def settle(self, reserved, actual):
+        """Troca a reserva pelo uso informado pela API."""
+        with self._lock:
+            self.used += actual - reserved
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _request_slots():
+    # Limite de chamadas simultâneas à API no processo, somando todos os jobs
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(max(1, _env_int('SUMMARY_CONCURRENCY', DEFAULT_CONCURRENCY)))
+        return _slots
+
+
+def split_into_chunks(text, max_tokens):
+    """
+    Divide `text` em partes de até `max_tokens` tokens estimados, preferindo
+    quebras de linha, depois fins de frase; só corta no meio de uma frase
+    que sozinha passe do limite.
+
+    Returns:
+        list: Partes, na ordem
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for line in text.splitlines():
+        if len(line) <= max_chars:
+            pieces.append(line)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', line):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            pieces.append(sentence)
+
+    chunks = []
+    current = []
+    size = 0
+    for piece in pieces:
+        if current and size + len(piece) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _load_prompt(name):
+    with open(PROMPTS_DIR / name, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _fill(template, values):
+    for placeholder, value in values.items():
+        template = template.replace(placeholder, value)
+    return template
+
+
+class MeetingSummarizer:
+    """
+    Resumo map-reduce de uma transcrição com a API de chat completions
+    (OpenAI ou compatível, ver OPENAI_BASE_URL).
+    """
+
+    def __init__(self, client, model, chunk_tokens=None, max_tokens=None):
+        self.client = client
+        self.model = model
+        self.chunk_tokens = chunk_tokens or _env_int('SUMMARY_CHUNK_TOKENS', DEFAULT_CHUNK_TOKENS)
+        self.partial_tokens = _env_int('SUMMARY_PARTIAL_TOKENS', DEFAULT_PARTIAL_TOKENS)
+        self.final_tokens = _env_int('SUMMARY_FINAL_TOKENS', DEFAULT_FINAL_TOKENS)
+        self.budget = TokenBudget(max_tokens or _env_int('SUMMARY_MAX_TOKENS', DEFAULT_MAX_TOKENS))
+
+    def _complete(self, prompt, max_completion_tokens):
+        reserved = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt) + 2 * MESSAGE_OVERHEAD + max_completion_tokens
+        self.budget.reserve(reserved)
+        with _request_slots():
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_completion_tokens=max_completion_tokens
+            )
+        usage = getattr(response, 'usage', None)
+        if usage is not None and getattr(usage, 'total_tokens', None):
+            self.budget.settle(reserved, usage.total_tokens)
+        return response.choices[0].message.content or ''
+
+    def _estimate_job(self, chunks, template):
+        # Mesmo cálculo das reservas: recusa o job antes de gastar qualquer token
+        overhead = estimate_tokens(SYSTEM_PROMPT) + 2 * MESSAGE_OVERHEAD
+        if len(chunks) == 1:
+            return overhead + estimate_tokens(template) + estimate_tokens(chunks[0]) + self.final_tokens
+        partial_prompt = estimate_tokens(_load_prompt('prompt_trecho.md'))
+        total = sum(overhead + partial_prompt + estimate_tokens(chunk) + self.partial_tokens for chunk in chunks)
+        return total + overhead + estimate_tokens(template) + len(chunks) * self.partial_tokens + self.final_tokens
+
+    def _summarize_parts(self, chunks, values, progress=None):
+        """Resume cada parte (em paralelo) e devolve os resumos na ordem."""
+        template = _load_prompt('prompt_trecho.md')
+        total = len(chunks)
+        results = [None] * total
+        workers = max(1, min(total, _env_int('SUMMARY_CONCURRENCY', DEFAULT_CONCURRENCY)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summary') as executor:
+            futures = {
+                executor.submit(self._complete, _fill(template, {
+                    **values, '<<PARTE>>': str(index + 1), '<<TOTAL>>': str(total), '<<TRECHO>>': chunk,
+                }), self.partial_tokens): index
+                for index, chunk in enumerate(chunks)
+            }
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    results[futures[future]] = future.result()
+                    if progress:
+                        progress(done, total)
+            finally:
+                for future in futures:
+                    future.cancel()
+        return results
+
+    def summarize(self, transcript, template, meeting_date, participants, progress=None):
+        """
+        Gera o resumo final em markdown.
+
+        Args:
+            transcript (str): Transcrição completa
+            template (str): Prompt final (prompts/prompt_resumo.md)
+            meeting_date (str): Data formatada (<<DATA>>)
+            participants (str): Participantes formatados (<<NOMES>>)
+            progress (callable): Chamado com (partes resumidas, total de partes)
+
+        Returns:
+            str: Resumo em markdown
+
+        Raises:
+            TokenBudgetExceeded: O resumo passaria de SUMMARY_MAX_TOKENS
+        """
+        values = {
+            '<<DATA>>': meeting_date,
+            '<<NOMES>>': participants,
+            '<<PARTICIPANTES_INTERNOS>>': participants,
+        }
+        chunks = split_into_chunks(transcript, self.chunk_tokens) or [transcript]
+        estimate = self._estimate_job(chunks, template)
+        if estimate > self.budget.limit:
+            raise TokenBudgetExceeded(
+                f"transcrição exigiria ~{estimate} tokens, acima do limite de {self.budget.limit} (SUMMARY_MAX_TOKENS)"
+            )
+
+        text = transcript
+        if len(chunks) > 1:
+            logger.info(f"Resumo em partes: {len(chunks)} partes de até {self.chunk_tokens} tokens")
+            partials = self._summarize_parts(chunks, values, progress)
+            text = self._join(partials)
+            # Resumos parciais grandes demais para o prompt final: reagrupa e resume de novo
+            while estimate_tokens(text) > FINAL_INPUT_CHUNKS * self.chunk_tokens:
+                groups = split_into_chunks(text, self.chunk_tokens)
+                logger.info(f"Resumos parciais reagrupados em {len(groups)} partes")
+                text = self._join(self._summarize_parts(groups, values))
+
+        prompt = _fill(template, {**values, '<<TRANSCRIÇÂO>>': text, ' <<TRANSCRIÇÂO >>': text})
+        summary = self._complete(prompt, self.final_tokens)
+        logger.info(f"Resumo concluído: ~{self.budget.used} tokens usados")
+        return summary
+
+    @staticmethod
+    def _join(partials):
+        total = len(partials)
+        return "\n\n".join(f"### Parte {index} de {total}\n\n{partial.strip()}" for index, partial in enumerate(partials, 1))
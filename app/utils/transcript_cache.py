@@ -0,0 +1,116 @@
+"""
+Cache em disco de áudios decodificados e transcrições, endereçado pelo
+conteúdo da gravação.
+
+Reprocessar a mesma gravação (outro título, outros participantes) não precisa
+decodificar nem transcrever de novo: só o resumo e o PDF são refeitos.
+
+- Áudio: `<sha256 da gravação>.pcm`, o áudio normalizado pelo ffmpeg (mono,
+  16 kHz, PCM de 16 bits), reaproveitado por qualquer engine/modelo/idioma.
+- Transcrição: `<chave>.txt`, com a chave calculada do hash da gravação, da
+  engine, do modelo, do idioma e dos parâmetros de divisão de áudios longos.
+
+Cada acerto atualiza o mtime do arquivo, e quando o tamanho total passa de
+`max_bytes` os arquivos menos usados recentemente são removidos (a mesma base
+do cache de PDFs, ver disk_lru.py).
+
+Configuração via ambiente:
+    TRANSCRIPT_CACHE_DIR: diretório do cache (se ausente, o cache fica desativado)
+    TRANSCRIPT_CACHE_MAX_BYTES: tamanho máximo do cache (padrão: 2GB)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from app.utils.disk_lru import DiskLRU
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+SUFFIXES = ('.pcm', '.txt')
+
+
+def file_sha256(path):
+    """SHA-256 do conteúdo de `path` (quando o upload não trouxe o hash)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def make_transcript_key(media_sha256, engine, model, language, extra=None):
+    """
+    Calcula a chave de cache de uma transcrição.
+
+    Args:
+        media_sha256 (str): Hash da gravação
+        engine (str): Engine de transcrição
+        model (str): Modelo da engine
+        language (str): Idioma
+        extra (dict): Outros parâmetros que alteram o texto (opcional)
+
+    Returns:
+        str: Hash hexadecimal da transcrição
+    """
+    payload = {'media': media_sha256, 'engine': engine, 'model': model, 'language': language, 'extra': extra or {}}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class TranscriptCache(DiskLRU):
+    """Cache LRU de áudios decodificados e transcrições em disco, limitado por tamanho total."""
+
+    suffixes = SUFFIXES
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def _read(self, name):
+        path = self.cache_dir / name
+        if not self._touch(path):
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            # Removido por outro processo entre o utime e a leitura
+            return None
+
+    def get_audio(self, media_sha256):
+        """Áudio decodificado (PCM de 16 bits, 16 kHz) da gravação, ou None."""
+        return self._read(f"{media_sha256}.pcm")
+
+    def put_audio(self, media_sha256, pcm):
+        self._store(f"{media_sha256}.pcm", len(pcm), lambda out: out.write(pcm))
+
+    def get_transcript(self, key):
+        """Transcrição em cache para `key`, ou None."""
+        data = self._read(f"{key}.txt")
+        return data.decode('utf-8') if data is not None else None
+
+    def put_transcript(self, key, text):
+        data = text.encode('utf-8')
+        self._store(f"{key}.txt", len(data), lambda out: out.write(data))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_transcript_cache():
+    """
+    Retorna o cache de transcrições configurado via ambiente
+    (TRANSCRIPT_CACHE_DIR), ou None se o cache estiver desativado.
+    """
+    global _cache
+    cache_dir = os.environ.get('TRANSCRIPT_CACHE_DIR')
+    if not cache_dir:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            max_bytes = int(os.environ.get('TRANSCRIPT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+            _cache = TranscriptCache(cache_dir, max_bytes)
+            logger.info(f"Cache de transcrições ativo em {cache_dir} (limite: {max_bytes} bytes)")
+        return _cache
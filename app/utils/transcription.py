@@ -0,0 +1,491 @@
+"""
+Transcrição de áudio/vídeo com o Whisper (engine em STT_ENGINE, ver stt_engines.py).
+
+O modelo do Whisper ocupa centenas de MB (ou alguns GB) de RAM. Carregado em
+cada worker do gunicorn, ele multiplica o consumo de memória pelo número de
+workers. Com `TRANSCRIBER_SOCKET` configurado, um único processo de
+transcrição por máquina carrega o modelo (uma vez) e atende os workers por um
+socket Unix local:
+
+    python -m app.utils.transcription
+
+Os workers enviam o caminho do arquivo (o diretório de uploads é compartilhado)
+e recebem o texto transcrito; nunca importam torch/whisper nem carregam a
+engine. As transcrições são executadas uma de cada vez, na ordem de chegada
+(o modelo não é seguro para uso simultâneo por várias threads). Sem
+`TRANSCRIBER_SOCKET` (CLI, desenvolvimento), o modelo é carregado no próprio
+processo, como antes.
+
+Áudios longos (acima de `TRANSCRIBE_LONG_AUDIO` segundos) são decodificados
+uma vez e divididos em trechos de ~`TRANSCRIBE_CHUNK_SECONDS`, cortados nos
+silêncios; os trechos são transcritos em paralelo por `TRANSCRIBE_PROCESSES`
+processos (cada um com a sua cópia do modelo) e o texto é reunido na ordem,
+com o horário de cada segmento. O progresso de cada trecho é enviado ao worker.
+
+Protocolo: uma conexão por pedido; pedido e resposta são um objeto JSON
+(`{"op": "transcribe", "path": ..., "language": ..., "sha256": ...}` → `{"text": ...}` ou
+`{"error": ...}`, precedidos de `{"progress": [concluídos, total]}` nos
+áudios longos; `{"op": "ping"}` → `{"engine": ..., "model": ..., "ready": ...,
+"load_error": ...}`).
+
+Configuração via ambiente:
+    WHISPER_MODEL, STT_ENGINE: modelo e engine (ver stt_engines.py)
+    TRANSCRIBER_SOCKET: caminho do socket do processo de transcrição
+        (vazio: transcrição no próprio processo)
+    TRANSCRIBER_TIMEOUT: segundos aguardando uma transcrição (padrão: 3600)
+    TRANSCRIBER_START_TIMEOUT: segundos aguardando o processo de transcrição
+        carregar o modelo no aquecimento (padrão: 300)
+    TRANSCRIBE_LONG_AUDIO: duração (s) a partir da qual o áudio é dividido
+        em trechos (padrão: 600)
+    TRANSCRIBE_CHUNK_SECONDS: duração aproximada de cada trecho (padrão: 300)
+    TRANSCRIBE_PROCESSES: processos transcrevendo trechos em paralelo
+        (padrão: 2; menos de 2 transcreve os trechos em sequência)
+    TRANSCRIPT_CACHE_DIR: cache de áudios decodificados e transcrições
+        (ver transcript_cache.py)
+"""
+
+import fcntl
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.connection import Client, Listener
+
+from app.utils.stt_engines import SAMPLE_RATE, decode_audio, engine_name, get_engine, model_name, pcm_to_samples
+from app.utils.transcript_cache import file_sha256, get_transcript_cache, make_transcript_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 3600
+DEFAULT_START_TIMEOUT = 300
+DEFAULT_LONG_AUDIO = 600
+DEFAULT_CHUNK_SECONDS = 300
+DEFAULT_TRANSCRIBE_PROCESSES = 2
+# Janelas da detecção de silêncio (segundos) e quanto
+# o corte pode se afastar do alvo (fração do trecho)
+SILENCE_FRAME = 0.03
+SILENCE_SEARCH = 0.1
+
+
+class TranscriberUnavailable(Exception):
+    """Modelo do Whisper indisponível (não instalado, ou processo de transcrição fora do ar)."""
+
+
+def socket_path():
+    return os.environ.get('TRANSCRIBER_SOCKET', '')
+
+
+# ---- Modelo no próprio processo ----
+
+_engine = None
+_engine_loaded = False
+_engine_lock = threading.Lock()
+# Uma transcrição por vez com o mesmo modelo
+_transcribe_lock = threading.Lock()
+
+
+def get_stt_engine():
+    """Engine de transcrição (STT_ENGINE) carregada uma vez por processo, ou None se não puder ser carregada."""
+    global _engine, _engine_loaded
+    with _engine_lock:
+        if not _engine_loaded:
+            try:
+                _engine = get_engine()
+                logger.info(f"Engine de transcrição '{_engine.name}' carregada com sucesso (modelo: {model_name()})")
+            except Exception as e:
+                _engine = None
+                logger.error(f"Erro ao carregar engine de transcrição: {e}")
+            _engine_loaded = True
+        return _engine
+
+
+# ---- Áudios longos: trechos cortados nos silêncios, transcritos em paralelo ----
+
+def long_audio_seconds():
+    return float(os.environ.get('TRANSCRIBE_LONG_AUDIO', DEFAULT_LONG_AUDIO))
+
+
+def chunk_seconds():
+    return float(os.environ.get('TRANSCRIBE_CHUNK_SECONDS', DEFAULT_CHUNK_SECONDS))
+
+
+def split_on_silence(audio, target_seconds, sample_rate=SAMPLE_RATE):
+    """
+    Divide o áudio em trechos de cerca de `target_seconds`, cortando no ponto
+    mais silencioso (menor energia média em ~0,5s) perto de cada alvo, para não
+    cortar palavras ao meio.
+
+    Args:
+        audio: Amostras (numpy, mono)
+        target_seconds (float): Duração aproximada de cada trecho
+
+    Returns:
+        list: (início, fim) de cada trecho, em amostras
+    """
+    import numpy as np
+
+    frame = int(sample_rate * SILENCE_FRAME)
+    frames = len(audio) // frame
+    if frames == 0:
+        return [(0, len(audio))]
+    energy = np.sqrt(np.mean(audio[:frames * frame].reshape(frames, frame).astype(np.float32) ** 2, axis=1))
+    smooth = max(1, int(0.5 / SILENCE_FRAME))
+    energy = np.convolve(energy, np.ones(smooth) / smooth, mode='same')
+
+    target = int(target_seconds / SILENCE_FRAME)
+    search = max(1, int(target * SILENCE_SEARCH))
+    bounds = []
+    start = 0
+    # O último trecho pode ficar até 50% maior que o alvo, em vez de sobrar um trecho curto
+    while frames - start > target * 1.5:
+        low, high = start + target - search, min(frames - 1, start + target + search)
+        cut = low + int(np.argmin(energy[low:high + 1]))
+        bounds.append((start * frame, cut * frame))
+        start = cut
+    bounds.append((start * frame, len(audio)))
+    return bounds
+
+
+_transcribe_pool = None
+_transcribe_pool_lock = threading.Lock()
+
+
+def get_transcribe_pool():
+    """
+    Pool de processos que transcrevem trechos de áudios longos em paralelo
+    (cada processo carrega o seu modelo na primeira utilização), ou None com
+    TRANSCRIBE_PROCESSES menor que 2 (trechos transcritos em sequência pelo
+    modelo deste processo).
+    """
+    global _transcribe_pool
+    processes = int(os.environ.get('TRANSCRIBE_PROCESSES', DEFAULT_TRANSCRIBE_PROCESSES))
+    if processes < 2:
+        return None
+    with _transcribe_pool_lock:
+        if _transcribe_pool is None:
+            # Divide os núcleos entre os processos, em vez de cada engine usar todos
+            threads = max(1, (os.cpu_count() or 1) // processes)
+            _transcribe_pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_transcribe_worker,
+                initargs=(threads,),
+            )
+            logger.info(f"Pool de transcrição iniciado com {processes} processos ({threads} threads cada)")
+        return _transcribe_pool
+
+
+def _init_transcribe_worker(threads):
+    # Lido pela engine ao carregar o modelo no processo filho
+    os.environ['STT_THREADS'] = str(threads)
+
+
+def _transcribe_samples(audio, language):
+    engine = get_stt_engine()
+    if engine is None:
+        raise TranscriberUnavailable("o modelo de transcrição não foi carregado corretamente")
+    with _transcribe_lock:
+        return engine.transcribe(audio, language)
+
+
+def _transcribe_chunk(audio, language):
+    return _transcribe_samples(audio, language)['segments']
+
+
+def _timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _transcribe_local(path, language, progress=None, media_sha256=None):
+    """
+    Transcreve `path` com o modelo deste processo. Áudios acima de
+    TRANSCRIBE_LONG_AUDIO segundos são decodificados uma vez, divididos nos
+    silêncios e transcritos por trechos (em paralelo, com o pool de
+    transcrição); o texto volta na ordem, uma linha por segmento, com o
+    horário do início de cada uma.
+
+    Com o cache de transcrições (TRANSCRIPT_CACHE_DIR), a mesma gravação não é
+    transcrita de novo com a mesma engine, modelo e idioma, e o áudio
+    decodificado é reaproveitado pelas demais combinações.
+
+    Args:
+        progress (callable): Chamado com (trechos concluídos, total de trechos)
+        media_sha256 (str): Hash da gravação, se já conhecido (calculado no upload)
+    """
+    engine = get_stt_engine()
+    if engine is None:
+        raise TranscriberUnavailable("o modelo de transcrição não foi carregado corretamente")
+
+    cache = get_transcript_cache()
+    pcm = None
+    if cache is not None:
+        media_sha256 = media_sha256 or file_sha256(path)
+        key = make_transcript_key(media_sha256, engine.name, model_name(), language, {
+            'long_audio': long_audio_seconds(),
+            'chunk_seconds': chunk_seconds(),
+        })
+        text = cache.get_transcript(key)
+        if text is not None:
+            logger.info(f"Transcrição em cache para {path} (sha256: {media_sha256})")
+            return text
+        pcm = cache.get_audio(media_sha256)
+
+    if pcm is None:
+        pcm = decode_audio(path)
+        if cache is not None:
+            try:
+                cache.put_audio(media_sha256, pcm)
+            except Exception as e:
+                # O cache é só uma otimização (disco cheio, volume somente leitura)
+                logger.warning(f"Falha ao gravar o áudio no cache de transcrições: {e}")
+    text = _transcribe_audio(pcm_to_samples(pcm), language, progress)
+    if cache is not None:
+        try:
+            cache.put_transcript(key, text)
+        except Exception as e:
+            # A transcrição já foi feita: uma falha no cache não a descarta
+            logger.warning(f"Falha ao gravar a transcrição no cache: {e}")
+    return text
+
+
+def _transcribe_audio(audio, language, progress=None):
+    duration = len(audio) / SAMPLE_RATE
+    if duration <= long_audio_seconds():
+        return _transcribe_samples(audio, language)["text"]
+
+    bounds = split_on_silence(audio, chunk_seconds())
+    total = len(bounds)
+    logger.info(f"Áudio longo ({duration / 60:.0f} min): {total} trechos de ~{chunk_seconds():.0f}s")
+    if progress:
+        progress(0, total)
+
+    results = [None] * total
+    pool = get_transcribe_pool()
+    if pool is None:
+        for index, (begin, end) in enumerate(bounds):
+            results[index] = _transcribe_chunk(audio[begin:end], language)
+            if progress:
+                progress(index + 1, total)
+    else:
+        futures = {pool.submit(_transcribe_chunk, audio[begin:end], language): index
+                   for index, (begin, end) in enumerate(bounds)}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress:
+                    progress(done, total)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    lines = []
+    for (begin, _), segments in zip(bounds, results):
+        offset = begin / SAMPLE_RATE
+        lines.extend(f"[{_timestamp(offset + start)}] {text}" for start, _, text in segments if text)
+    return "\n".join(lines)
+
+
+# ---- Cliente do processo de transcrição ----
+
+def _request(payload, timeout, progress=None):
+    address = socket_path()
+    try:
+        conn = Client(address, family='AF_UNIX')
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise TranscriberUnavailable(f"processo de transcrição indisponível em {address}: {e}")
+    with conn:
+        conn.send_bytes(json.dumps(payload).encode('utf-8'))
+        while True:
+            if not conn.poll(timeout):
+                raise TimeoutError(f"processo de transcrição não respondeu em {timeout}s")
+            try:
+                response = json.loads(conn.recv_bytes())
+            except EOFError:
+                raise TranscriberUnavailable("processo de transcrição encerrou a conexão")
+            # Progresso dos trechos de áudios longos, antes da resposta final
+            if 'progress' not in response:
+                break
+            if progress:
+                progress(*response['progress'])
+    if 'error' in response:
+        if response.get('unavailable'):
+            raise TranscriberUnavailable(response['error'])
+        raise RuntimeError(response['error'])
+    return response
+
+
+def ping():
+    """
+    Returns:
+        dict: `model` e `ready` (modelo já carregado) do processo de transcrição
+    """
+    return _request({'op': 'ping'}, timeout=10)
+
+
+def transcribe(path, language='pt', progress=None, media_sha256=None):
+    """
+    Transcreve um arquivo de áudio/vídeo.
+
+    Args:
+        path: Caminho do arquivo (acessível pelo processo de transcrição)
+        language (str): Idioma do áudio
+        progress (callable): Chamado com (trechos concluídos, total de trechos)
+            em áudios longos
+        media_sha256 (str): SHA-256 do arquivo, se já conhecido (chave do
+            cache de transcrições; senão é calculado quando o cache está ativo)
+
+    Returns:
+        str: Texto transcrito (em áudios longos, uma linha por segmento
+        começando com o horário, ex.: "[01:02:03] ...")
+
+    Raises:
+        TranscriberUnavailable: Modelo indisponível
+    """
+    if not socket_path():
+        return _transcribe_local(path, language, progress, media_sha256)
+    timeout = float(os.environ.get('TRANSCRIBER_TIMEOUT', DEFAULT_TIMEOUT))
+    payload = {'op': 'transcribe', 'path': str(os.path.abspath(path)), 'language': language, 'sha256': media_sha256}
+    return _request(payload, timeout, progress)['text']
+
+
+def warm():
+    """
+    Etapa de aquecimento: carrega o modelo no próprio processo ou, com
+    `TRANSCRIBER_SOCKET`, aguarda o processo de transcrição terminar de carregá-lo.
+    """
+    if not socket_path():
+        if get_stt_engine() is None:
+            raise TranscriberUnavailable("modelo de transcrição indisponível")
+        return
+
+    deadline = time.monotonic() + float(os.environ.get('TRANSCRIBER_START_TIMEOUT', DEFAULT_START_TIMEOUT))
+    while True:
+        try:
+            status = ping()
+        except TranscriberUnavailable:
+            # Processo ainda subindo
+            if time.monotonic() >= deadline:
+                raise
+            status = {}
+        if status.get('ready'):
+            return
+        if status.get('load_error'):
+            raise TranscriberUnavailable(status['load_error'])
+        if time.monotonic() >= deadline:
+            raise TranscriberUnavailable("processo de transcrição não carregou o modelo a tempo")
+        time.sleep(1)
+
+
+# ---- Processo de transcrição ----
+
+class _ClientGone(Exception):
+    """O worker fechou a conexão antes do fim da transcrição."""
+
+
+def _handle(conn, state):
+    with conn:
+        try:
+            request = json.loads(conn.recv_bytes())
+        except (EOFError, ValueError):
+            return
+        op = request.get('op')
+        if op == 'ping':
+            response = {'engine': engine_name(), 'model': model_name(), 'ready': state['ready'], 'load_error': state['error']}
+        elif op == 'transcribe':
+            started = time.perf_counter()
+
+            def progress(done, total):
+                try:
+                    conn.send_bytes(json.dumps({'progress': [done, total]}).encode('utf-8'))
+                except OSError as e:
+                    raise _ClientGone(e)
+
+            try:
+                text = _transcribe_local(request['path'], request.get('language', 'pt'), progress, request.get('sha256'))
+                response = {'text': text}
+                logger.info(f"Transcrição concluída em {time.perf_counter() - started:.1f}s: {request['path']} ({len(text)} caracteres)")
+            except TranscriberUnavailable as e:
+                response = {'error': str(e), 'unavailable': True}
+            except _ClientGone as e:
+                # Cliente desistiu no meio (timeout ou worker reiniciado)
+                logger.warning(f"Transcrição de {request.get('path')} interrompida: {e}")
+                return
+            except Exception as e:
+                logger.error(f"Erro na transcrição de {request.get('path')}: {e}")
+                response = {'error': str(e)}
+        else:
+            response = {'error': f"operação desconhecida: {op}"}
+        try:
+            conn.send_bytes(json.dumps(response).encode('utf-8'))
+        except OSError:
+            # Cliente desistiu (timeout ou worker reiniciado)
+            pass
+
+
+def _remove_stale_socket(address):
+    if not os.path.exists(address):
+        return
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(address)
+    except OSError:
+        os.unlink(address)
+    else:
+        raise RuntimeError(f"já existe um processo de transcrição em {address}")
+    finally:
+        probe.close()
+
+
+def serve(address=None):
+    """Atende pedidos de transcrição no socket `address` (bloqueia)."""
+    address = address or socket_path()
+    if not address:
+        raise SystemExit("Defina TRANSCRIBER_SOCKET com o caminho do socket")
+
+    # Um processo por máquina: o lock é liberado pelo sistema se o processo morrer
+    lock_file = open(f"{address}.lock", 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise SystemExit(f"Já existe um processo de transcrição em {address}")
+    _remove_stale_socket(address)
+
+    listener = Listener(address, family='AF_UNIX')
+    os.chmod(address, 0o600)
+    logger.info(f"Processo de transcrição ouvindo em {address} (engine: {engine_name()}, modelo: {model_name()})")
+
+    # O modelo carrega em segundo plano; enquanto isso, ping responde ready=False
+    state = {'ready': False, 'error': None}
+
+    def load():
+        if get_stt_engine() is None:
+            state['error'] = "o modelo de transcrição não foi carregado corretamente"
+        else:
+            state['ready'] = True
+
+    threading.Thread(target=load, name='stt-load', daemon=True).start()
+    # SIGTERM (docker stop) encerra pelo finally, removendo o socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_handle, args=(conn, state), daemon=True).start()
+    finally:
+        listener.close()
+        lock_file.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper()),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    serve()
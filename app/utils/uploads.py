@@ -0,0 +1,299 @@
+"""
+Recebimento dos uploads em uma única passada.
+
+O parser multipart do werkzeug grava cada arquivo enviado diretamente em um
+`UploadSpool` (ver `UploadRequest`): enquanto os blocos chegam, o spool
+calcula o SHA-256, conta o tamanho, aplica o limite do tipo de arquivo e
+guarda o início do conteúdo para o log. Arquivos pequenos ficam em memória;
+os maiores vão para um arquivo em UPLOAD_FOLDER, que pode ser movido para o
+destino final (`move_to`) sem ser copiado nem lido de novo.
+
+No modo ASGI o corpo é recebido antes de chegar ao Flask (ver asgi.py): o
+middleware usa `MultipartSpooler`, o mesmo parser alimentado bloco a bloco,
+e entrega ao `UploadRequest` o formulário já pronto, com os arquivos nos
+mesmos `UploadSpool` (o upload é gravado em disco uma única vez).
+
+Limites por tipo (bytes, via ambiente; o MAX_CONTENT_LENGTH do Flask continua
+valendo para a requisição inteira):
+    UPLOAD_MAX_TEXT_BYTES: markdown e texto (padrão: 50MB)
+    UPLOAD_MAX_IMAGE_BYTES: imagens, como a logo (padrão: 10MB)
+    UPLOAD_MAX_MEDIA_BYTES: áudio e vídeo (padrão: sem limite próprio)
+    UPLOAD_MAX_ARCHIVE_BYTES: arquivos .zip (padrão: 200MB)
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from flask import Request, current_app
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+# Acima disso o spool passa da memória para o disco
+SPOOL_MAX_MEMORY = 512 * 1024
+PREVIEW_BYTES = 200
+PARSE_BUFFER_SIZE = 64 * 1024
+# Chave do scope ASGI com o formulário já recebido pelo middleware (ver asgi.py)
+PARSED_FORM_KEY = 'mdconverter.form'
+
+TEXT_EXTENSIONS = {'.md', '.markdown', '.txt'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg'}
+MEDIA_EXTENSIONS = {'.mp3', '.wav', '.mp4', '.avi', '.mov', '.m4a'}
+ARCHIVE_EXTENSIONS = {'.zip'}
+
+DEFAULT_LIMITS = {
+    'text': 50 * 1024 * 1024,
+    'image': 10 * 1024 * 1024,
+    'media': None,
+    'archive': 200 * 1024 * 1024,
+}
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    """Arquivo acima do limite do seu tipo (resposta 413)."""
+
+    def __init__(self, filename, limit):
+        super().__init__(f"Arquivo {filename!r} maior que o limite de {limit} bytes")
+        self.filename = filename
+        self.limit = limit
+
+
+def upload_kind(filename, content_type=None):
+    """Tipo do arquivo para os limites: 'text', 'image', 'media', 'archive' ou None (desconhecido)."""
+    suffix = Path(filename or '').suffix.lower()
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    if suffix in TEXT_EXTENSIONS or mimetype.startswith('text/'):
+        return 'text'
+    if suffix in IMAGE_EXTENSIONS or mimetype.startswith('image/'):
+        return 'image'
+    if suffix in MEDIA_EXTENSIONS or mimetype.startswith(('audio/', 'video/')):
+        return 'media'
+    if suffix in ARCHIVE_EXTENSIONS or mimetype in ('application/zip', 'application/x-zip-compressed'):
+        return 'archive'
+    return None
+
+
+def upload_limit(kind):
+    """Limite em bytes para o tipo `kind` (None: só o MAX_CONTENT_LENGTH da requisição)."""
+    if kind is None:
+        return None
+    value = os.environ.get(f'UPLOAD_MAX_{kind.upper()}_BYTES')
+    return int(value) if value else DEFAULT_LIMITS[kind]
+
+
+class UploadSpool:
+    """
+    Destino de um arquivo enviado: grava os blocos recebidos calculando o hash,
+    o tamanho e a prévia, e recusa o arquivo assim que passar do limite.
+    """
+
+    def __init__(self, filename=None, content_type=None, directory=None):
+        self.filename = filename
+        self.limit = upload_limit(upload_kind(filename, content_type))
+        self.directory = directory
+        self.size = 0
+        self.head = b''
+        self._sha256 = hashlib.sha256()
+        self._file = io.BytesIO()
+        self._path = None
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    @property
+    def preview(self):
+        """Início do conteúdo como texto (para logs)."""
+        return self.head.decode('utf-8', errors='replace')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            # Remove o que já foi gravado em disco: quem recebe o 413 não fecha o spool
+            self.close()
+            raise UploadTooLarge(self.filename, self.limit)
+        if len(self.head) < PREVIEW_BYTES:
+            self.head += data[:PREVIEW_BYTES - len(self.head)]
+        self._sha256.update(data)
+        if self._path is None and self.size > SPOOL_MAX_MEMORY:
+            self._rollover()
+        return self._file.write(data)
+
+    def _rollover(self):
+        spooled = self._file.getvalue()
+        fd, name = tempfile.mkstemp(dir=self.directory, prefix='upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._path = name
+        self._file.write(spooled)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def seekable(self):
+        return True
+
+    def move_to(self, destination):
+        """
+        Grava o conteúdo em `destination`: renomeia o arquivo temporário se o
+        upload já estiver em disco, ou grava os bytes da memória.
+        """
+        if self._path is None:
+            Path(destination).write_bytes(self._file.getvalue())
+            return
+        self._file.close()
+        try:
+            os.replace(self._path, destination)
+        except OSError:
+            # Outro sistema de arquivos: cópia em blocos
+            shutil.move(self._path, destination)
+        self._path = None
+        self._file = io.BytesIO()
+
+    def close(self):
+        self._file.close()
+        if self._path is not None:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            self._path = None
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+def spool_of(file_storage):
+    """
+    `UploadSpool` de um arquivo do formulário. Se o arquivo não veio por
+    `UploadRequest`, o conteúdo é copiado para um spool em blocos.
+    """
+    if isinstance(file_storage.stream, UploadSpool):
+        return file_storage.stream
+    spool = UploadSpool(file_storage.filename, file_storage.content_type, current_app.config.get('UPLOAD_FOLDER'))
+    for chunk in iter(lambda: file_storage.stream.read(64 * 1024), b''):
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+class MultipartSpooler:
+    """
+    Parser incremental de multipart/form-data para receber o corpo fora do
+    Flask: os blocos são entregues com `feed` (None no fim) e cada arquivo vai
+    para um `UploadSpool`, com os mesmos limites do `UploadRequest`. Como no
+    werkzeug, um corpo malformado resulta em formulário vazio.
+    """
+
+    def __init__(self, boundary, directory=None, max_form_memory_size=None, max_form_parts=None):
+        self.directory = directory
+        self.max_form_memory_size = max_form_memory_size
+        self._decoder = MultipartDecoder(boundary, max_form_memory_size=max_form_memory_size, max_parts=max_form_parts)
+        self._fields = []
+        self._files = []
+        self._part = None
+        self._container = None
+        self._field_size = None
+        self._failed = False
+
+    def feed(self, data):
+        """
+        Raises:
+            RequestEntityTooLarge: Campo ou arquivo acima do limite (`UploadTooLarge` por tipo)
+        """
+        if self._failed:
+            return
+        # Em blocos do tamanho dos que o werkzeug lê (o buffer do decoder é
+        # limitado por max_form_memory_size)
+        pieces = [None] if data is None else [data[i:i + PARSE_BUFFER_SIZE] for i in range(0, len(data), PARSE_BUFFER_SIZE)]
+        try:
+            for piece in pieces:
+                self._decoder.receive_data(piece)
+                event = self._decoder.next_event()
+                while not isinstance(event, (Epilogue, NeedData)):
+                    self._handle(event)
+                    event = self._decoder.next_event()
+        except ValueError:
+            self._failed = True
+            self.close()
+            self._fields, self._files = [], []
+
+    def _handle(self, event):
+        if isinstance(event, Field):
+            self._part, self._container, self._field_size = event, [], 0
+        elif isinstance(event, File):
+            content_type = event.headers.get('content-type')
+            self._part, self._field_size = event, None
+            self._container = UploadSpool(event.filename, content_type, self.directory)
+            self._files.append((event.name, FileStorage(self._container, event.filename, event.name, headers=event.headers)))
+        elif isinstance(event, Data):
+            if self._field_size is not None:
+                self._field_size += len(event.data)
+                if self.max_form_memory_size is not None and self._field_size > self.max_form_memory_size:
+                    raise RequestEntityTooLarge()
+                self._container.append(event.data)
+                if not event.more_data:
+                    charset = parse_options_header(self._part.headers.get('content-type'))[1].get('charset', '').lower()
+                    # Mesmas codificações aceitas pelo werkzeug
+                    if charset not in ('ascii', 'us-ascii', 'utf-8', 'iso-8859-1'):
+                        charset = 'utf-8'
+                    self._fields.append((self._part.name, b''.join(self._container).decode(charset, 'replace')))
+            else:
+                self._container.write(event.data)
+                if not event.more_data:
+                    self._container.seek(0)
+
+    def form_data(self, storage_class):
+        """(form, files) no formato de `Request.form` e `Request.files`."""
+        return storage_class(self._fields), storage_class(self._files)
+
+    def close(self):
+        for _, storage in self._files:
+            storage.stream.close()
+
+
+class UploadRequest(Request):
+    """
+    Request do Flask cujos arquivos enviados são gravados em `UploadSpool`
+    (ou já chegam prontos do middleware ASGI, em `PARSED_FORM_KEY`).
+    """
+
+    def _load_form_data(self):
+        parsed = self.environ.get('asgi.scope', {}).get(PARSED_FORM_KEY)
+        if parsed is not None and 'form' not in self.__dict__:
+            if isinstance(parsed, Exception):
+                # Limite estourado durante o recebimento: mesma resposta (413) do parser do werkzeug
+                raise parsed
+            self.__dict__['stream'] = io.BytesIO()
+            self.__dict__['form'], self.__dict__['files'] = parsed
+        try:
+            super()._load_form_data()
+        except Exception:
+            # Parser interrompido (ex.: 413): os arquivos já recebidos não chegam a
+            # `request.files`, então ninguém mais os fecharia
+            for spool in self.__dict__.pop('_upload_spools', []):
+                spool.close()
+            raise
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        directory = current_app.config.get('UPLOAD_FOLDER')
+        spool = UploadSpool(filename, content_type, directory)
+        self.__dict__.setdefault('_upload_spools', []).append(spool)
+        # Tamanho declarado na parte (raro nos navegadores): recusa antes de receber
+        if content_length and spool.limit is not None and content_length > spool.limit:
+            raise UploadTooLarge(filename, spool.limit)
+        return spool
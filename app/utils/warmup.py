@@ -0,0 +1,127 @@
+"""
+Inicialização em segundo plano dos componentes pesados.
+
+O app sobe sem importar o WeasyPrint nem carregar o modelo do Whisper, então
+/relatorio/healthz responde logo após o boot. Uma thread de aquecimento
+executa, em ordem, as etapas registradas com `register` (o renderer de PDFs,
+o modelo de transcrição, ...); o estado de cada uma aparece em
+/relatorio/readyz, que só responde 200 quando as etapas obrigatórias terminaram.
+Uma etapa ainda não concluída continua funcionando sob demanda: quem precisar
+do componente antes o carrega na primeira utilização.
+
+Configuração via ambiente:
+    WARMUP: "0" desativa o aquecimento (tudo é carregado na primeira utilização)
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+ERROR = 'error'
+
+_tasks = []
+_status = {}
+_lock = threading.Lock()
+_thread = None
+
+
+def register(name, fn, required=False):
+    """
+    Registra uma etapa de aquecimento.
+
+    Args:
+        name (str): Nome exibido em /readyz
+        fn (callable): Função sem argumentos que carrega o componente
+        required (bool): Se o app só está pronto depois desta etapa
+    """
+    with _lock:
+        if any(task[0] == name for task in _tasks):
+            return
+        # Etapas obrigatórias rodam antes das opcionais
+        position = sum(1 for task in _tasks if task[2]) if required else len(_tasks)
+        _tasks.insert(position, (name, fn, required))
+        _status[name] = {'status': PENDING, 'required': required}
+
+
+def enabled():
+    return os.environ.get('WARMUP', '1') != '0'
+
+
+def start():
+    """Inicia a thread de aquecimento (uma vez por processo)."""
+    global _thread
+    if not enabled():
+        return
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_run, name='warmup', daemon=True)
+        _thread.start()
+
+
+def _run():
+    index = 0
+    while True:
+        with _lock:
+            if index >= len(_tasks):
+                return
+            name, fn, _ = _tasks[index]
+            _status[name]['status'] = LOADING
+        index += 1
+
+        start_time = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            logger.error(f"Aquecimento de {name} falhou: {e}")
+            with _lock:
+                _status[name].update(status=ERROR, error=str(e))
+            continue
+        seconds = time.perf_counter() - start_time
+        logger.info(f"Aquecimento de {name} concluído em {seconds:.2f}s")
+        with _lock:
+            _status[name].update(status=READY, seconds=round(seconds, 2))
+
+
+def readiness():
+    """
+    Returns:
+        tuple: (True se as etapas obrigatórias terminaram, estado de cada etapa)
+    """
+    with _lock:
+        components = {name: dict(state) for name, state in _status.items()}
+    if not enabled():
+        return True, components
+    ready = all(state['status'] == READY for state in components.values() if state['required'])
+    return ready, components
+
+
+def _before_fork():
+    # Fork com a thread no meio de um import deixaria locks de módulos presos no filho:
+    # com gunicorn --preload, o aquecimento termina no processo pai antes dos workers
+    thread = _thread
+    if thread is not None and thread.is_alive():
+        thread.join()
+
+
+def _after_fork():
+    # A thread não sobrevive ao fork (ex.: gunicorn --preload): recomeça no processo filho
+    # (etapas já concluídas no processo pai terminam de imediato)
+    global _thread, _lock
+    _lock = threading.Lock()
+    started = _thread is not None
+    _thread = None
+    for state in _status.values():
+        if state['status'] == LOADING:
+            state['status'] = PENDING
+    if started:
+        start()
+
+
+os.register_at_fork(before=_before_fork, after_in_child=_after_fork)
@@ -0,0 +1,206 @@
+"""
+MDconverter - modo de servidor assíncrono (ASGI)
+
+Alternativa ao gunicorn com threads (server.py) para muitas conexões longas:
+
+- os streams de progresso (SSE) rodam no event loop, sem ocupar uma thread
+  por conexão;
+- o corpo das requisições (uploads) é recebido no event loop, e os arquivos
+  são gravados direto nos spools que o Flask usa (ver uploads.py; a escrita
+  em disco vai para uma thread), então clientes lentos também não prendem
+  threads. Com a fila de conversão cheia, o upload é recusado (503) antes de
+  ser recebido;
+- as demais rotas são os mesmos blueprints do Flask, executados em um pool de
+  threads (a2wsgi), e a renderização dos PDFs vai para um pool de processos
+  (`RENDER_PROCESSES`, por padrão igual a `RENDER_WORKERS`).
+
+Uso:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import os
+
+# Renderização fora do processo do event loop (ver md_to_pdf.get_render_pool)
+os.environ.setdefault('RENDER_PROCESSES', os.environ.get('RENDER_WORKERS', '2'))
+
+import json
+import tempfile
+
+from anyio import to_thread
+from a2wsgi import WSGIMiddleware
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Mount, Route
+
+from server import app as flask_app
+from app.routes.jobs import queue_full_body
+from app.routes.progress import SSE_HEADERS, progress_events
+from app.utils.jobs import QueueFullError, get_job_queue
+from app.utils.uploads import PARSED_FORM_KEY, MultipartSpooler, UploadRequest
+
+# Threads para as rotas do Flask e tamanho a partir do qual o upload vai para o disco
+WSGI_THREADS = int(os.environ.get('THREADS', 8))
+SPOOL_MAX_MEMORY = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class BufferedUploads:
+    """
+    Middleware ASGI que recebe todo o corpo da requisição antes de repassá-la
+    ao app WSGI (que leria o corpo bloqueando uma thread). Formulários
+    multipart são decodificados aqui mesmo, direto nos `UploadSpool` do
+    `UploadRequest`; outros corpos passam por um arquivo temporário. Corpos
+    acima de `max_bytes` recebem 413 sem chegar ao Flask, e com a fila de
+    conversão cheia (todas as rotas com upload enfileiram um job) a resposta é 503
+    antes de receber o corpo, como faria o `check_capacity` das rotas.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] in ('GET', 'HEAD', 'OPTIONS'):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope['headers'])
+        declared = headers.get(b'content-length')
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            await self._too_large(send)
+            return
+        try:
+            get_job_queue().check_capacity()
+        except QueueFullError as e:
+            await self._queue_full(scope, send, e)
+            return
+
+        mimetype, options = parse_options_header(headers.get(b'content-type', b'').decode('latin1'))
+        if mimetype == 'multipart/form-data' and options.get('boundary') and issubclass(flask_app.request_class, UploadRequest):
+            await self._forward_form(scope, receive, send, options['boundary'])
+        else:
+            await self._forward_spooled(scope, receive, send)
+
+    async def _receive_body(self, receive, send, write):
+        """
+        Recebe o corpo passando cada bloco para `write` (em uma thread, pois
+        pode gravar em disco).
+
+        Returns:
+            int: Tamanho do corpo, ou None se o cliente desconectou ou o corpo
+            passou de `max_bytes` (já respondido com 413)
+        """
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_bytes:
+                await self._too_large(send)
+                return None
+            await to_thread.run_sync(write, chunk)
+            more_body = message.get('more_body', False)
+        return size
+
+    async def _forward_form(self, scope, receive, send, boundary):
+        # Formulário multipart: os arquivos vão direto para os UploadSpool que o
+        # Flask vai usar (uma única gravação em disco, limites por tipo aplicados
+        # durante o recebimento) e o corpo não é repassado
+        request_class = flask_app.request_class
+        spooler = MultipartSpooler(
+            boundary.encode('latin1'), flask_app.config['UPLOAD_FOLDER'],
+            request_class.max_form_memory_size, request_class.max_form_parts,
+        )
+        try:
+            try:
+                if await self._receive_body(receive, send, spooler.feed) is None:
+                    return
+                await to_thread.run_sync(spooler.feed, None)
+                parsed = spooler.form_data(request_class.parameter_storage_class)
+            except RequestEntityTooLarge as e:
+                # Respondido pelo Flask, com o limite do tipo do arquivo
+                parsed = e
+
+            delivered = False
+
+            async def replay():
+                # Corpo vazio; depois, só o aviso de desconexão (ignora o que sobrou de um corpo recusado)
+                nonlocal delivered
+                if not delivered:
+                    delivered = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                while True:
+                    message = await receive()
+                    if message['type'] == 'http.disconnect':
+                        return message
+
+            await self.app({**scope, PARSED_FORM_KEY: parsed}, replay, send)
+        finally:
+            # Arquivos não usados pela rota (os movidos com move_to já saíram do spool)
+            spooler.close()
+
+    async def _forward_spooled(self, scope, receive, send):
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, dir=flask_app.config['UPLOAD_FOLDER'])
+        try:
+            # Acima de SPOOL_MAX_MEMORY a escrita vai para o disco: fora do event loop
+            size = await self._receive_body(receive, send, spool.write)
+            if size is None:
+                return
+            await to_thread.run_sync(spool.seek, 0)
+
+            delivered = False
+
+            async def replay():
+                # Entrega o corpo já recebido em partes; depois, só o aviso de desconexão
+                nonlocal delivered
+                if delivered:
+                    return await receive()
+                chunk = await to_thread.run_sync(spool.read, CHUNK_SIZE)
+                delivered = spool.tell() >= size
+                return {'type': 'http.request', 'body': chunk, 'more_body': not delivered}
+
+            await self.app(scope, replay, send)
+        finally:
+            spool.close()
+
+    async def _too_large(self, send):
+        max_mb = int(self.max_bytes / (1024 * 1024))
+        await self._json(send, 413, {
+            "error": f"Arquivo muito grande. Tamanho máximo permitido: {max_mb}MB",
+            "max_size_mb": max_mb
+        })
+
+    async def _queue_full(self, scope, send, e):
+        await self._json(send, 503, queue_full_body(e, scope['path']), [(b'retry-after', str(e.retry_after).encode())])
+
+    async def _json(self, send, status, data, headers=()):
+        body = json.dumps(data).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+async def progress_stream(request):
+    """Versão assíncrona de /relatorio/progress/<session_id> (mesmo formato do blueprint)"""
+    return StreamingResponse(
+        progress_events(request.path_params['session_id']),
+        media_type='text/event-stream',
+        headers=SSE_HEADERS,
+    )
+
+
+app = Starlette(routes=[
+    Route('/relatorio/progress/{session_id}', progress_stream),
+    Mount('/', app=BufferedUploads(
+        WSGIMiddleware(flask_app, workers=WSGI_THREADS),
+        flask_app.config['MAX_CONTENT_LENGTH'],
+    )),
+])